@@ -28,6 +28,8 @@ import logging
 import os
 from logging.config import fileConfig
 from sbpipe.utils.parcomp import run_cmd
+from sbpipe.utils.parcomp import local_pool
+from sbpipe.utils.tracing import start_tracing, stop_tracing, span
 
 try:  # Python 2.7+
     from logging import NullHandler, StreamHandler
@@ -175,7 +177,8 @@ def sbpipe(create_project='',
            nocolor=False,
            log_level='',
            quiet=False,
-           verbose=False):
+           verbose=False,
+           trace=''):
     """
     SBpipe function.
 
@@ -191,6 +194,7 @@ def sbpipe(create_project='',
     :param log_level: Set the logging level
     :param quiet: True if quiet (CRITICAL+)
     :param verbose: True if verbose (DEBUG+)
+    :param trace: the file to store a trace of the pipeline stages (Chrome trace event format), or empty
     :return: 0 if OK, 1  if trouble (e.g. a pipeline did not execute correctly).
     """
 
@@ -217,6 +221,9 @@ def sbpipe(create_project='',
     logger.debug(run_cmd('R --version')[0].decode('utf-8').splitlines()[0])
     logger.debug('SBpipe ' + sbpipe_version())
 
+    if trace:
+        start_tracing()
+
     if version:
         print(sbpipe_version())
     elif logo:
@@ -230,19 +237,32 @@ def sbpipe(create_project='',
     elif simulate:
         from sbpipe.pl.sim.sim import Sim
         s = Sim()
-        exit_status = 0 if s.run(simulate) else 1
+        with local_pool(), span('simulate'):
+            exit_status = 0 if s.run(simulate) else 1
     elif parameter_scan1:
         from sbpipe.pl.ps1.parscan1 import ParScan1
         s = ParScan1()
-        exit_status = 0 if s.run(parameter_scan1) else 1
+        with local_pool(), span('parameter_scan1'):
+            exit_status = 0 if s.run(parameter_scan1) else 1
     elif parameter_scan2:
         from sbpipe.pl.ps2.parscan2 import ParScan2
         s = ParScan2()
-        exit_status = 0 if s.run(parameter_scan2) else 1
+        with local_pool(), span('parameter_scan2'):
+            exit_status = 0 if s.run(parameter_scan2) else 1
     elif parameter_estimation:
         from sbpipe.pl.pe.parest import ParEst
         s = ParEst()
-        exit_status = 0 if s.run(parameter_estimation) else 1
+        with local_pool(), span('parameter_estimation'):
+            exit_status = 0 if s.run(parameter_estimation) else 1
+
+    if trace:
+        tracer = stop_tracing()
+        tracer.write_chrome_trace(trace)
+        logger.info("\n")
+        logger.info("Trace summary:")
+        logger.info("==============")
+        logger.info(tracer.format_summary())
+        logger.info("Trace written in " + trace)
 
     logging.shutdown()
 
@@ -303,6 +323,10 @@ For complete documentation, see http://sbpipe.readthedocs.io .
     parser.add_argument('--log-level',
                         help='override the log level',
                         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'])
+    parser.add_argument('--trace',
+                        help='write a trace of the pipeline stages (Chrome trace event format)',
+                        metavar='FILE',
+                        nargs=1)
     parser.add_argument('-v', '--verbose',
                         help='print debugging output',
                         action='store_true')
@@ -333,9 +357,14 @@ For complete documentation, see http://sbpipe.readthedocs.io .
     if args.parameter_estimation:
         parameter_estimation = args.parameter_estimation[0]
 
+    trace = ''
+    if args.trace:
+        trace = args.trace[0]
+
     return sbpipe(create_project=create_project, simulate=simulate,
                   parameter_scan1=parameter_scan1, parameter_scan2=parameter_scan2,
                   parameter_estimation=parameter_estimation, version=False,
                   logo=args.logo, license=args.license, nocolor=args.nocolor,
-                  log_level=args.log_level, quiet=args.quiet, verbose=args.verbose)
+                  log_level=args.log_level, quiet=args.quiet, verbose=args.verbose,
+                  trace=trace)
 
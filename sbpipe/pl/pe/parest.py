@@ -30,11 +30,13 @@ import os
 import yaml
 import traceback
 from sbpipe.report.latex_reports import latex_report_pe, pdf_report
+from sbpipe.utils.columnar import is_result_format
 from sbpipe.utils.dependencies import is_r_package_installed
 from sbpipe.utils.io import refresh
-from sbpipe.utils.parcomp import parcomp
+from sbpipe.utils.parcomp import AUTO_CPUS, parcomp
+from sbpipe.utils.tracing import traced
 from sbpipe.utils.rand import get_rand_alphanum_str
-from ..pipeline import Pipeline
+from ..pipeline import JOB_OPTIONS, Pipeline
 
 logger = logging.getLogger('sbpipe')
 
@@ -80,11 +82,14 @@ class ParEst(Pipeline):
          cluster, local_cpus, round, runs,
          best_fits_percent, data_point_num,
          plot_2d_66cl_corr, plot_2d_95cl_corr, plot_2d_99cl_corr,
-         logspace, scientific_notation) = self.parse(config_dict)
+         logspace, scientific_notation,
+         incremental_collection, resume,
+         job_options) = self.parse(config_dict)
 
         runs = int(runs)
         #round = int(round)
-        local_cpus = int(local_cpus)
+        if local_cpus != AUTO_CPUS:
+            local_cpus = int(local_cpus)
         best_fits_percent = float(best_fits_percent)
         data_point_num = int(data_point_num)
 
@@ -117,7 +122,9 @@ class ParEst(Pipeline):
                                           local_cpus,
                                           runs,
                                           outputdir,
-                                          os.path.join(outputdir, self.get_sim_data_folder()))
+                                          os.path.join(outputdir, self.get_sim_data_folder()),
+                                          resume,
+                                          job_options)
             if not status:
                 return False
 
@@ -142,7 +149,10 @@ class ParEst(Pipeline):
                                          plot_2d_95cl_corr,
                                          plot_2d_99cl_corr,
                                          logspace,
-                                         scientific_notation)
+                                         scientific_notation,
+                                         job_options['result_format'],
+                                         local_cpus,
+                                         incremental_collection)
             if not status:
                 return False
 
@@ -168,7 +178,9 @@ class ParEst(Pipeline):
         return True
 
     @classmethod
-    def generate_data(cls, simulator, model, inputdir, cluster, local_cpus, runs, outputdir, sim_data_dir):
+    @traced()
+    def generate_data(cls, simulator, model, inputdir, cluster, local_cpus, runs, outputdir, sim_data_dir,
+                      resume=False, job_options=None):
         """
         The first pipeline step: data generation.
 
@@ -180,9 +192,12 @@ class ParEst(Pipeline):
         :param runs: the number of fits to perform
         :param outputdir: the directory to store the results
         :param sim_data_dir: the directory containing the simulation data sets
+        :param resume: True if only the missing or incomplete parameter estimations should be run
+        :param job_options: the dictionary of the job options (see Pipeline.parse_job_options), or None
+        for the default options
         :return: True if the task was completed successfully, False otherwise.
         """
-        if int(local_cpus) < 1:
+        if local_cpus != AUTO_CPUS and int(local_cpus) < 1:
             logger.error("variable local_cpus must be greater than 0. Please, check your configuration file.")
             return False
 
@@ -195,7 +210,10 @@ class ParEst(Pipeline):
             return False
 
         # folder preparation
-        refresh(sim_data_dir, os.path.splitext(model)[0])
+        if not resume:
+            refresh(sim_data_dir, os.path.splitext(model)[0])
+        elif not os.path.exists(sim_data_dir):
+            os.makedirs(sim_data_dir)
 
         try:
             sim = cls.get_simul_obj(simulator)
@@ -204,6 +222,8 @@ class ParEst(Pipeline):
             logger.debug(traceback.format_exc())
             return False
         try:
+            cls.set_job_options(sim, job_options, os.path.join(inputdir, model), simulator)
+            sim.set_resume(resume)
             return sim.pe(model, inputdir, cluster, local_cpus, runs, outputdir, sim_data_dir)
         except Exception as e:
             logger.error(str(e))
@@ -211,11 +231,13 @@ class ParEst(Pipeline):
             return False
 
     @classmethod
+    @traced()
     def analyse_data(cls, simulator, model, inputdir, outputdir, fileout_final_estims, fileout_all_estims,
                      fileout_param_estim_best_fits_details, fileout_param_estim_details, fileout_param_estim_summary,
                      sim_plots_dir, best_fits_percent, data_point_num, cluster='local',
                      plot_2d_66cl_corr=False, plot_2d_95cl_corr=False, plot_2d_99cl_corr=False,
-                     logspace=True, scientific_notation=True):
+                     logspace=True, scientific_notation=True, result_format='tsv', local_cpus=1,
+                     incremental_collection=False):
         """
         The second pipeline step: data analysis.
 
@@ -237,6 +259,9 @@ class ParEst(Pipeline):
         :param plot_2d_99cl_corr: True if 2 dim plots for the parameter sets within 99% should be plotted        
         :param logspace: True if parameters should be plotted in log space
         :param scientific_notation: True if axis labels should be plotted in scientific notation
+        :param result_format: the format of the result files (tsv, parquet, feather, hdf5)
+        :param local_cpus: the number of cpus used to collect the results
+        :param incremental_collection: True if only the reports which were not collected before should be collected
         :return: True if the task was completed successfully, False otherwise.
         """
         if not os.path.exists(inputdir) or not os.listdir(inputdir):
@@ -252,14 +277,20 @@ class ParEst(Pipeline):
                          "greater than the number of estimated parameters. Please, check your configuration file.")
             return False
 
+        if not is_result_format(result_format):
+            logger.error("variable `result_format` must be one of: tsv, parquet, feather, hdf5. "
+                         "Please, check your configuration file.")
+            return False
+
         refresh(sim_plots_dir, os.path.splitext(model)[0])
 
         logger.info("Collect results:")
         # Collect and summarises the parameter estimation results
         try:
             sim = cls.get_simul_obj(simulator)
-            files_num = sim.get_best_fits(inputdir, outputdir, fileout_final_estims)
-            sim.get_all_fits(inputdir, outputdir, fileout_all_estims)
+            sim.set_result_format(result_format)
+            files_num = sim.get_fits(inputdir, outputdir, fileout_final_estims, fileout_all_estims, local_cpus,
+                                     incremental_collection)
             logger.info('Files retrieved: ' + str(files_num))
             if files_num == 0:
                 return False
@@ -306,6 +337,7 @@ class ParEst(Pipeline):
         return True
 
     @classmethod
+    @traced()
     def generate_report(cls, model, outputdir, sim_plots_folder):
         """
         The third pipeline step: report generation.
@@ -368,6 +400,11 @@ class ParEst(Pipeline):
         # True if axis labels should be plotted in scientific notation
         scientific_notation = True
 
+        # True if only the reports which were not collected before should be collected
+        incremental_collection = False
+        # True if only the missing or incomplete parameter estimations should be run
+        resume = False
+
         # Initialises the variables
         for key, value in my_dict.items():
 
@@ -409,13 +446,24 @@ class ParEst(Pipeline):
                 logspace = value
             elif key == "scientific_notation":
                 scientific_notation = value
+            elif key == "incremental_collection":
+                incremental_collection = value
+            elif key == "resume":
+                resume = value
+            elif key in JOB_OPTIONS:
+                # read by parse_job_options
+                pass
             else:
                 logger.warning('Found unknown option: `' + key + '`')
 
+        job_options = self.parse_job_options(my_dict)
+
         return (generate_data, analyse_data, generate_report, generate_tarball,
                 project_dir, simulator, model, cluster, local_cpus,
                 round, runs, best_fits_percent, data_point_num,
                 plot_2d_66cl_corr, plot_2d_95cl_corr, plot_2d_99cl_corr,
-                logspace, scientific_notation)
+                logspace, scientific_notation,
+                incremental_collection, resume,
+                job_options)
 
 
@@ -28,10 +28,50 @@ from pydoc import locate
 import yaml
 import os
 import tarfile
+from sbpipe.utils.cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, ResultCache
+from sbpipe.utils.job_history import DEFAULT_HISTORY_DIR, JobHistory, get_history_key
+from sbpipe.utils.job_timeout import JobTimeout
+from sbpipe.utils.tracing import traced
 
 logger = logging.getLogger('sbpipe')
 
 
+# The options of the jobs shared by all the pipelines, and their default values (see set_job_options)
+JOB_OPTIONS = {
+    # The format of the result files (tsv, parquet, feather, hdf5)
+    'result_format': 'tsv',
+    # True if the simulated reports should be cached
+    'result_cache': False,
+    # The folder of the result cache
+    'cache_dir': DEFAULT_CACHE_DIR,
+    # The maximum size of the result cache in MB
+    'cache_size': DEFAULT_CACHE_SIZE,
+    # The number of contiguous replicas run in sequence by each job
+    'replicas_per_job': 1,
+    # True if the job durations should be recorded to order the jobs and estimate the remaining time
+    'job_history': False,
+    # The folder of the job histories
+    'history_dir': DEFAULT_HISTORY_DIR,
+    # The maximum duration of a local job in seconds (0 for no timeout)
+    'job_timeout': 0,
+    # The maximum duration of a local job as a multiple of the median duration (0 for no timeout)
+    'job_timeout_median': 0,
+    # The number of times a timed out job is run again
+    'job_retries': 1,
+    # True if the output of the local jobs should be written to the folders out/ and err/
+    'spool_output': False,
+    # The number of CPUs of each local job (0 to share the available CPUs among the local jobs)
+    'cpus_per_job': 0,
+    # True if each local job should run on a disjoint set of CPUs (Linux only)
+    'pin_cpus': False,
+    # The memory ceiling of the concurrent local jobs in MB if local_cpus is `auto` (0 for a fraction of
+    # the available memory)
+    'max_memory': 0,
+    # True if the model implements the resident protocol, serving many local runs within one process
+    'resident_model': False
+}
+
+
 class Pipeline:
     """
     Generic pipeline.
@@ -95,6 +135,7 @@ class Pipeline:
         return self.__sim_plots_folder
 
     @staticmethod
+    @traced()
     def generate_tarball(working_dir, output_folder):
         """
         Create a gz tarball.
@@ -145,6 +186,91 @@ class Pipeline:
         logger.debug('Loaded configuration dictionary: ' + str(config_dict))
         return config_dict
 
+    @classmethod
+    def parse_job_options(cls, config_dict):
+        """
+        Read the options of the local jobs (see JOB_OPTIONS) from the pipeline configuration.
+
+        :param config_dict: the dictionary structure of the configuration file
+        :return: a dictionary of the job options
+        """
+        job_options = dict(JOB_OPTIONS)
+        for key, value in config_dict.items():
+            if key in JOB_OPTIONS:
+                job_options[key] = value
+        return job_options
+
+    @classmethod
+    def get_result_cache(cls, job_options):
+        """
+        Return the cache of the simulated reports.
+
+        :param job_options: the dictionary of the job options (see parse_job_options)
+        :return: the ResultCache, or None if the reports are not cached
+        """
+        if not job_options['result_cache']:
+            return None
+        return ResultCache(os.path.expanduser(job_options['cache_dir']), job_options['cache_size'])
+
+    @classmethod
+    def get_job_history(cls, job_options, model_file, task, replicas=True):
+        """
+        Return the history of the job durations of a task of this pipeline on a model.
+
+        :param job_options: the dictionary of the job options (see parse_job_options)
+        :param model_file: the model file
+        :param task: the string identifying the task (e.g. the simulator)
+        :param replicas: True if the jobs of the task are replicas of the same job, False if each job
+        (e.g. the analysis of a column) is distinct
+        :return: the JobHistory, or None if the job durations are not recorded
+        """
+        if not job_options['job_history']:
+            return None
+        try:
+            key = get_history_key(cls.__name__ + ':' + task, model_file)
+        except IOError:
+            logger.warning('Cannot read `' + model_file + '`. The job durations are not recorded.')
+            return None
+        return JobHistory(os.path.expanduser(job_options['history_dir']), key, replicas=replicas)
+
+    @classmethod
+    def get_job_timeout(cls, job_options):
+        """
+        Return the timeout of the local jobs.
+
+        :param job_options: the dictionary of the job options (see parse_job_options)
+        :return: the JobTimeout, or None if the jobs have no timeout
+        """
+        if float(job_options['job_timeout']) > 0 or float(job_options['job_timeout_median']) > 0:
+            return JobTimeout(float(job_options['job_timeout']), float(job_options['job_timeout_median']),
+                              int(job_options['job_retries']))
+        return None
+
+    @classmethod
+    def set_job_options(cls, sim, job_options, model_file, task):
+        """
+        Apply the job options to the simulator generating the data of this pipeline.
+
+        :param sim: the simulator
+        :param job_options: the dictionary of the job options (see parse_job_options). If None,
+        the default options are applied
+        :param model_file: the model file
+        :param task: the string identifying the task in the job history (e.g. the simulator)
+        :raise: ValueError if an option is not supported by the simulator
+        """
+        if job_options is None:
+            job_options = dict(JOB_OPTIONS)
+        sim.set_result_format(job_options['result_format'])
+        sim.set_cache(cls.get_result_cache(job_options))
+        sim.set_replicas_per_job(job_options['replicas_per_job'])
+        sim.set_job_history(cls.get_job_history(job_options, model_file, task))
+        sim.set_job_timeout(cls.get_job_timeout(job_options))
+        sim.set_spool_output(job_options['spool_output'])
+        sim.set_cpus_per_job(job_options['cpus_per_job'])
+        sim.set_pin_cpus(job_options['pin_cpus'])
+        sim.set_max_memory(job_options['max_memory'])
+        sim.set_resident_model(job_options['resident_model'])
+
     def parse(self, config_dict):
         """
         Read a dictionary structure containing the pipeline configuration. This method is abstract.
@@ -30,10 +30,11 @@ import os
 import os.path
 import yaml
 import traceback
-from ..pipeline import Pipeline
+from ..pipeline import JOB_OPTIONS, Pipeline
 from sbpipe.utils.dependencies import is_r_package_installed
 from sbpipe.utils.io import refresh
-from sbpipe.utils.parcomp import parcomp
+from sbpipe.utils.parcomp import AUTO_CPUS, parcomp
+from sbpipe.utils.tracing import traced
 from sbpipe.utils.rand import get_rand_alphanum_str
 from sbpipe.report.latex_reports import latex_report_ps1, pdf_report
 
@@ -81,10 +82,12 @@ class ParScan1(Pipeline):
          cluster, local_cpus, runs, simulate__intervals,
          ps1_percent_levels, ps1_knock_down_only,
          levels_number, min_level, max_level, homogeneous_lines,
-         xaxis_label, yaxis_label) = self.parse(config_dict)
+         xaxis_label, yaxis_label,
+         job_options) = self.parse(config_dict)
 
         runs = int(runs)
-        local_cpus = int(local_cpus)
+        if local_cpus != AUTO_CPUS:
+            local_cpus = int(local_cpus)
         simulate__intervals = int(simulate__intervals)
         min_level = float(min_level)
         max_level = float(max_level)
@@ -115,7 +118,8 @@ class ParScan1(Pipeline):
                                             simulate__intervals,
                                             levels_number,
                                             models_dir,
-                                            os.path.join(outputdir, self.get_sim_data_folder()))
+                                            os.path.join(outputdir, self.get_sim_data_folder()),
+                                            job_options)
             if not status:
                 return False
 
@@ -161,8 +165,9 @@ class ParScan1(Pipeline):
         return True
 
     @classmethod
+    @traced()
     def generate_data(cls, simulator, model, scanned_par, cluster, local_cpus, runs, simulate_intervals,
-                      single_param_scan_intervals, inputdir, outputdir):
+                      single_param_scan_intervals, inputdir, outputdir, job_options=None):
         """
         The first pipeline step: data generation.
 
@@ -176,13 +181,15 @@ class ParScan1(Pipeline):
         :param single_param_scan_intervals: the number of scans to perform
         :param inputdir: the directory containing the model
         :param outputdir: the directory to store the results
+        :param job_options: the dictionary of the job options (see Pipeline.parse_job_options), or None
+        for the default options
         :return: True if the task was completed successfully, False otherwise.
         """
         if not os.path.isfile(os.path.join(inputdir, model)):
             logger.error(os.path.join(inputdir, model) + " does not exist.")
             return False
 
-        if int(local_cpus) < 1:
+        if local_cpus != AUTO_CPUS and int(local_cpus) < 1:
             logger.error("variable local_cpus must be greater than 0. Please, check your configuration file.")
             return False
 
@@ -209,6 +216,7 @@ class ParScan1(Pipeline):
             logger.debug(traceback.format_exc())
             return False
         try:
+            cls.set_job_options(sim, job_options, os.path.join(inputdir, model), simulator)
             return sim.ps1(model, scanned_par, simulate_intervals,
                     single_param_scan_intervals, inputdir, outputdir,
                     cluster, local_cpus, runs)
@@ -218,6 +226,7 @@ class ParScan1(Pipeline):
             return False
 
     @classmethod
+    @traced()
     def analyse_data(cls, model, knock_down_only, outputdir,
                      sim_data_folder, sim_plots_folder, runs, local_cpus,
                      percent_levels, min_level, max_level, levels_number,
@@ -261,7 +270,7 @@ class ParScan1(Pipeline):
             logger.error("min_level MUST BE lower than max_level. Please, check your configuration file.")
             return False
 
-        if int(local_cpus) < 1:
+        if local_cpus != AUTO_CPUS and int(local_cpus) < 1:
             logger.error("variable local_cpus must be greater than 0. Please, check your configuration file.")
             return False
 
@@ -312,6 +321,7 @@ class ParScan1(Pipeline):
         return True
 
     @classmethod
+    @traced()
     def generate_report(cls, model, scanned_par, outputdir, sim_plots_folder):
         """
         The third pipeline step: report generation.
@@ -426,12 +436,18 @@ class ParScan1(Pipeline):
                 xaxis_label = value
             elif key == "yaxis_label":
                 yaxis_label = value
+            elif key in JOB_OPTIONS:
+                # read by parse_job_options
+                pass
             else:
                 logger.warning('Found unknown option: `' + key + '`')
 
+        job_options = self.parse_job_options(my_dict)
+
         return (generate_data, analyse_data, generate_report, generate_tarball,
                 project_dir, simulator, model, scanned_par,
                 cluster, local_cpus, runs,
                 simulate__intervals, ps1_percent_levels,
                 ps1_knock_down_only, levels_number, min_level, max_level,
-                homogeneous_lines, xaxis_label, yaxis_label)
+                homogeneous_lines, xaxis_label, yaxis_label,
+                job_options)
@@ -28,12 +28,18 @@ import glob
 import logging
 import os
 import os.path
+import re
+import shutil
+import tempfile
 import yaml
 import traceback
-from ..pipeline import Pipeline
+from ..pipeline import JOB_OPTIONS, Pipeline
 from sbpipe.utils.dependencies import is_r_package_installed
 from sbpipe.utils.io import refresh
-from sbpipe.utils.parcomp import parcomp
+from sbpipe.utils.parcomp import AUTO_CPUS, parcomp
+from sbpipe.utils.tracing import traced
+from sbpipe.utils.ps2_index import INDEXED_LAYOUT, PS2_LAYOUTS, extract_ps2_timepoint, get_ps2_index_filename, \
+    read_ps2_index, select_timepoints
 from sbpipe.utils.rand import get_rand_alphanum_str
 from sbpipe.report.latex_reports import latex_report_ps2, pdf_report
 
@@ -79,10 +85,12 @@ class ParScan2(Pipeline):
         (generate_data, analyse_data, generate_report, generate_tarball,
          project_dir, simulator, model, scanned_par1, scanned_par2,
          cluster, local_cpus, runs,
-         sim_length) = self.parse(config_dict)
+         sim_length, ps2_layout, plot_timepoints,
+         job_options) = self.parse(config_dict)
 
         runs = int(runs)
-        local_cpus = int(local_cpus)
+        if local_cpus != AUTO_CPUS:
+            local_cpus = int(local_cpus)
         sim_length = int(sim_length)
 
         models_dir = os.path.join(project_dir, self.get_models_folder())
@@ -108,7 +116,9 @@ class ParScan2(Pipeline):
                                             os.path.join(outputdir, self.get_sim_data_folder()),
                                             cluster,
                                             local_cpus,
-                                            runs)
+                                            runs,
+                                            ps2_layout,
+                                            job_options)
             if not status:
                 return False
 
@@ -123,7 +133,9 @@ class ParScan2(Pipeline):
                                            os.path.join(outputdir, self.get_sim_plots_folder()),
                                            cluster,
                                            local_cpus,
-                                           runs)
+                                           runs,
+                                           ps2_layout,
+                                           plot_timepoints)
             if not status:
                 return False
 
@@ -151,7 +163,9 @@ class ParScan2(Pipeline):
         return True
 
     @classmethod
-    def generate_data(cls, simulator, model, sim_length, inputdir, outputdir, cluster, local_cpus, runs):
+    @traced()
+    def generate_data(cls, simulator, model, sim_length, inputdir, outputdir, cluster, local_cpus, runs,
+                      ps2_layout='split', job_options=None):
         """
         The first pipeline step: data generation.
 
@@ -163,6 +177,9 @@ class ParScan2(Pipeline):
         :param cluster: local, lsf for Load Sharing Facility, sge for Sun Grid Engine.
         :param local_cpus: the number of CPU.
         :param runs: the number of model simulation
+        :param ps2_layout: the layout of the result files (split, indexed)
+        :param job_options: the dictionary of the job options (see Pipeline.parse_job_options), or None
+        for the default options
         :return: True if the task was completed successfully, False otherwise.
         """
 
@@ -187,6 +204,8 @@ class ParScan2(Pipeline):
             logger.debug(traceback.format_exc())
             return False
         try:
+            cls.set_job_options(sim, job_options, os.path.join(inputdir, model), simulator)
+            sim.set_ps2_layout(ps2_layout)
             return sim.ps2(model, sim_length, inputdir, outputdir, cluster, local_cpus, runs)
         except Exception as e:
             logger.error(str(e))
@@ -194,7 +213,9 @@ class ParScan2(Pipeline):
             return False
 
     @classmethod
-    def analyse_data(cls, model, scanned_par1, scanned_par2, inputdir, outputdir, cluster='local', local_cpus=1, runs=1):
+    @traced()
+    def analyse_data(cls, model, scanned_par1, scanned_par2, inputdir, outputdir, cluster='local', local_cpus=1, runs=1,
+                     ps2_layout='split', plot_timepoints=None):
         """
         The second pipeline step: data analysis.
 
@@ -206,6 +227,9 @@ class ParScan2(Pipeline):
         :param cluster: local, lsf for Load Sharing Facility, sge for Sun Grid Engine.
         :param local_cpus: the number of CPU.
         :param runs: the number of model simulation
+        :param ps2_layout: the layout of the simulated data sets (split, indexed)
+        :param plot_timepoints: the list of time points to plot if ps2_layout is indexed. If None,
+        DEFAULT_PLOT_TIMEPOINTS evenly spaced time points are plotted
         :return: True if the task was completed successfully, False otherwise.
         """
         if not os.path.exists(inputdir):
@@ -216,10 +240,15 @@ class ParScan2(Pipeline):
             logger.error("variable `runs` must be greater than 0. Please, check your configuration file.")
             return False
 
-        if int(local_cpus) < 1:
+        if local_cpus != AUTO_CPUS and int(local_cpus) < 1:
             logger.error("variable local_cpus must be greater than 0. Please, check your configuration file.")
             return False
 
+        if ps2_layout not in PS2_LAYOUTS:
+            logger.error("variable ps2_layout must be one of: " + ', '.join(PS2_LAYOUTS) +
+                         ". Please, check your configuration file.")
+            return False
+
         # folder preparation
         refresh(outputdir, os.path.splitext(model)[0])
 
@@ -228,17 +257,33 @@ class ParScan2(Pipeline):
         if not is_r_package_installed('sbpiper'):
             logger.critical('R package `sbpiper` was not found. Abort.')
             return False
-        command = 'R --quiet -e \'library(sbpiper); sbpiper_ps2(\"' + model + \
-                  '\", \"' + scanned_par1 + '\", \"' + scanned_par2 + \
-                  '\", \"' + inputdir + \
-                  '\", \"' + outputdir + \
-                  '\", \"' + str_to_replace
-        # we replace \\ with / otherwise subprocess complains on windows systems.
-        command = command.replace('\\', '\\\\')
-        # We do this to make sure that characters like [ or ] don't cause troubles.
-        command += '\")\''
-
-        if not parcomp(command, str_to_replace, outputdir, cluster, int(runs), int(local_cpus), False):
+
+        # sbpiper reads one file per replica and time point. For the indexed layout,
+        # only the time points to plot are extracted to a temporary folder.
+        datadir = inputdir
+        if ps2_layout == INDEXED_LAYOUT:
+            datadir = tempfile.mkdtemp(dir=inputdir)
+        try:
+            if datadir != inputdir:
+                cls.extract_timepoints(model, inputdir, datadir, plot_timepoints)
+
+            command = 'R --quiet -e \'library(sbpiper); sbpiper_ps2(\"' + model + \
+                      '\", \"' + scanned_par1 + '\", \"' + scanned_par2 + \
+                      '\", \"' + datadir + \
+                      '\", \"' + outputdir + \
+                      '\", \"' + str_to_replace
+            # we replace \\ with / otherwise subprocess complains on windows systems.
+            command = command.replace('\\', '\\\\')
+            # We do this to make sure that characters like [ or ] don't cause troubles.
+            command += '\")\''
+
+            if local_cpus != AUTO_CPUS:
+                local_cpus = int(local_cpus)
+            status = parcomp(command, str_to_replace, outputdir, cluster, int(runs), local_cpus, False)
+        finally:
+            if datadir != inputdir:
+                shutil.rmtree(datadir, ignore_errors=True)
+        if not status:
             return False
 
         if len(glob.glob(os.path.join(outputdir, os.path.splitext(model)[0] + '*.pdf'))) == 0:
@@ -246,6 +291,36 @@ class ParScan2(Pipeline):
         return True
 
     @classmethod
+    def extract_timepoints(cls, model, inputdir, outputdir, timepoints=None):
+        """
+        Extract time points from the indexed double parameter scan results, storing one file
+        per replica and time point as for the split layout.
+
+        :param model: the model name
+        :param inputdir: the directory containing the indexed simulated data sets
+        :param outputdir: the directory to store the extracted time points
+        :param timepoints: the list of time points to extract. If None, DEFAULT_PLOT_TIMEPOINTS evenly
+        spaced time points are extracted, so that long simulations do not generate a file per time point
+        :return: the list of extracted files
+        """
+        filesout = []
+        for f in sorted(os.listdir(inputdir)):
+            if not re.match(re.escape(model) + r'__rep_[0-9]+\.csv$', f):
+                continue
+            filein = os.path.join(inputdir, f)
+            index = read_ps2_index(get_ps2_index_filename(filein))
+            if timepoints is None:
+                # the replicas share the time points
+                timepoints = select_timepoints(index)
+                logger.info('Plotting the time points: ' + ', '.join(str(tp) for tp in timepoints))
+            for tp in timepoints:
+                fileout = os.path.join(outputdir, os.path.splitext(f)[0] + '__tp_' + str(tp) + '.csv')
+                extract_ps2_timepoint(filein, int(tp), fileout, index)
+                filesout.append(fileout)
+        return filesout
+
+    @classmethod
+    @traced()
     def generate_report(cls, model, scanned_par1, scanned_par2, outputdir, sim_plots_folder):
         """
         The third pipeline step: report generation.
@@ -296,6 +371,12 @@ class ParScan2(Pipeline):
         # the simulation length
         sim_length = 1
 
+        # The layout of the result files (split, indexed)
+        ps2_layout = 'split'
+
+        # The time points to plot with the indexed layout (all if None)
+        plot_timepoints = None
+
         # Initialises the variables
         for key, value in my_dict.items():
 
@@ -327,9 +408,19 @@ class ParScan2(Pipeline):
                 runs = value
             elif key == "sim_length":
                 sim_length = value
+            elif key == "ps2_layout":
+                ps2_layout = value
+            elif key == "plot_timepoints":
+                plot_timepoints = value
+            elif key in JOB_OPTIONS:
+                # read by parse_job_options
+                pass
             else:
                 logger.warning('Found unknown option: `' + key + '`')
 
+        job_options = self.parse_job_options(my_dict)
+
         return (generate_data, analyse_data, generate_report, generate_tarball,
                 project_dir, simulator, model, scanned_par1, scanned_par2,
-                cluster, local_cpus, runs, sim_length)
+                cluster, local_cpus, runs, sim_length, ps2_layout, plot_timepoints,
+                job_options)
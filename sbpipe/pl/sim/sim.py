@@ -29,10 +29,15 @@ import logging
 import os
 import yaml
 import traceback
-from ..pipeline import Pipeline
+from ..pipeline import JOB_OPTIONS, Pipeline
+from sbpipe.simul.simul import Simul
+from sbpipe.utils.columnar import COLUMNAR_FORMATS
 from sbpipe.utils.dependencies import is_r_package_installed
 from sbpipe.utils.io import refresh
-from sbpipe.utils.parcomp import parcomp
+from sbpipe.utils.parcomp import AUTO_CPUS, parcomp
+from sbpipe.utils.tracing import traced
+from sbpipe.utils.re_utils import nat_sort_key
+from sbpipe.utils.sim_stats import BY_VAR_FOLDER, STATS_PREFIX, summarise_replicas
 from sbpipe.report.latex_reports import latex_report_sim, pdf_report
 
 logger = logging.getLogger('sbpipe')
@@ -78,10 +83,13 @@ class Sim(Pipeline):
          project_dir, simulator, model, cluster, local_cpus, runs,
          exp_dataset, plot_exp_dataset,
          exp_dataset_alpha,
-         xaxis_label, yaxis_label) = self.parse(config_dict)
+         xaxis_label, yaxis_label,
+         stats_backend, resume,
+         job_options) = self.parse(config_dict)
 
         runs = int(runs)
-        local_cpus = int(local_cpus)
+        if local_cpus != AUTO_CPUS:
+            local_cpus = int(local_cpus)
         exp_dataset_alpha = float(exp_dataset_alpha)
 
         models_dir = os.path.join(project_dir, self.get_models_folder())
@@ -106,7 +114,9 @@ class Sim(Pipeline):
                                        os.path.join(outputdir, self.get_sim_data_folder()),
                                        cluster,
                                        local_cpus,
-                                       runs)
+                                       runs,
+                                       resume,
+                                       job_options)
             if not status:
                 return False
 
@@ -125,7 +135,10 @@ class Sim(Pipeline):
                                       cluster,
                                       local_cpus,
                                       xaxis_label,
-                                      yaxis_label)
+                                      yaxis_label,
+                                      stats_backend,
+                                      self.get_job_history(job_options, os.path.join(models_dir, model),
+                                                           'analysis', replicas=False))
             if not status:
                 return False
 
@@ -151,7 +164,9 @@ class Sim(Pipeline):
         return True
 
     @classmethod
-    def generate_data(cls, simulator, model, inputdir, outputdir, cluster="local", local_cpus=2, runs=1):
+    @traced()
+    def generate_data(cls, simulator, model, inputdir, outputdir, cluster="local", local_cpus=2, runs=1,
+                      resume=False, job_options=None):
         """
         The first pipeline step: data generation.
 
@@ -162,10 +177,13 @@ class Sim(Pipeline):
         :param cluster: local, lsf for Load Sharing Facility, sge for Sun Grid Engine.
         :param local_cpus: the number of CPUs.
         :param runs: the number of model simulation
+        :param resume: True if only the missing or incomplete replicas should be simulated
+        :param job_options: the dictionary of the job options (see Pipeline.parse_job_options), or None
+        for the default options
         :return: True if the task was completed successfully, False otherwise.
         """
 
-        if int(local_cpus) < 1:
+        if local_cpus != AUTO_CPUS and int(local_cpus) < 1:
             logger.error("variable local_cpus must be greater than 0. Please, check your configuration file.")
             return False
 
@@ -178,7 +196,10 @@ class Sim(Pipeline):
             return False
 
         # folder preparation
-        refresh(outputdir, os.path.splitext(model)[0])
+        if not resume:
+            refresh(outputdir, os.path.splitext(model)[0])
+        elif not os.path.exists(outputdir):
+            os.makedirs(outputdir)
 
         # execute runs simulations.
         logger.info("Simulating model " + model + " for " + str(runs) + " time(s)")
@@ -189,6 +210,8 @@ class Sim(Pipeline):
             logger.debug(traceback.format_exc())
             return False
         try:
+            cls.set_job_options(sim, job_options, os.path.join(inputdir, model), simulator)
+            sim.set_resume(resume)
             return sim.sim(model, inputdir, outputdir, cluster, local_cpus, runs, False)
         except Exception as e:
             logger.error(str(e))
@@ -196,8 +219,10 @@ class Sim(Pipeline):
             return False
 
     @classmethod
+    @traced()
     def analyse_data(cls, simulator, model, inputdir, outputdir, sim_plots_dir, exp_dataset, plot_exp_dataset,
-                     exp_dataset_alpha=1.0, cluster="local", local_cpus=2, xaxis_label='', yaxis_label=''):
+                     exp_dataset_alpha=1.0, cluster="local", local_cpus=2, xaxis_label='', yaxis_label='',
+                     stats_backend='r', job_history=None):
         """
         The second pipeline step: data analysis.
 
@@ -213,12 +238,21 @@ class Sim(Pipeline):
         :param local_cpus: the number of CPUs.
         :param xaxis_label: the label for the x axis (e.g. Time [min])
         :param yaxis_label: the label for the y axis (e.g. Level [a.u.])
+        :param stats_backend: r if sbpiper computes the statistics and the plots, numpy if the statistics are
+        computed natively for all the variables at once. The numpy statistics are written to sim_stats_numpy_*
+        and simulate_data_by_var_numpy, as their columns differ from sbpiper's. Then, one R process plots all
+        the variables from simulate_data_by_var_numpy.
+        :param job_history: the JobHistory of the analyses of the columns, or None if their durations are not recorded
         :return: True if the task was completed successfully, False otherwise.
         """
         if not os.path.exists(inputdir):
             logger.error("inputdir " + inputdir + " does not exist. Generate some data first.")
             return False
 
+        if stats_backend not in ('r', 'numpy'):
+            logger.error("variable stats_backend must be `r` or `numpy`. Please, check your configuration file.")
+            return False
+
         if float(exp_dataset_alpha) > 1.0 or float(exp_dataset_alpha) < 0.0:
             logger.warning("variable exp_dataset_alpha must be in [0,1]. Please, check your configuration file.")
             exp_dataset_alpha = 1.0
@@ -242,14 +276,61 @@ class Sim(Pipeline):
             logger.error(str(e))
             logger.debug(traceback.format_exc())
             return False
-        str_to_replace = 'COLUMN_TO_REPLACE'
-
         logger.info("Analysing generated simulations:")
 
+        str_to_replace = 'COLUMN_TO_REPLACE'
+
         # requires devtools::install_github("pdp10/sbpiper")
         if not is_r_package_installed('sbpiper'):
             logger.critical('R package `sbpiper` was not found. Abort.')
             return False
+
+        if stats_backend == 'numpy':
+            files = glob.glob(os.path.join(inputdir, model + '_*.csv'))
+            files.sort(key=nat_sort_key)
+            if not files:
+                logger.error("No simulated time course was found in " + inputdir + ".")
+                return False
+            np_data_by_var_dir = os.path.join(outputdir, BY_VAR_FOLDER)
+            refresh(np_data_by_var_dir, os.path.splitext(model)[0])
+            # the columnar collection of the replicas is read instead of the reports, if it was generated
+            collections = [Simul.get_collection_filename(inputdir, model, result_format)
+                           for result_format in sorted(COLUMNAR_FORMATS)]
+            collections = [collection for collection in collections if os.path.isfile(collection)]
+            try:
+                summarise_replicas(files,
+                                   columns,
+                                   os.path.join(outputdir, STATS_PREFIX + model + '_'),
+                                   os.path.join(np_data_by_var_dir, model + '_'),
+                                   collections[0] if collections else None)
+            except ImportError as e:
+                logger.error('Python packages numpy and scipy are required by `stats_backend: numpy`: ' + str(e))
+                return False
+            except Exception as e:
+                logger.error(str(e))
+                logger.debug(traceback.format_exc())
+                return False
+            # the plots of all the variables are generated by one R process, which reads the tables by variable
+            plot_args = '\"' + np_data_by_var_dir + \
+                        '\", \"' + sim_plots_dir + \
+                        '\", \"' + model + \
+                        '\", \"' + exp_dataset + \
+                        '\", ' + str(plot_exp_dataset).upper() + \
+                        ', \"' + str(exp_dataset_alpha)
+            # we replace \\ with / otherwise subprocess complains on windows systems.
+            plot_args = plot_args.replace('\\', '\\\\')
+            plot_args += '\", \"' + xaxis_label + \
+                         '\", \"' + yaxis_label + \
+                         '\", column'
+            command = 'R --quiet -e \'library(sbpiper); ' + \
+                      'for(column in c(\"' + '\", \"'.join(columns) + '\")) { ' + \
+                      'plot_sep_sims(' + plot_args + '); plot_comb_sims(' + plot_args + ') }\''
+            if not parcomp(command, str_to_replace, outputdir, cluster, 1, local_cpus, False):
+                return False
+            if len(glob.glob(os.path.join(sim_plots_dir, os.path.splitext(model)[0] + '*.pdf'))) == 0:
+                return False
+            return True
+
         command = 'R --quiet -e \'library(sbpiper); sbpiper_sim(\"' + model + \
                   '\", \"' + inputdir + '\", \"' + sim_plots_dir + \
                   '\", \"' + os.path.join(outputdir, 'sim_stats_' + model + '_' + str_to_replace + '.csv') + \
@@ -266,7 +347,8 @@ class Sim(Pipeline):
                    '\", \"' + str_to_replace + \
                    '\")\''
 
-        if not parcomp(command, str_to_replace, outputdir, cluster, 1, local_cpus, False, columns):
+        if not parcomp(command, str_to_replace, outputdir, cluster, 1, local_cpus, False, columns,
+                       history=job_history):
             return False
 
         if len(glob.glob(os.path.join(sim_plots_dir, os.path.splitext(model)[0] + '*.pdf'))) == 0:
@@ -274,6 +356,7 @@ class Sim(Pipeline):
         return True
 
     @classmethod
+    @traced()
     def generate_report(cls, model, outputdir, sim_plots_folder):
         """
         The third pipeline step: report generation.
@@ -318,6 +401,11 @@ class Sim(Pipeline):
         xaxis_label = 'Time [min]'
         yaxis_label = 'Level [a.u.]'
 
+        # The engine computing the statistics (r, numpy)
+        stats_backend = 'r'
+        # True if only the missing or incomplete replicas should be simulated
+        resume = False
+
         # Initialises the variables
         for key, value in my_dict.items():
 
@@ -353,12 +441,23 @@ class Sim(Pipeline):
                 xaxis_label = value
             elif key == "yaxis_label":
                 yaxis_label = value
+            elif key == "stats_backend":
+                stats_backend = value
+            elif key == "resume":
+                resume = value
+            elif key in JOB_OPTIONS:
+                # read by parse_job_options
+                pass
             else:
                 logger.warning('Found unknown option: `' + key + '`')
 
+        job_options = self.parse_job_options(my_dict)
+
         return (generate_data, analyse_data, generate_report, generate_tarball,
                 project_dir, simulator, model,
                 cluster, local_cpus, runs,
                 exp_dataset, plot_exp_dataset,
                 exp_dataset_alpha,
-                xaxis_label, yaxis_label)
+                xaxis_label, yaxis_label,
+                stats_backend, resume,
+                job_options)
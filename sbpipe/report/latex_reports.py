@@ -30,6 +30,7 @@ import sys
 from sbpipe.utils.dependencies import which
 
 from sbpipe.utils.re_utils import nat_sort_key
+from sbpipe.utils.tracing import traced
 
 logger = logging.getLogger('sbpipe')
 
@@ -58,6 +59,7 @@ def get_latex_header(pdftitle="SBpipe report", title="SBpipe report", abstract="
     )
 
 
+@traced()
 def latex_report_ps1(outputdir, plots_folder, filename_prefix, model_noext, scanned_par):
     """
     Generate a report for a single parameter scan task.
@@ -94,6 +96,7 @@ def latex_report_ps1(outputdir, plots_folder, filename_prefix, model_noext, scan
         file_out.write("\\end{document}\n")
 
 
+@traced()
 def latex_report_ps2(outputdir, plots_folder, filename_prefix, model_noext,
                      scanned_par1, scanned_par2):
     """
@@ -143,6 +146,7 @@ def latex_report_ps2(outputdir, plots_folder, filename_prefix, model_noext,
         file_out.write("\\end{document}\n")
 
 
+@traced()
 def latex_report_sim(outputdir, plots_folder, model_noext, filename_prefix):
     """
     Generate a report for a time course task.
@@ -176,6 +180,7 @@ def latex_report_sim(outputdir, plots_folder, model_noext, filename_prefix):
         file_out.write("\\end{document}\n")
 
 
+@traced()
 def latex_report_pe(outputdir, plots_folder, model_noext, filename_prefix):
     """
     Generate a report for a parameter estimation task.
@@ -273,6 +278,7 @@ def latex_report(outputdir, plots_folder, model_noext, filename_prefix, caption=
         file_out.write("\\end{document}\n")
 
 
+@traced()
 def pdf_report(outputdir, filename):
     """
     Generate a PDF report from LaTeX report using pdflatex.
@@ -25,12 +25,13 @@
 import logging
 import os
 import re
-import shutil
 import sys
 
+from sbpipe.utils.cache import get_executable_id
 from sbpipe.utils.dependencies import which
 from sbpipe.utils.io import remove_file_silently
-from sbpipe.utils.io import replace_str_in_file
+from sbpipe.utils.io import read_file_template
+from sbpipe.utils.io import write_file_template
 from sbpipe.utils.parcomp import parcomp
 from ..simul import Simul
 
@@ -42,6 +43,108 @@ except ImportError:
 logger = logging.getLogger('sbpipe')
 
 
+def read_copasi_fits(filein):
+    """
+    Read a Copasi parameter estimation report in a single pass. This is executed by the worker processes
+    collecting the fits (see Simul.get_fits).
+
+    :param filein: a Copasi parameter estimation report file
+    :return: a tuple (parameters, best_fit, all_fits). parameters is the list of parameter names, best_fit is the
+    line of the final estimate (None if the report contains no estimate), and all_fits is the list of lines of all
+    the estimates. Lines include the final new line.
+    """
+    parameters = []
+    best_fit = None
+    all_fits = []
+    # the number of columns for the estimated parameters (see BUG FIX 226 below)
+    col_num = 0
+    params_found = False
+    cols_found = False
+    fits_found = False
+    # the section of the report currently read: None, 'params', or 'fits'
+    section = None
+    # True if the next line is the first function evaluation
+    read_cols = False
+    with open(filein, 'r') as file:
+        for line in file:
+            if read_cols:
+                read_cols = False
+                if line.find('(') != -1:
+                    # extract the string which is between '\t(\t' and  '\t)\t'
+                    # cols contains the parameter values for the first function evaluation
+                    cols = re.search('(\t(.*)\t)', line).group(1)
+                    col_num = len(cols.split("\t"))
+
+            if section == 'params':
+                split_line = line.rstrip().split("\t")[0]
+                if not split_line:
+                    section = None
+                elif split_line.find('<=') != -1:
+                    # extract the name which is between ' <= ' and  ' <= '
+                    parameters.append(re.search(' <= (.*) <= ', split_line).group(1))
+                continue
+
+            if section == 'fits':
+                split_line = line.replace("\t(", "").replace("\t)", "").rstrip().split("\t")
+                if len(split_line) == 1:
+                    section = None
+                else:
+                    best_fit = split_line
+                    all_fits.append('\t'.join(split_line[1:]) + '\n')
+                    continue
+
+            if params_found and fits_found:
+                break
+
+            split_line = line.split('\t')
+            if not params_found and \
+                    (split_line[0].find('List of Fitting Items:') != -1 or
+                     split_line[0].find('List of Optimization Items:') != -1):
+                # retrieve parameters
+                params_found = True
+                section = 'params'
+                continue
+
+            if not cols_found and split_line[0].find('[Function Evaluations]') != -1:
+                # retrieve the columns from the next line
+                cols_found = True
+                read_cols = True
+
+            split_line = line.rstrip().split("\t")
+            # Retrieve the estimated values of the parameters
+            if not fits_found and len(split_line) > 2 and split_line[0] == '[Function Evaluations]' and \
+                    split_line[1] == '[Best Value]' and split_line[2] == '[Best Parameters]':
+                fits_found = True
+                best_fit = []
+                section = 'fits'
+
+    ##############################################################
+    # START BUG FIX 226.
+    #
+    # This fix is kept separately as it may be removed one day.
+    # Copasi adds the list of constraints to the same list of fitted parameters
+    # in the parameter estimation report. This causes an issue with SBpipe as this cannot discriminate whether
+    # the parameter is estimated or constrained.
+    # This patch cuts off the parameter list based on the number of columns of estimated parameters.
+    # NOTICE: It will work as long as Copasi adds the list of constraints at the bottom of
+    # the list of fitted parameters.
+
+    # We need to get the number of columns for the estimated parameters. This is not well represented in a
+    # Copasi report and if the estimation is not completed, this information is also missing. In this latter
+    # case, we don't do anything.
+
+    # Now we only consider the first `col_num` in parameters, if col_num is not zero.
+    if col_num != 0:
+        parameters = parameters[:col_num]
+
+    # END BUG FIX 226
+    ##############################################################
+
+    if best_fit is not None:
+        best_fit = '\t'.join(best_fit) + '\n'
+    return parameters, best_fit, all_fits
+
+
 class Copasi(Simul):
     """
     Copasi simulator.
@@ -83,12 +186,13 @@ class Copasi(Simul):
                                    'Time-Course'):
             return False
 
-        if not self._run_par_comput(inputdir, model, outputdir, cluster, local_cpus, runs, output_msg):
+        if not self._run_replicas(model, inputdir, outputdir, cluster, local_cpus, runs, output_msg):
             return False
         # removed repeated copasi files
         repeated_copasi_files = [f for f in os.listdir(inputdir) if re.match(self._get_model_group(model) + '[0-9]+.*.cps', f)]
         for report in repeated_copasi_files:
             remove_file_silently(os.path.join(inputdir, report))
+        self.sim_postproc(model, outputdir)
         return True
 
     def ps1(self, model, scanned_par, simulate_intervals,
@@ -101,7 +205,7 @@ class Copasi(Simul):
                                    'Scan'):
             return False
 
-        if not self._run_par_comput(inputdir, model, outputdir, cluster, local_cpus, runs, output_msg):
+        if not self._run_replicas(model, inputdir, outputdir, cluster, local_cpus, runs, output_msg):
             return False
         # removed repeated copasi files
         repeated_copasi_files = [f for f in os.listdir(inputdir) if re.match(self._get_model_group(model) + '[0-9]+.*.cps', f)]
@@ -119,7 +223,7 @@ class Copasi(Simul):
                                    'Scan'):
             return False
 
-        if not self._run_par_comput(inputdir, model, outputdir, cluster, local_cpus, runs, output_msg):
+        if not self._run_replicas(model, inputdir, outputdir, cluster, local_cpus, runs, output_msg):
             return False
         # removed repeated copasi files
         repeated_copasi_files = [f for f in os.listdir(inputdir) if re.match(self._get_model_group(model) + '[0-9]+.*.cps', f)]
@@ -137,7 +241,8 @@ class Copasi(Simul):
                                    'Parameter Estimation'):
             return False
 
-        if not self._run_par_comput(inputdir, model, sim_data_dir, cluster, local_cpus, runs, output_msg):
+        if not self._run_replicas(model, inputdir, sim_data_dir, cluster, local_cpus, runs, output_msg,
+                                  self.is_fits_report_complete):
             return False
         # move_models
         repeated_copasi_files = [f for f in os.listdir(inputdir) if re.match(self._get_model_group(model) + '[0-9]+.*.cps', f)]
@@ -145,7 +250,15 @@ class Copasi(Simul):
             remove_file_silently(os.path.join(inputdir, file))
         return True
 
-    def _run_par_comput(self, inputdir, model, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False):
+    def _get_cache_settings(self):
+        __doc__ = Simul._get_cache_settings.__doc__
+
+        settings = Simul._get_cache_settings(self)
+        settings['executable'] = get_executable_id(self._copasi)
+        return settings
+
+    def _run_par_comput(self, inputdir, model, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False,
+                        iter_ids=None):
         __doc__ = Simul._run_par_comput.__doc__
 
         if self._copasi is None:
@@ -154,21 +267,16 @@ class Copasi(Simul):
 
         model_group = self._get_model_group(model)
 
-        # replicate the models
-        for i in range(1, runs + 1):
-            shutil.copyfile(os.path.join(inputdir, model), os.path.join(inputdir, model_group) + str(i) + ".cps")
-            replace_str_in_file(os.path.join(inputdir, model_group) + str(i) + ".cps",
-                                os.path.splitext(model)[0] + ".csv",
-                                model_group + str(i) + ".csv")
-            replace_str_in_file(os.path.join(inputdir, model_group) + str(i) + ".cps",
-                                os.path.splitext(model)[0] + ".txt",
-                                model_group + str(i) + ".csv")
-            replace_str_in_file(os.path.join(inputdir, model_group) + str(i) + ".cps",
-                                os.path.splitext(model)[0] + ".tsv",
-                                model_group + str(i) + ".csv")
-            replace_str_in_file(os.path.join(inputdir, model_group) + str(i) + ".cps",
-                                os.path.splitext(model)[0] + ".dat",
-                                model_group + str(i) + ".csv")
+        # the model is read once. Each replica is written right before its job is dispatched.
+        model_noext = os.path.splitext(model)[0]
+        template = read_file_template(os.path.join(inputdir, model),
+                                      [model_noext + ".csv", model_noext + ".txt",
+                                       model_noext + ".tsv", model_noext + ".dat"])
+
+        def replicate_model(iter_id):
+            write_file_template(os.path.join(inputdir, model_group) + iter_id + ".cps",
+                                template,
+                                model_group + iter_id + ".csv")
 
         # run copasi in parallel
         # To make things simple, the last 10 character of groupid are extracted and reversed.
@@ -177,7 +285,11 @@ class Copasi(Simul):
         str_to_replace = self._groupid[10::-1]
         command = self._copasi + " " + os.path.join(inputdir, model_group + str_to_replace + ".cps")
         command = command.replace('\\', '\\\\')
-        if not parcomp(command, str_to_replace, outputdir, cluster, runs, local_cpus, output_msg):
+        if not parcomp(command, str_to_replace, outputdir, cluster, runs, local_cpus, output_msg,
+                       colnames=iter_ids or [], prepare_job=replicate_model,
+                       replicas_per_job=self._replicas_per_job, history=self._history,
+                       timeout=self._timeout, spool_output=self._spool_output,
+                       cpus_per_job=self._cpus_per_job, pin_cpus=self._pin_cpus, max_memory=self._max_memory):
             return False
         if not self._move_reports(inputdir, outputdir, model, self._groupid):
             return False
@@ -187,148 +299,30 @@ class Copasi(Simul):
     # utilities for collecting parameter estimation results
     #######################################################
 
-    def _get_params_list(self, filein):
+    def is_fits_report_complete(self, report):
         """
-        Return the list of parameter names from filein
+        Check whether a Copasi parameter estimation report was completely written. The report is complete
+        if its [Function Evaluations] block contains at least one estimate and is terminated.
 
-        :param filein: a Copasi parameter estimation report file
-        :return: the list of parameter names
+        :param report: a Copasi parameter estimation report file
+        :return: True if the report is complete, False otherwise
         """
-        parameters = []
-        with open(filein, 'r') as file:
-            lines = file.readlines()
-            line_num = -1
-            for line in lines:
-                line_num += 1
-                split_line = line.split('\t')
-                if len(split_line) > 0 and \
-                        (split_line[0].find('List of Fitting Items:') != -1 or
-                         split_line[0].find('List of Optimization Items:') != -1):
-                    # retrieve parameters
-                    line_num += 1
-                    if line_num < len(lines):
-                        split_line = lines[line_num].rstrip().split("\t")
-                    while len(split_line) > 0:
-                        split_line = split_line[0]
-                        if not split_line:
-                            break
-                        if split_line.find('<=') != -1:
-                            # extract the name which is between ' <= ' and  ' <= '
-                            param = re.search(' <= (.*) <= ', split_line).group(1)
-                            parameters.append(param)
-                        line_num += 1
-                        if line_num < len(lines):
-                            split_line = lines[line_num].rstrip().split("\t")
-                        else:
-                            break
-                    break
-
-        ##############################################################
-        # START BUG FIX 226.
-        #
-        # This fix is kept separately as it may be removed one day.
-        # Copasi adds the list of constraints to the same list of fitted parameters
-        # in the parameter estimation report. This causes an issue with SBpipe as this cannot discriminate whether
-        # the parameter is estimated or constrained.
-        # This patch cuts off the parameter list based on the number of columns of estimated parameters.
-        # NOTICE: It will work as long as Copasi adds the list of constraints at the bottom of
-        # the list of fitted parameters.
-
-        # We need to get the number of columns for the estimated parameters. This is not well represented in a
-        # Copasi report and if the estimation is not completed, this information is also missing. In this latter
-        # case, we don't do anything.
-        col_num = 0
-        with open(filein, 'r') as file:
-            lines = file.readlines()
-            line_num = -1
-            for line in lines:
-                line_num += 1
-                split_line = line.split('\t')
-                if len(split_line) > 0 and split_line[0].find('[Function Evaluations]') != -1:
-                    # retrieve the columns
-                    line_num += 1
-                    if line_num < len(lines):
-                        split_line = lines[line_num]
-                        if split_line.find('(') != -1:
-                            # extract the string which is between '\t(\t' and  '\t)\t'
-                            # cols contains the parameter values for the first function evaluation
-                            cols = re.search('(\t(.*)\t)', split_line).group(1)
-                            col_num = len(cols.split("\t"))
-                    break
-
-        # Now we only consider the first `col_num` in parameters, if col_num is not zero.
-        if col_num != 0:
-            parameters = parameters[:col_num]
-
-        # END BUG FIX 226
-        ##############################################################
-
-        return parameters
-
-    def _write_best_fits(self, files, path_out, filename_out):
-        """
-        Write the final estimates to filename_out
-
-        :param files: the list of Copasi parameter estimation reports
-        :param path_out: the path to store the file combining the final (best) estimates (filename_out)
-        :param filename_out: the file containing the final (best) estimates
-        """
-        file_num = -1
-        # logger.info("\nCollecting results:")
-        with open(os.path.join(path_out, filename_out), 'a') as fileout:
-            for file in files:
-                file_num += 1
-                with open(file, 'r') as filein:
-                    # logger.info(os.path.basename(file))
-                    lines = filein.readlines()
-                    line_num = -1
-                    for line in lines:
-                        line_num += 1
-                        split_line = line.rstrip().split("\t")
-                        # Retrieve the estimated values of the parameters
-                        if len(split_line) > 2 and split_line[0] == '[Function Evaluations]' and \
-                                split_line[1] == '[Best Value]' and split_line[2] == '[Best Parameters]':
-                            # Retrieve the best fit.
-                            best_fit = []
-                            while line_num + 1 < len(lines):
-                                line_num += 1
-                                split_line = lines[line_num].replace("\t(", "").replace("\t)", "").rstrip().split("\t")
-                                if len(split_line) == 1:
-                                    break
-                                best_fit = split_line
-                            # print(best_fit)
-                            fileout.write('\t'.join(map(str, best_fit)) + '\n')
-                            break
-
-    def _write_all_fits(self, files, path_out, filename_out):
-        """
-        Write all the estimates to filename_out
-
-        :param files: the list of Copasi parameter estimation reports
-        :param path_out: the path to store the file combining all the estimates
-        :param filename_out: the file containing all the estimates
-        """
-        file_num = -1
-        # logger.info("\nCollecting results:")
-        with open(os.path.join(path_out, filename_out), 'a') as fileout:
-            for file in files:
-                file_num += 1
-                with open(file, 'r') as filein:
-                    # logger.info(os.path.basename(file))
-                    lines = filein.readlines()
-                    line_num = -1
-                    for line in lines:
-                        line_num += 1
-                        split_line = line.rstrip().split("\t")
-                        # Retrieve the estimated values of the parameters
-                        if len(split_line) > 2 and split_line[0] == '[Function Evaluations]' and \
-                                split_line[1] == '[Best Value]' and split_line[2] == '[Best Parameters]':
-                            # retrieve all fits
-                            while line_num + 1 < len(lines):
-                                line_num += 1
-                                split_line = lines[line_num].replace("\t(", "").replace("\t)", "").rstrip().split("\t")
-                                if len(split_line) == 1:
-                                    break
-                                # print(split_line[1:])
-                                fileout.write('\t'.join(map(str, split_line[1:])) + '\n')
-                            break
+        if not os.path.isfile(report):
+            return False
+        fits = -1
+        with open(report, 'r') as file:
+            for line in file:
+                if fits < 0:
+                    if line.startswith('[Function Evaluations]'):
+                        fits = 0
+                elif len(line.replace("\t(", "").replace("\t)", "").rstrip().split("\t")) == 1:
+                    # the line after the last estimate
+                    return fits > 0
+                else:
+                    fits += 1
+        return False
+
+    def _get_fits_reader(self):
+        __doc__ = Simul._get_fits_reader.__doc__
+
+        return read_copasi_fits
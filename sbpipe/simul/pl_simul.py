@@ -22,16 +22,156 @@
 # SOFTWARE.
 
 
+import json
 import logging
+import multiprocessing.util
 import os
+import random
 import re
+import subprocess
+import sys
+import tempfile
+from sbpipe.utils.cache import get_executable_id
 from sbpipe.utils.dependencies import which
-from sbpipe.utils.parcomp import parcomp
+from sbpipe.utils.parcomp import JOBS_FILE, parcomp, run_funcs_local
 from ..simul import Simul
 
 logger = logging.getLogger('sbpipe')
 
 
+# If the option resident_model is set and cluster is local, SBpipe starts the model as
+# `lang options model SERVE_ARG` once per worker process and writes one JSON line per run
+# to its standard input: {"report": report_filename, "seed": seed}. After writing the report, the model writes
+# the JSON line {"status": 0} to its standard output, or {"status": 1, "error": message} if the run failed.
+# Other output lines are messages of the model. The model exits when its standard input is closed.
+# Otherwise, models are executed once per run: lang options model report_filename
+SERVE_ARG = '--sbpipe-serve'
+
+# The resident models started by this process, indexed by command
+_residents = dict()
+
+
+def _parse_reply(line):
+    """
+    Parse a reply of a resident model.
+
+    :param line: a line of the standard output of the model (bytes)
+    :return: the reply as dictionary, or None if the line is not a reply
+    """
+    try:
+        reply = json.loads(line.decode('utf-8'))
+    except ValueError:
+        return None
+    if isinstance(reply, dict) and 'status' in reply:
+        return reply
+    return None
+
+
+class ResidentModel(object):
+    """
+    A model process serving many runs with the resident protocol.
+    """
+
+    def __init__(self, args):
+        """
+        Start the model process.
+
+        :param args: the command starting the model, as list of arguments
+        """
+        # the standard error is written to a file, so that the model is never blocked by a full pipe.
+        # The model inherits the thread limits and the CPUs of the worker process (see init_worker)
+        self._stderr = tempfile.TemporaryFile()
+        self._stderr_pos = 0
+        self._proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._stderr)
+        logger.debug('Started resident model ' + ' '.join(args) + ' with pid ' + str(self._proc.pid))
+
+    def is_alive(self):
+        """
+        Return whether the model process is running
+
+        :return: True if the model process is running
+        """
+        return self._proc.poll() is None
+
+    def run(self, report_filename, seed):
+        """
+        Request a run and wait for its reply. The messages of the model are written to the standard output
+        and error of this process. A RuntimeError is raised if the run failed.
+
+        :param report_filename: the report file to generate
+        :param seed: the seed for the random number generator
+        """
+        request = json.dumps({'report': report_filename, 'seed': seed}) + '\n'
+        try:
+            try:
+                self._proc.stdin.write(request.encode('utf-8'))
+                self._proc.stdin.flush()
+            except (IOError, OSError):
+                raise RuntimeError('The resident model is not running')
+            for line in iter(self._proc.stdout.readline, b''):
+                reply = _parse_reply(line)
+                if reply is None:
+                    sys.stdout.write(line.decode('utf-8', 'replace'))
+                elif reply['status'] != 0:
+                    raise RuntimeError('The resident model failed: ' + str(reply.get('error', reply['status'])))
+                else:
+                    return
+            raise RuntimeError('The resident model terminated with exit status ' + str(self._proc.wait()))
+        finally:
+            self._forward_stderr()
+
+    def close(self):
+        """
+        Close the standard input of the model and wait for its termination.
+        """
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._stderr.close()
+
+    def _forward_stderr(self):
+        """
+        Write the standard error of the model since the last call to the standard error of this process.
+        """
+        self._stderr.seek(self._stderr_pos)
+        err = self._stderr.read()
+        self._stderr_pos += len(err)
+        if err:
+            sys.stderr.write(err.decode('utf-8', 'replace'))
+
+
+def run_resident(args, report_filename, seed):
+    """
+    Run a model with the resident protocol. The model is started once per process, and is started again
+    if it terminated or its file changed.
+
+    :param args: the command starting the model, as list of arguments. The model file is the penultimate argument
+    :param report_filename: the report file to generate
+    :param seed: the seed for the random number generator
+    """
+    key = tuple(args)
+    mtime = os.path.getmtime(args[-2])
+    if not _residents:
+        # the models are closed when the worker process exits
+        multiprocessing.util.Finalize(None, close_residents, exitpriority=10)
+    if key in _residents:
+        resident_mtime, resident = _residents[key]
+        if resident_mtime != mtime or not resident.is_alive():
+            resident.close()
+            del _residents[key]
+    if key not in _residents:
+        _residents[key] = (mtime, ResidentModel(args))
+    _residents[key][1].run(report_filename, seed)
+
+
+def close_residents():
+    """
+    Close the resident models started by this process.
+    """
+    for mtime, resident in _residents.values():
+        resident.close()
+    _residents.clear()
+
+
 class PLSimul(Simul):
     """
     A generic simulator for models coded in a programming language.
@@ -43,7 +183,7 @@ class PLSimul(Simul):
                  options=""):
         """
         A constructor for a simulator of models coded in a programming language
-        :param lang: the programming language name (e.g. python, Copasi)
+        :param lang: the programming language name (e.g. python, Rscript)
         :param lang_err_msg: the message to print if lang is not found.
         :param options: the options to use when invoking the command (e.g. "" for python).
         """
@@ -52,9 +192,10 @@ class PLSimul(Simul):
         self._language = which(lang)
         self._language_not_found_msg = lang_err_msg
         self._options = options
-        logger.debug("Invoking simulator " + self._language + " with options " + self._options)
         if self._language is None:
             logger.error(self._language_not_found_msg)
+        else:
+            logger.debug("Invoking simulator " + self._language + " with options " + self._options)
 
     def get_lang(self):
         """
@@ -80,13 +221,16 @@ class PLSimul(Simul):
     def sim(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False):
         __doc__ = Simul.sim.__doc__
 
-        return self._run_par_comput(model, inputdir, outputdir, cluster, local_cpus, runs, output_msg)
+        if not self._run_replicas(model, inputdir, outputdir, cluster, local_cpus, runs, output_msg):
+            return False
+        self.sim_postproc(model, outputdir)
+        return True
 
     def ps1(self, model, scanned_par, simulate_intervals,
             single_param_scan_intervals, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False):
         __doc__ = Simul.ps1.__doc__
 
-        if not self._run_par_comput(inputdir, model, outputdir, cluster, local_cpus, runs, output_msg):
+        if not self._run_replicas(model, inputdir, outputdir, cluster, local_cpus, runs, output_msg):
             return False
         self.ps1_postproc(model, scanned_par, simulate_intervals, single_param_scan_intervals, outputdir)
         return True
@@ -94,7 +238,7 @@ class PLSimul(Simul):
     def ps2(self, model, sim_length, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False):
         __doc__ = Simul.ps2.__doc__
 
-        if not self._run_par_comput(inputdir, model, outputdir, cluster, local_cpus, runs, output_msg):
+        if not self._run_replicas(model, inputdir, outputdir, cluster, local_cpus, runs, output_msg):
             return False
         self.ps2_postproc(model, sim_length, outputdir)
         return True
@@ -102,15 +246,34 @@ class PLSimul(Simul):
     def pe(self, model, inputdir, cluster, local_cpus, runs, outputdir, sim_data_dir, output_msg=False):
         __doc__ = Simul.pe.__doc__
 
-        return self._run_par_comput(model, inputdir, sim_data_dir, cluster, local_cpus, runs, output_msg)
+        return self._run_replicas(model, inputdir, sim_data_dir, cluster, local_cpus, runs, output_msg,
+                                  self.is_fits_report_complete)
 
-    def _run_par_comput(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False):
+    def _get_cache_settings(self):
+        __doc__ = Simul._get_cache_settings.__doc__
+
+        settings = Simul._get_cache_settings(self)
+        settings['executable'] = get_executable_id(self._language)
+        settings['options'] = self._options
+        return settings
+
+    def _run_par_comput(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False,
+                        iter_ids=None):
         __doc__ = Simul._run_par_comput.__doc__
 
         if self._language is None:
             logger.error(self._language_not_found_msg)
             return False
 
+        model_path = os.path.abspath(os.path.join(inputdir, model))
+        if cluster == "local" and self._resident_model:
+            # job timeouts and spooled output require a process per run
+            if self._timeout is not None or self._spool_output:
+                logger.error("The option `resident_model` cannot be used together with the options `job_timeout`, "
+                             "`job_timeout_median` or `spool_output`. Please, check your configuration file.")
+                return False
+            return self._run_resident(model, model_path, outputdir, local_cpus, runs, output_msg, iter_ids)
+
         model_group = self._get_model_group(model)
 
         # run in parallel
@@ -125,29 +288,56 @@ class PLSimul(Simul):
         command = self._language + opts + os.path.join(inputdir, model) + \
                   " " + model_group + str_to_replace + ".csv"
         command = command.replace('\\', '\\\\')
-        if not parcomp(command, str_to_replace, outputdir, cluster, runs, local_cpus, output_msg):
+        if not parcomp(command, str_to_replace, outputdir, cluster, runs, local_cpus, output_msg,
+                       colnames=iter_ids or [], replicas_per_job=self._replicas_per_job, history=self._history,
+                       timeout=self._timeout, spool_output=self._spool_output,
+                       cpus_per_job=self._cpus_per_job, pin_cpus=self._pin_cpus, max_memory=self._max_memory):
             return False
         if not self._move_reports('.', outputdir, model, self._groupid):
             return False
         return True
 
-    def replace_str_in_report(self, report):
-        __doc__ = Simul.replace_str_in_report.__doc__
+    def _run_resident(self, model, model_path, outputdir, local_cpus=1, runs=1, output_msg=False, iter_ids=None):
+        """
+        Run a model implementing the resident protocol locally. Each worker process starts the model once
+        and requests all its runs to it. The worker processes are not shared with other computations, so
+        that the models are closed when this returns.
 
-        # `with` ensures that the file is closed correctly
+        :param model: the model to process
+        :param model_path: the model file with its path
+        :param outputdir: the directory to store the results
+        :param local_cpus: the number of cpus
+        :param runs: the number of runs to perform
+        :param output_msg: print the output messages on screen
+        :param iter_ids: the list of replica indexes (as strings) to run. If None, all the runs are performed
+        :return: True if the computation succeeded.
+        """
+        logger.debug("Running " + model + " as resident model within the worker processes")
+        args = [self._language] + self._options.split() + [model_path, SERVE_ARG]
+        model_group = self._get_model_group(model)
+        rand = random.SystemRandom()
+        if iter_ids is None:
+            iter_ids = [str(i+1) for i in range(0, runs)]
+        args_list = []
+        for iter_id in iter_ids:
+            seed = rand.randint(0, 2**31 - 1)
+            logger.debug("Run " + iter_id + ": seed " + str(seed))
+            args_list.append((args, os.path.abspath(model_group + iter_id + ".csv"), seed))
+        if not run_funcs_local(run_resident, args_list, local_cpus, output_msg, os.path.join(outputdir, JOBS_FILE),
+                               self._replicas_per_job, self._max_memory, self._history, self._cpus_per_job,
+                               self._pin_cpus, private_pool=True):
+            return False
+        if not self._move_reports('.', outputdir, model, self._groupid):
+            return False
+        return True
+
+    def _clean_report_header(self, header):
+        __doc__ = Simul._clean_report_header.__doc__
+
+        # First remove non-alphanumerics and non-underscores.
+        # Then replaces whites with TAB.
+        # Finally use rstrip to remove the TAB at the end.
+        # [^\w] matches anything that is not alphanumeric or underscore
+        header = header.replace("\"", "").replace("time", "Time")
         # re.sub(pattern, replace, string) is the equivalent of s/pattern/replace/ in sed.
-        with open(report, "r") as file:
-            lines = file.readlines()
-        with open(report, "w") as file:
-            # for idx, line in lines:
-            for i in range(len(lines)):
-                if i < 1:
-                    # First remove non-alphanumerics and non-underscores.
-                    # Then replaces whites with TAB.
-                    # Finally use rstrip to remove the TAB at the end.
-                    # [^\w] matches anything that is not alphanumeric or underscore
-                    lines[i] = lines[i].replace("\"", "").replace("time", "Time")
-                    file.write(
-                        re.sub(r"\s+", '\t', re.sub(r'[^\w]', " ", lines[i])).rstrip('\t') + '\n')
-                else:
-                    file.write(lines[i].rstrip('\t'))
+        return re.sub(r"\s+", '\t', re.sub(r'[^\w]', " ", header)).rstrip('\t') + '\n'
@@ -22,12 +22,82 @@
 # SOFTWARE.
 
 
+import ast
 import logging
+import os
+import random
+import re
+import sys
+from sbpipe.utils.parcomp import JOBS_FILE, run_funcs_local
 from ..pl_simul import PLSimul
 
 logger = logging.getLogger('sbpipe')
 
 
+# A model defining this function at module level is imported once per worker process and the function
+# is called for each run as sbpipe_simulate(report_filename, seed). This avoids starting a new
+# Python interpreter for each run. Other models, and all models if the jobs have a timeout, are executed
+# as scripts: python model.py report_filename
+ENTRY_FUNCTION = 'sbpipe_simulate'
+
+# The model modules imported by this process
+_models = dict()
+
+
+def has_entry_function(model_path):
+    """
+    Check whether a Python model defines ENTRY_FUNCTION at module level. The model is not executed.
+
+    :param model_path: the model file with its path
+    :return: True if the model defines ENTRY_FUNCTION
+    """
+    try:
+        with open(model_path) as model_file:
+            tree = ast.parse(model_file.read(), model_path)
+    except (IOError, SyntaxError):
+        return False
+    return any(isinstance(node, ast.FunctionDef) and node.name == ENTRY_FUNCTION for node in tree.body)
+
+
+def load_model(model_path):
+    """
+    Import a Python model as module. The model is imported once per process, unless its file changes.
+
+    :param model_path: the model file with its path
+    :return: the model module
+    """
+    key = (model_path, os.path.getmtime(model_path))
+    if key not in _models:
+        name = 'sbpipe_model_' + re.sub(r'\W', '_', os.path.splitext(os.path.basename(model_path))[0])
+        # as for scripts, the model folder is the first path for searching modules
+        sys.path.insert(0, os.path.dirname(model_path))
+        try:
+            if sys.version_info > (3,):
+                import importlib.util
+                spec = importlib.util.spec_from_file_location(name, model_path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            else:
+                import imp
+                module = imp.load_source(name, model_path)
+        finally:
+            sys.path.remove(os.path.dirname(model_path))
+        logger.debug('Loaded Python model ' + model_path)
+        _models[key] = module
+    return _models[key]
+
+
+def run_model(model_path, report_filename, seed):
+    """
+    Run a Python model defining ENTRY_FUNCTION.
+
+    :param model_path: the model file with its path
+    :param report_filename: the report file to generate
+    :param seed: the seed for the random number generator
+    """
+    getattr(load_model(model_path), ENTRY_FUNCTION)(report_filename, seed)
+
+
 class Python(PLSimul):
     """
     Python Simulator.
@@ -39,3 +109,31 @@ class Python(PLSimul):
         PLSimul.__init__(self, "python", "Python not found! Please check that python is installed.", "")
         if self._language is None:
             logger.error(self._language_not_found_msg)
+
+    def _run_par_comput(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False,
+                        iter_ids=None):
+        __doc__ = PLSimul._run_par_comput.__doc__
+
+        model_path = os.path.abspath(os.path.join(inputdir, model))
+        # a function call cannot be stopped, so job timeouts require a process per run
+        if cluster != "local" or self._timeout is not None or not has_entry_function(model_path):
+            return PLSimul._run_par_comput(self, model, inputdir, outputdir, cluster, local_cpus, runs, output_msg,
+                                           iter_ids)
+
+        logger.debug("Running " + ENTRY_FUNCTION + "() in " + model + " within the worker processes")
+        model_group = self._get_model_group(model)
+        rand = random.SystemRandom()
+        if iter_ids is None:
+            iter_ids = [str(i+1) for i in range(0, runs)]
+        args_list = []
+        for iter_id in iter_ids:
+            seed = rand.randint(0, 2**31 - 1)
+            logger.debug("Run " + iter_id + ": seed " + str(seed))
+            args_list.append((model_path, model_group + iter_id + ".csv", seed))
+        if not run_funcs_local(run_model, args_list, local_cpus, output_msg, os.path.join(outputdir, JOBS_FILE),
+                               self._replicas_per_job, self._max_memory, self._history, self._cpus_per_job,
+                               self._pin_cpus):
+            return False
+        if not self._move_reports('.', outputdir, model, self._groupid):
+            return False
+        return True
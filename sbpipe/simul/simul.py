@@ -27,12 +27,58 @@ import os
 import glob
 import shutil
 import re
-from itertools import islice
+from io import StringIO
+from itertools import chain, islice
 from sbpipe.utils.re_utils import nat_sort_key
 from sbpipe.utils.rand import get_rand_alphanum_str
+from sbpipe.utils.io import remove_file_silently, rewrite_report_header
+from sbpipe.utils.columnar import COLUMNAR_FORMATS, TSV_FORMAT, get_columnar_filename, is_result_format, \
+    remove_columnar, write_columnar, write_columnar_collection
+from sbpipe.utils.ps2_index import INDEXED_LAYOUT, PS2_LAYOUTS, SPLIT_LAYOUT, get_ps2_index_filename, \
+    read_ps2_index, read_ps2_timepoint_lines, write_ps2_index
+from sbpipe.utils.parcomp import JOBS_FILE, map_local, read_job_records
+from sbpipe.utils.cache import get_cache_key
+from sbpipe.utils.tracing import traced
 
 logger = logging.getLogger('sbpipe')
 
+# The maximum number of characters buffered while splitting a double parameter scan report.
+PS2_BUFFER_SIZE = 64 * 1024 * 1024
+
+
+def _read_fits_job(params):
+    """
+    Read the fits of a parameter estimation report. This is executed by the worker processes.
+
+    :param params: a tuple (the module level function reading the report, parameter estimation report)
+    :return: the tuple returned by the function reading the report (see read_fits())
+    """
+    reader, filein = params
+    return reader(filein)
+
+
+def read_fits(filein):
+    """
+    Read a parameter estimation report in a single pass. The report is a table whose header
+    contains the objective value followed by the parameter names.
+
+    :param filein: a parameter estimation report
+    :return: a tuple (parameters, best_fit, all_fits). parameters is the list of parameter names, best_fit is the
+    line of the final estimate (None if the report is empty), and all_fits is the list of lines of all the
+    estimates.
+    """
+    all_fits = []
+    with open(filein, 'r') as my_file:
+        header = next(my_file, '')
+        for line in my_file:
+            all_fits.append(line)
+    if not header:
+        return [], None, []
+    parameters = header.strip('\n').split('\t')[1:]
+    # the final estimate is on the last line
+    best_fit = os.path.basename(filein) + '\t' + (all_fits[-1] if all_fits else header)
+    return parameters, best_fit, all_fits
+
 
 class Simul(object):
     """
@@ -47,6 +93,277 @@ class Simul(object):
         A string identifier to attach to the generated file names so that they can be recognised using pattern matching.
         """
         self._groupid = "_" + get_rand_alphanum_str(20) + "_"
+        """
+        The format of the result files. If this is a columnar format, each collection of tab-separated result
+        files is also stored in one file in this format.
+        """
+        self._result_format = TSV_FORMAT
+        """
+        The layout of the double parameter scan results (split or indexed).
+        """
+        self._ps2_layout = SPLIT_LAYOUT
+        """
+        The cache of simulated reports (a ResultCache), or None if reports are not cached.
+        """
+        self._cache = None
+        """
+        True if the replicas with a complete report in the output folder should not be run again.
+        """
+        self._resume = False
+        """
+        The number of contiguous replicas run in sequence by each job.
+        """
+        self._replicas_per_job = 1
+        """
+        The JobHistory of the model, or None if the job durations are not recorded.
+        """
+        self._history = None
+        """
+        The JobTimeout of the local jobs, or None if the jobs have no timeout.
+        """
+        self._timeout = None
+        """
+        True if the output of the local jobs is spooled to files.
+        """
+        self._spool_output = False
+        """
+        The number of CPUs of each local job. If 0, the available CPUs are shared among the local jobs.
+        """
+        self._cpus_per_job = 0
+        """
+        True if each local job runs on a disjoint set of CPUs.
+        """
+        self._pin_cpus = False
+        """
+        The memory ceiling of the concurrent local jobs in MB if local_cpus is `auto`. If 0, a fraction of
+        the available memory is used.
+        """
+        self._max_memory = 0
+        """
+        True if the model implements the resident protocol and serves many local runs within one process.
+        """
+        self._resident_model = False
+
+    def get_result_format(self):
+        """
+        Return the format of the result files.
+
+        :return: the result format (tsv, parquet, feather, or hdf5)
+        """
+        return self._result_format
+
+    def set_result_format(self, result_format):
+        """
+        Set the format of the result files. Tab-separated files are always generated. If result_format is
+        a columnar format, the simulated time courses, the parameter scan tables and each parameter estimation
+        collection are also written to one file per pipeline in this format (see get_collection_filename).
+
+        :param result_format: the result format (tsv, parquet, feather, or hdf5)
+        :raise: ValueError if the result format is not supported.
+        """
+        if not is_result_format(result_format):
+            raise ValueError('result_format `' + str(result_format) + '` is not supported. Use one of: ' +
+                             ', '.join([TSV_FORMAT] + sorted(COLUMNAR_FORMATS)))
+        self._result_format = result_format
+
+    def get_ps2_layout(self):
+        """
+        Return the layout of the double parameter scan results.
+
+        :return: the layout (split or indexed)
+        """
+        return self._ps2_layout
+
+    def set_ps2_layout(self, ps2_layout):
+        """
+        Set the layout of the double parameter scan results. If ps2_layout is split, each replica is split into
+        one file per time point. If ps2_layout is indexed, each replica is stored in one file with an index of
+        its time point blocks.
+
+        :param ps2_layout: the layout (split or indexed)
+        :raise: ValueError if the layout is not supported.
+        """
+        if ps2_layout not in PS2_LAYOUTS:
+            raise ValueError('ps2_layout `' + str(ps2_layout) + '` is not supported. Use one of: ' +
+                             ', '.join(PS2_LAYOUTS))
+        self._ps2_layout = ps2_layout
+
+    def get_cache(self):
+        """
+        Return the cache of simulated reports.
+
+        :return: the ResultCache, or None if reports are not cached
+        """
+        return self._cache
+
+    def set_cache(self, cache):
+        """
+        Set the cache of simulated reports. Time courses and parameter scans found in the cache
+        are linked into the output folder instead of being simulated again.
+
+        :param cache: the ResultCache, or None if reports should not be cached
+        """
+        self._cache = cache
+
+    def get_resume(self):
+        """
+        Return the resume mode.
+
+        :return: True if the replicas with a complete report are not run again
+        """
+        return self._resume
+
+    def set_resume(self, resume):
+        """
+        Set the resume mode. In resume mode, the reports in the output folder are checked and only
+        the missing or incomplete replicas are run. This applies to time courses and parameter estimations.
+
+        :param resume: True if the replicas with a complete report should not be run again
+        """
+        self._resume = resume
+
+    def get_replicas_per_job(self):
+        """
+        Return the number of contiguous replicas run in sequence by each job.
+
+        :return: the number of replicas per job
+        """
+        return self._replicas_per_job
+
+    def set_replicas_per_job(self, replicas_per_job):
+        """
+        Set the number of contiguous replicas run in sequence by each job. On clusters, this reduces
+        the number of submitted jobs. Each replica still generates its own report and job record.
+
+        :param replicas_per_job: the number of replicas per job
+        :raise: ValueError if replicas_per_job is lower than 1.
+        """
+        if int(replicas_per_job) < 1:
+            raise ValueError('replicas_per_job must be greater than 0.')
+        self._replicas_per_job = int(replicas_per_job)
+
+    def get_job_history(self):
+        """
+        Return the history of the job durations.
+
+        :return: the JobHistory, or None if the job durations are not recorded
+        """
+        return self._history
+
+    def set_job_history(self, history):
+        """
+        Set the history of the job durations. Local jobs are dispatched longest-expected-first and
+        the remaining time of the computation is estimated from the past durations.
+
+        :param history: the JobHistory, or None if the job durations should not be recorded
+        """
+        self._history = history
+
+    def get_job_timeout(self):
+        """
+        Return the timeout of the local jobs.
+
+        :return: the JobTimeout, or None if the jobs have no timeout
+        """
+        return self._timeout
+
+    def set_job_timeout(self, timeout):
+        """
+        Set the timeout of the local jobs. A timed out job is killed and run again up to the number of
+        retries of the timeout. The reports of the replicas which still time out are removed.
+
+        :param timeout: the JobTimeout, or None if the jobs should not have a timeout
+        """
+        self._timeout = timeout
+
+    def get_spool_output(self):
+        """
+        Return the spool mode of the output of the local jobs.
+
+        :return: True if the output of the local jobs is spooled to files
+        """
+        return self._spool_output
+
+    def set_spool_output(self, spool_output):
+        """
+        Set the spool mode of the output of the local jobs. If True, the standard output and error of each job
+        are written to the folders out/ and err/ of the output folder and only their final part is kept in memory.
+
+        :param spool_output: True if the output of the local jobs should be spooled to files
+        """
+        self._spool_output = spool_output
+
+    def get_cpus_per_job(self):
+        """
+        Return the number of CPUs of each local job.
+
+        :return: the number of CPUs. If 0, the available CPUs are shared among the local jobs
+        """
+        return self._cpus_per_job
+
+    def set_cpus_per_job(self, cpus_per_job):
+        """
+        Set the number of CPUs of each local job. This limits the threads started by the numerical
+        libraries of each job (e.g. BLAS, OpenMP).
+
+        :param cpus_per_job: the number of CPUs. If 0, the available CPUs are shared among the local jobs
+        """
+        if int(cpus_per_job) < 0:
+            raise ValueError('cpus_per_job cannot be negative.')
+        self._cpus_per_job = int(cpus_per_job)
+
+    def get_pin_cpus(self):
+        """
+        Return the CPU pinning mode of the local jobs.
+
+        :return: True if each local job runs on a disjoint set of CPUs
+        """
+        return self._pin_cpus
+
+    def set_pin_cpus(self, pin_cpus):
+        """
+        Set the CPU pinning mode of the local jobs. This is only available on Linux.
+
+        :param pin_cpus: True if each local job should run on a disjoint set of CPUs
+        """
+        self._pin_cpus = pin_cpus
+
+    def get_max_memory(self):
+        """
+        Return the memory ceiling of the concurrent local jobs.
+
+        :return: the memory ceiling in MB. If 0, a fraction of the available memory is used
+        """
+        return self._max_memory
+
+    def set_max_memory(self, max_memory):
+        """
+        Set the memory ceiling of the concurrent local jobs. This applies if local_cpus is `auto`, so that
+        the number of concurrent jobs is bounded by their peak memory.
+
+        :param max_memory: the memory ceiling in MB. If 0, a fraction of the available memory is used
+        """
+        if int(max_memory) < 0:
+            raise ValueError('max_memory cannot be negative.')
+        self._max_memory = int(max_memory)
+
+    def get_resident_model(self):
+        """
+        Return whether the model serves many local runs within one process.
+
+        :return: True if the model implements the resident protocol
+        """
+        return self._resident_model
+
+    def set_resident_model(self, resident_model):
+        """
+        Set whether the model implements the resident protocol, so that each local worker process starts
+        the model once and requests all its runs to it. This applies to the models coded in a programming
+        language (see sbpipe.simul.pl_simul), and cannot be used together with a job timeout or spooled output.
+
+        :param resident_model: True if the model implements the resident protocol
+        """
+        self._resident_model = resident_model
 
     def sim(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False):
         """
@@ -127,78 +444,173 @@ class Simul(object):
         return line
 
 
-    def get_best_fits(self, path_in=".", path_out=".", filename_out="final_estimates.csv"):
+    def get_best_fits(self, path_in=".", path_out=".", filename_out="final_estimates.csv", local_cpus=1):
         """
         Collect the final parameter estimates. Results
-        are stored in filename_out.
+        are stored in filename_out (see get_fits()).
 
         :param path_in: the path to the input files
         :param path_out: the path to the output files
         :param filename_out: a global file containing the best fits from independent parameter estimations.
+        :param local_cpus: the number of cpus used to read the reports
         :return: the number of retrieved files
         """
-        logger.debug('PE post-processing: Simul.get_best_fits()')
-
-        # The path containing the results .csv files
-        path = path_in
-        # The collection of .csv files
-        files = self._get_input_files(path)
-        if len(files) == 0:
-            logger.error('No report was found.')
-            return 0
-        # List of estimated parameters
-        col_names = self._get_params_list(files[0])
-        logger.debug('Estimated parameters: ' + str(col_names))
-        if len(col_names) == 0:
-            logger.error('No parameter was found in the report file.')
-            return 0
-        # we replace ' ' and '-' with '_' in the parameter names
-        col_names = [name.replace(' ', '_').replace('-', '_').replace('.','_').replace('(', '').replace(')', '')
-                     for name in col_names]
-        col_names.insert(0, 'Estimation')
-        col_names.insert(1, 'ObjectiveValue')
-        self._write_params(col_names, path_out, filename_out)
-        self._write_best_fits(files, path_out, filename_out)
-        return len(files)
+        return self.get_fits(path_in, path_out, best_fits_filename_out=filename_out, all_fits_filename_out=None,
+                             local_cpus=local_cpus)
 
-    def get_all_fits(self, path_in=".", path_out=".", filename_out="all_estimates.csv"):
+    def get_all_fits(self, path_in=".", path_out=".", filename_out="all_estimates.csv", local_cpus=1):
         """
         Collect all the parameter estimates. Results
-        are stored in filename_out.
+        are stored in filename_out (see get_fits()).
 
         :param path_in: the path to the input files
         :param path_out: the path to the output files
         :param filename_out: a global file containing all fits from independent parameter estimations.
+        :param local_cpus: the number of cpus used to read the reports
+        :return: the number of retrieved files
+        """
+        return self.get_fits(path_in, path_out, best_fits_filename_out=None, all_fits_filename_out=filename_out,
+                             local_cpus=local_cpus)
+
+    @traced()
+    def get_fits(self, path_in=".", path_out=".", best_fits_filename_out="final_estimates.csv",
+                 all_fits_filename_out="all_estimates.csv", local_cpus=1, incremental=False):
+        """
+        Collect the final parameter estimates and all the parameter estimates. Each report is read once
+        and feeds both the collections. Reports are read concurrently using local_cpus worker processes,
+        whereas results are stored in the order of the reports.
+
+        The collected reports are recorded in a manifest (report name, size, modification time), stored in
+        path_out. In incremental mode, only the reports which are not in the manifest are read and appended to
+        the existing collections. If a collected report was removed or rewritten, all the reports are collected.
+        If one of the collections is not written, the manifest is not written and incremental is ignored.
+
+        :param path_in: the path to the input files
+        :param path_out: the path to the output files
+        :param best_fits_filename_out: a global file containing the best fits from independent parameter estimations.
+        If None, the best fits are not collected.
+        :param all_fits_filename_out: a global file containing all fits from independent parameter estimations.
+        If None, all the fits are not collected.
+        :param local_cpus: the number of cpus used to read the reports
+        :param incremental: True if only the reports which were not collected before should be read
         :return: the number of retrieved files
         """
-        logger.debug('PE post-processing: Simul.get_all_fits()')
+        logger.debug('PE post-processing: Simul.get_fits()')
 
-        # The path containing the results .csv files
-        path = path_in
         # The collection of .csv files
-        files = self._get_input_files(path)
+        files = self._get_input_files(path_in)
         if len(files) == 0:
             logger.error('No report was found.')
             return 0
-        # List of estimated parameters
-        col_names = self._get_params_list(files[0])
-        logger.debug('Estimated parameters: ' + str(col_names))
-        if len(col_names) == 0:
-            logger.error('No parameter was found in the report file.')
-            return 0
-        # we replace ' ' and '-' with '_' in the parameter names
-        col_names = [name.replace(' ', '_').replace('-', '_').replace('.','_').replace('(', '').replace(')', '')
-                     for name in col_names]
-        col_names.insert(0, 'ObjectiveValue')
-        self._write_params(col_names, path_out, filename_out)
-        self._write_all_fits(files, path_out, filename_out)
+        reports = [(os.path.basename(filein),) + self._get_report_stat(filein) for filein in files]
+        manifest = None
+        if best_fits_filename_out is not None and all_fits_filename_out is not None:
+            manifest = os.path.join(path_out, os.path.splitext(best_fits_filename_out)[0] + '_manifest.csv')
+
+        collected = None
+        if incremental and manifest is not None and \
+                os.path.isfile(os.path.join(path_out, best_fits_filename_out)) and \
+                os.path.isfile(os.path.join(path_out, all_fits_filename_out)):
+            collected = self._read_manifest(manifest)
+        if collected is not None:
+            current = dict((report[0], report[1:]) for report in reports)
+            changed = [name for name, stat in collected.items() if current.get(name) != stat]
+            if changed:
+                logger.info(str(len(changed)) + ' collected reports were removed or rewritten. '
+                            'Collecting all the reports.')
+                collected = None
+        # The manifest is removed while the collections are written, so that interrupted
+        # collections are collected from scratch.
+        if manifest is not None:
+            remove_file_silently(manifest)
+
+        if collected is None:
+            files_in = files
+        else:
+            files_in = [filein for filein, report in zip(files, reports) if report[0] not in collected]
+            logger.info('Reports already collected: ' + str(len(files) - len(files_in)))
+
+        results = self._read_reports_fits(files_in, local_cpus)
+        if collected is None:
+            # List of estimated parameters, retrieved from the first report
+            first_fits = next(results)
+            col_names = self._get_col_names(first_fits[0])
+            if len(col_names) == 0:
+                logger.error('No parameter was found in the report file.')
+                results.close()
+                return 0
+            if best_fits_filename_out is not None:
+                self._write_params(['Estimation', 'ObjectiveValue'] + col_names, path_out, best_fits_filename_out)
+            if all_fits_filename_out is not None:
+                self._write_params(['ObjectiveValue'] + col_names, path_out, all_fits_filename_out)
+            results = chain([first_fits], results)
+
+        logger.info("\nCollecting results:")
+        with self._open_collection(path_out, best_fits_filename_out) as best_fits_out, \
+                self._open_collection(path_out, all_fits_filename_out) as all_fits_out:
+            for filein, (_, best_fit, all_fits) in zip(files_in, results):
+                logger.info(os.path.basename(filein))
+                if best_fit is not None:
+                    best_fits_out.write(best_fit)
+                all_fits_out.writelines(all_fits)
+        if manifest is not None:
+            self._write_manifest(manifest, reports)
+        if files_in:
+            for filename_out in (best_fits_filename_out, all_fits_filename_out):
+                if filename_out is not None:
+                    self._write_columnar(os.path.join(path_out, filename_out))
         return len(files)
 
+    def _open_collection(self, path_out, filename_out):
+        """
+        Open a collection of parameter estimates for appending.
+
+        :param path_out: the path to the output files
+        :param filename_out: the collection file. If None, the returned file discards what is written
+        :return: the open file
+        """
+        if filename_out is None:
+            return open(os.devnull, 'w')
+        return open(os.path.join(path_out, filename_out), 'a')
+
+    def _read_reports_fits(self, files, local_cpus=1):
+        """
+        Read the fits of parameter estimation reports using local_cpus worker processes. Only the
+        function reading the reports and the report names are sent to the workers.
+
+        :param files: the list of parameter estimation reports
+        :param local_cpus: the number of cpus used to read the reports
+        :return: a generator of the tuples (parameters, best_fit, all_fits) of the reports, in the order of files
+        """
+        return map_local(_read_fits_job, [(self._get_fits_reader(), filein) for filein in files], local_cpus)
+
+    def _get_fits_reader(self):
+        """
+        Return the module level function reading a parameter estimation report of this simulator.
+        The function receives the report file and returns a tuple (parameters, best_fit, all_fits).
+
+        :return: the function reading a parameter estimation report (see read_fits())
+        """
+        return read_fits
+
+    def _get_col_names(self, parameters):
+        """
+        Return the column names of the estimated parameters in the collections.
+
+        :param parameters: the list of parameter names as read from a report
+        :return: the list of column names
+        """
+        logger.debug('Estimated parameters: ' + str(parameters))
+        # we replace ' ' and '-' with '_' in the parameter names
+        return [name.replace(' ', '_').replace('-', '_').replace('.', '_').replace('(', '').replace(')', '')
+                for name in parameters]
+
     ##########################################################
     # utilities for parallel computation and post processing #
     ##########################################################
 
-    def _run_par_comput(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False):
+    def _run_par_comput(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False,
+                        iter_ids=None):
         """
         Run generic parallel computation.
 
@@ -209,10 +621,118 @@ class Simul(object):
         :param local_cpus: the number of cpus
         :param runs: the number of runs to perform
         :param output_msg: print the output messages on screen (available for cluster='local' only)
+        :param iter_ids: the list of replica indexes (as strings) to run. If None, all the runs are performed
         :return: (groupid, group_model)
         """
         pass
 
+    @traced()
+    def _run_replicas(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False,
+                      is_complete=None):
+        """
+        Run the replicas of a model. In resume mode, the replicas with a complete report in outputdir
+        are not run again. If a cache is set, the cached replicas are linked into outputdir
+        and only the other replicas are simulated and stored in the cache.
+
+        :param model: the model to process
+        :param inputdir: the directory containing the model
+        :param outputdir: the directory to store the results
+        :param cluster: local, lsf for load sharing facility, sge for sun grid engine
+        :param local_cpus: the number of cpus
+        :param runs: the number of runs to perform
+        :param output_msg: print the output messages on screen (available for cluster='local' only)
+        :param is_complete: the function checking whether a report is complete in resume mode.
+        If None, is_report_complete() is used
+        :return: True if the computation succeeded
+        """
+        model_noext = os.path.splitext(model)[0]
+        reports = dict((str(i + 1), os.path.join(outputdir, model_noext + '_' + str(i + 1) + '.csv'))
+                       for i in range(0, runs))
+        iter_ids = [str(i + 1) for i in range(0, runs)]
+
+        if self._resume:
+            if is_complete is None:
+                is_complete = self.is_report_complete
+            iter_ids = [iter_id for iter_id in iter_ids if not is_complete(reports[iter_id])]
+            logger.info(str(runs - len(iter_ids)) + ' of ' + str(runs) + ' replicas already completed')
+            # truncated reports are replaced
+            for iter_id in iter_ids:
+                remove_file_silently(reports[iter_id])
+
+        keys = dict()
+        if self._cache is not None:
+            settings = self._get_cache_settings()
+            for iter_id in iter_ids:
+                keys[iter_id] = get_cache_key(os.path.join(inputdir, model), settings, iter_id)
+            cached = [iter_id for iter_id in iter_ids if self._cache.fetch(keys[iter_id], reports[iter_id])]
+            iter_ids = [iter_id for iter_id in iter_ids if iter_id not in cached]
+            logger.info(str(len(cached)) + ' replicas found in the cache ' + self._cache.get_cache_dir())
+
+        if not iter_ids:
+            return True
+        if not self._run_par_comput(model=model, inputdir=inputdir, outputdir=outputdir, cluster=cluster,
+                                    local_cpus=local_cpus, runs=runs, output_msg=output_msg, iter_ids=iter_ids):
+            return False
+        timed_out = self._get_timed_out_replicas(outputdir, iter_ids)
+        if timed_out:
+            # the reports of killed jobs can be truncated
+            for iter_id in timed_out:
+                remove_file_silently(reports[iter_id])
+            logger.warning('Replicas ' + ', '.join(timed_out) + ' timed out and are missing. '
+                           'These can be run again using the option `resume`.')
+        for iter_id in keys:
+            if iter_id in iter_ids and iter_id not in timed_out and os.path.isfile(reports[iter_id]):
+                self._cache.store(keys[iter_id], reports[iter_id])
+        if keys:
+            self._cache.evict()
+        return True
+
+    def _get_timed_out_replicas(self, outputdir, iter_ids):
+        """
+        Return the replicas whose job timed out, as recorded in the job records of outputdir.
+
+        :param outputdir: the directory containing the results
+        :param iter_ids: the list of replica indexes (as strings) which were run, in order of job id
+        :return: the list of timed out replica indexes
+        """
+        jobs_file = os.path.join(outputdir, JOBS_FILE)
+        if self._timeout is None or not os.path.isfile(jobs_file):
+            return []
+        return [iter_ids[r['Job'] - 1] for r in read_job_records(jobs_file) if r['TimedOut']]
+
+    def is_report_complete(self, report):
+        """
+        Check whether a report was completely written. A report is complete if it contains a header
+        and at least one row, and ends with a new line.
+
+        :param report: the report file
+        :return: True if the report is complete, False otherwise
+        """
+        if not os.path.isfile(report):
+            return False
+        with open(report, 'rb') as myfile:
+            if not myfile.readline() or not myfile.readline().strip():
+                return False
+            myfile.seek(-1, os.SEEK_END)
+            return myfile.read(1) == b'\n'
+
+    def is_fits_report_complete(self, report):
+        """
+        Check whether a parameter estimation report was completely written.
+
+        :param report: the parameter estimation report file
+        :return: True if the report is complete, False otherwise
+        """
+        return self.is_report_complete(report)
+
+    def _get_cache_settings(self):
+        """
+        Return the settings of the simulator affecting the simulated reports. These are part of the cache key.
+
+        :return: a dictionary of settings
+        """
+        return {'simulator': self.__class__.__name__}
+
     def _get_model_group(self, model):
         """
         Return the model without extension concatenated with the groupid string
@@ -221,6 +741,7 @@ class Simul(object):
         """
         return os.path.splitext(model)[0] + self._groupid
 
+    @traced()
     def _move_reports(self, inputdir, outputdir, model, groupid):
         """
         Move the report files
@@ -244,42 +765,103 @@ class Simul(object):
             shutil.move(os.path.join(inputdir, report), os.path.join(outputdir, report.replace(groupid, "_")))
         return True
 
+    def _write_columnar(self, filename):
+        """
+        Write a columnar copy of a tab-separated result file if a columnar result format is set.
+
+        :param filename: the tab-separated result file
+        """
+        if self._result_format in COLUMNAR_FORMATS:
+            write_columnar(filename, self._result_format)
+
+    @staticmethod
+    def get_collection_filename(outputdir, model, result_format):
+        """
+        Return the columnar file storing the collection of the reports of a model.
+
+        :param outputdir: the directory containing the reports
+        :param model: the model name
+        :param result_format: the columnar format (parquet, feather, or hdf5)
+        :return: the columnar file
+        """
+        return get_columnar_filename(os.path.join(outputdir, os.path.splitext(model)[0] + '.csv'), result_format)
+
+    def _write_collection(self, tables, outputdir, model, key_columns):
+        """
+        Write a collection of tab-separated result files to one columnar file if a columnar result format is set.
+        The collections of a previous run are removed otherwise.
+
+        :param tables: a function returning an iterable of tuples (the values of the key columns,
+        the tab-separated file or a file-like object)
+        :param outputdir: the directory containing the reports
+        :param model: the model name
+        :param key_columns: the names of the key columns identifying each table
+        """
+        remove_columnar(os.path.join(outputdir, os.path.splitext(model)[0] + '.csv'))
+        if self._result_format in COLUMNAR_FORMATS:
+            write_columnar_collection(tables(), self.get_collection_filename(outputdir, model, self._result_format),
+                                      self._result_format, key_columns)
+
+    @traced()
     def replace_str_in_report(self, report):
         """
-        Replaces strings in a report file.
+        Replaces strings in a report file. Only the header is rewritten, whereas the body is copied
+        in blocks. The report is left untouched if its header is already clean.
 
         :param report: a report file with its absolute path
         """
+        rewrite_report_header(report, self._clean_report_header)
+
+    def _clean_report_header(self, header):
+        """
+        Replaces strings in the header of a report file.
+
+        :param header: the header line
+        :return: the cleaned header line
+        """
+        # First remove non-alphanumerics and non-underscores.
+        # Then replaces whites with TAB.
+        # Finally use rstrip to remove the TAB at the end.
+        # [^\w] matches anything that is not alphanumeric or underscore
+
+        # global variables
+        header = header.replace("Values[", "").replace(".InitialValue", "")
+        # compartments
+        header = header.replace("Compartments[", "").replace(".InitialVolume", "").replace(".Volume", "")
+        # particle numbers
+        header = header.replace(".InitialParticleNumber", "")
+        # species
+        header = header.replace("Values[", "").replace("]_0", "")
+
+        # we replace ' ' and '-' with '_' in the parameter names
+        header = header.replace('-', '_').replace('.', '_').replace('(', '').replace(')', '')
 
-        # `with` ensures that the file is closed correctly
         # re.sub(pattern, replace, string) is the equivalent of s/pattern/replace/ in sed.
-        with open(report, 'r') as file:
-            lines = file.readlines()
-        with open(report, 'w') as file:
-            # for idx, line in lines:
-            for i in range(len(lines)):
-                if i < 1:
-                    # First remove non-alphanumerics and non-underscores.
-                    # Then replaces whites with TAB.
-                    # Finally use rstrip to remove the TAB at the end.
-                    # [^\w] matches anything that is not alphanumeric or underscore
-
-                    # global variables
-                    lines[i] = lines[i].replace("Values[", "").replace(".InitialValue", "")
-                    # compartments
-                    lines[i] = lines[i].replace("Compartments[", "").replace(".InitialVolume", "").replace(".Volume", "")
-                    # particle numbers
-                    lines[i] = lines[i].replace(".InitialParticleNumber", "")
-                    # species
-                    lines[i] = lines[i].replace("Values[", "").replace("]_0", "")
-
-                    # we replace ' ' and '-' with '_' in the parameter names
-                    lines[i] = lines[i].replace('-', '_').replace('.', '_').replace('(', '').replace(')', '')
-
-                    file.write(
-                        re.sub(r"\s+", '\t', re.sub(r'[^\w]', " ", lines[i])).rstrip('\t') + '\n')
-                else:
-                    file.write(lines[i].rstrip('\t'))
+        return re.sub(r"\s+", '\t', re.sub(r'[^\w]', " ", header)).rstrip('\t') + '\n'
+
+    ####################################################
+    # utilities for collecting time course simulations #
+    ####################################################
+
+    @traced()
+    def sim_postproc(self, model, outputdir):
+        """
+        Perform post processing of time course report files. If a columnar result format is set, the reports
+        are written to one columnar file, where the column Replica contains the replica number.
+
+        :param model: the model to process
+        :param outputdir: the directory containing the report files
+        """
+        logger.debug('Sim post-processing')
+        model_noext = os.path.splitext(model)[0]
+
+        def tables():
+            reports = [f for f in os.listdir(outputdir) if re.match(model_noext + '_[0-9]+.*.csv', f)]
+            for report in sorted(reports, key=nat_sort_key):
+                replica = int(re.match(re.escape(model_noext) + '_([0-9]+)', report).group(1))
+                yield (replica,), os.path.join(outputdir, report)
+
+        self._write_collection(tables, outputdir, model, ['Replica'])
 
     #########################################################
     # utilities for collecting parameter estimation results #
@@ -296,20 +878,47 @@ class Simul(object):
         files.sort(key=nat_sort_key)
         return files
 
-    def _get_params_list(self, filein):
+    def _get_report_stat(self, filein):
         """
-        Return the list of parameter names from filein
+        Return the size and the modification time of a report, used to detect rewritten reports.
 
         :param filein: a report file
-        :return: the list of parameter names
+        :return: a tuple (size, mtime)
         """
-        with open(filein, 'r') as my_file:
-            header = my_file.readline().strip('\n')
-        if not header:
-            return []
-        parameters = header.split('\t')
-        parameters.remove(parameters[0])
-        return parameters
+        stat = os.stat(filein)
+        return stat.st_size, stat.st_mtime
+
+    def _read_manifest(self, manifest):
+        """
+        Read the manifest of the collected reports.
+
+        :param manifest: the manifest file
+        :return: a dictionary mapping each report name to the tuple (size, mtime), or None if the manifest does
+        not exist
+        """
+        if not os.path.isfile(manifest):
+            return None
+        collected = dict()
+        with open(manifest, 'r') as my_file:
+            # skip the header
+            my_file.readline()
+            for line in my_file:
+                name, size, mtime = line.rstrip('\n').split('\t')
+                collected[name] = (int(size), float(mtime))
+        return collected
+
+    def _write_manifest(self, manifest, reports):
+        """
+        Write the manifest of the collected reports.
+
+        :param manifest: the manifest file
+        :param reports: the list of tuples (report name, size, mtime)
+        """
+        with open(manifest, 'w') as my_file:
+            my_file.write('Report\tSize\tMTime\n')
+            for name, size, mtime in reports:
+                # repr() preserves the float precision in Python 2.7
+                my_file.write(name + '\t' + str(size) + '\t' + repr(mtime) + '\n')
 
     def _write_params(self, col_names, path_out, filename_out):
         """
@@ -328,40 +937,14 @@ class Simul(object):
                 else:
                     myfile.write(param + '\n')
 
-    def _write_best_fits(self, files, path_out, filename_out):
+    def _read_fits(self, filein):
         """
-        Write the final estimates to filename_out
-
-        :param files: the list of parameter estimation reports
-        :param path_out: the path to store the file combining the final (best) estimates (filename_out)
-        :param filename_out: the file containing the final (best) estimates
-        """
-        logger.info("\nCollecting results:")
-        with open(os.path.join(path_out, filename_out), 'a') as fileout:
-            for filein in files:
-                with open(filein, 'r') as myfile:
-                    logger.info(os.path.basename(filein))
-                    last_line = myfile.readlines()[-1]
-                    fileout.write(os.path.basename(filein) + '\t' + last_line)
+        Read a parameter estimation report in a single pass, using the function returned by _get_fits_reader().
 
-    def _write_all_fits(self, files, path_out, filename_out):
+        :param filein: a parameter estimation report
+        :return: a tuple (parameters, best_fit, all_fits) (see read_fits())
         """
-        Write all the estimates to filename_out
-
-        :param files: the list of parameter estimation reports
-        :param path_out: the path to store the file combining all the estimates
-        :param filename_out: the file containing all the estimates
-        """
-        # logger.info("\nCollecting results:")
-        with open(os.path.join(path_out, filename_out), 'a') as fileout:
-            for file in files:
-                with open(file, 'r') as filein:
-                    # logger.info(os.path.basename(file))
-                    # skip the first line (header)
-                    filein.readline()
-                    # read the remaining lines
-                    for line in filein:
-                        fileout.write(line)
+        return self._get_fits_reader()(filein)
 
     ##########################################################
     # utilities for collecting single parameter scan results #
@@ -394,6 +977,7 @@ class Simul(object):
         header[-1] = header[-1].strip()
         return header
 
+    @traced()
     def ps1_postproc(self, model, scanned_par, simulate_intervals, single_param_scan_intervals, outputdir):
         """
         Perform post processing organisation to single parameter scan report files.
@@ -408,7 +992,6 @@ class Simul(object):
 
         model_noext = os.path.splitext(model)[0]
         scanned_par_index = -1
-        scanned_par_level = -1
         # Set the number of intervals
         intervals = int(single_param_scan_intervals) + 1
         # Set the number of timepoints
@@ -442,52 +1025,67 @@ class Simul(object):
 
         for i, report in enumerate(report_files):
             logger.debug(report)
+            self.ps1_split_report(report, header, scanned_par_index, timepoints, intervals,
+                                  os.path.join(outputdir, model_noext) + "__rep_" + str(i + 1) + "__level_")
 
-            # Prepare the table content for the output files
-            for j in range(0, intervals):
-                # Read the scanned_par level
-                # Read the second line of a file.
-
-                with open(report, 'r') as myfile:
-                    # 2 is the number of lines to read, 1 is the i-th element to extract from the list.
-                    initial_configuration = list(islice(myfile, 2))[1].replace("\n", "").split('\t')
-                    # print(initial_configuration)
-                    scanned_par_level = initial_configuration[scanned_par_index]
-
-                if scanned_par_level == -1:
-                    logger.error("scanned_par_level not configured!")
-                    return
-                else:
-                    logger.debug(
-                        scanned_par + " level: " + str(scanned_par_level) + " (list index: " + str(
-                            scanned_par_index) + ")")
+        def tables():
+            pattern = re.escape(model_noext) + '__rep_([0-9]+)__level_.*\\.csv$'
+            levels = [f for f in os.listdir(outputdir) if re.match(pattern, f)]
+            for level in sorted(levels, key=nat_sort_key):
+                yield (int(re.match(pattern, level).group(1)),), os.path.join(outputdir, level)
 
-                # copy the -th run to a new file: add 1 to timepoints because of the header.
-                round_scanned_par_level = scanned_par_level
-                # Read the first timepoints+1 lines of a file.
-                with open(report, 'r') as myfile:
-                    table = list(islice(myfile, timepoints + 1))
+        # the scanned level of each row is stored in the column of the scanned parameter
+        self._write_collection(tables, outputdir, model, ['Replica'])
 
-                # Write the extracted table to a separate file
-                with open(os.path.join(outputdir, model_noext) + "__rep_" + str(i + 1) + "__level_" + str(
-                        round_scanned_par_level) + ".csv", 'w') as myfile:
-                    for line in table:
-                        myfile.write(line)
-
-                with open(report, 'r') as myfile:
-                    # read all lines
-                    lines = myfile.readlines()
-
-                with open(report + "~", 'w') as myfile:
-                    myfile.writelines(header)
-                    myfile.writelines(lines[timepoints + 1:])
-
-                shutil.move(report + "~", report)
+    def ps1_split_report(self, report, header, scanned_par_index, timepoints, intervals, fileout_prefix):
+        """
+        Split a single parameter scan report into one file per scanned level. The report is read once
+        and each table is streamed to the file `fileout_prefix + level + '.csv'` as soon as it is found.
+        Blank lines separating the tables are skipped. At the end, the report only contains the header
+        followed by any line exceeding the expected tables.
+
+        :param report: the single parameter scan report
+        :param header: the header as returned by _ps1_header_init()
+        :param scanned_par_index: the column index of the scanned parameter
+        :param timepoints: the number of time points of each table
+        :param intervals: the number of tables (levels) in the report
+        :param fileout_prefix: the prefix of the output files, including the path
+        :return: the number of extracted levels
+        """
+        header_line = ''.join(header)
+        levels = 0
+        with open(report, 'r') as filein, open(report + "~", 'w') as remainder:
+            # skip the header. Only iteration is used on filein, as Python 2.7 does not allow mixing
+            # iteration and read methods.
+            next(filein, '')
+            for j in range(0, intervals):
+                # the first row of the table contains the scanned_par level
+                line = next(filein, '')
+                while line and line.isspace():
+                    line = next(filein, '')
+                if not line:
+                    logger.warning("Report " + report + " contains " + str(levels) + " of " + str(intervals) +
+                                   " expected levels.")
+                    break
+                scanned_par_level = line.replace("\n", "").split('\t')[scanned_par_index]
+                logger.debug(
+                    "level: " + str(scanned_par_level) + " (list index: " + str(scanned_par_index) + ")")
+                # Write the table to a separate file
+                with open(fileout_prefix + str(scanned_par_level) + ".csv", 'w') as fileout:
+                    fileout.write(header_line + '\n')
+                    fileout.write(line)
+                    fileout.writelines(islice(filein, timepoints - 1))
+                levels += 1
+            remainder.write(header_line)
+            remainder.writelines(filein)
+        shutil.move(report + "~", report)
+        return levels
 
     ##########################################################
     # utilities for collecting double parameter scan results #
     ##########################################################
 
+    @traced()
     def ps2_postproc(self, model, sim_length, outputdir):
         """
         Perform post processing organisation to double parameter scan report files.
@@ -509,30 +1107,130 @@ class Simul(object):
 
         for i, report in enumerate(report_files):
             logger.debug(report)
+            fileout_prefix = os.path.join(outputdir, model_noext) + '__rep_' + str(i + 1)
+            if self._ps2_layout == INDEXED_LAYOUT:
+                self.ps2_index_report(report, sim_length, fileout_prefix + '.csv')
+            else:
+                self.ps2_split_report(report, sim_length, fileout_prefix + '__tp_')
+
+        def tables():
+            for i in range(1, len(report_files) + 1):
+                fileout_prefix = os.path.join(outputdir, model_noext) + '__rep_' + str(i)
+                if self._ps2_layout == INDEXED_LAYOUT:
+                    index = read_ps2_index(get_ps2_index_filename(fileout_prefix + '.csv'))
+                    for k in sorted(index):
+                        header, rows = read_ps2_timepoint_lines(fileout_prefix + '.csv', k, index)
+                        yield (i, k), StringIO(header + ''.join(rows))
+                else:
+                    for k in range(0, sim_length + 1):
+                        yield (i, k), fileout_prefix + '__tp_' + str(k) + '.csv'
+
+        self._write_collection(tables, outputdir, model, ['Replica', 'TimePoint'])
 
-            # copy file removing empty lines
-            with open(report, 'r') as filein, \
-                    open(report + "~", 'w') as fileout:
-                for line in filein:
-                    if not line.isspace():
-                        fileout.write(line)
-            shutil.move(report + '~', report)
-
-            # Extract a selected time point from all perturbed time courses contained in the report file
-            with open(report, 'r') as filein:
-                header = filein.readline()
-                timepoints = list(range(0, sim_length + 1))
-                filesout = []
-                try:
-                    filesout = [open(os.path.join(outputdir, model_noext + '__rep_' + str(i+1) + '__tp_%d.csv' % k), 'w') for k in timepoints]
-                    # copy the header
-                    for fileout in filesout:
-                        fileout.write(header)
-                    # extract the i-th time point and copy it to the corresponding i-th file
-                    for line in filein:
-                        tp = line.rstrip().split('\t')[0]
-                        if '.' not in tp and int(tp) in timepoints:
-                            filesout[int(tp)].write(line)
-                finally:
-                    for fileout in filesout:
-                        fileout.close()
+    def ps2_split_report(self, report, sim_length, fileout_prefix, buffer_size=PS2_BUFFER_SIZE):
+        """
+        Split a double parameter scan report into one file per time point (`fileout_prefix + time point + '.csv'`).
+        The report is read once and its blank lines are removed while streaming. Rows are buffered per time point
+        and appended to the output files when the buffered rows exceed buffer_size characters. Therefore, only
+        one output file is open at a time, regardless of sim_length.
+
+        :param report: the double parameter scan report
+        :param sim_length: the length of the simulation
+        :param fileout_prefix: the prefix of the output files, including the path
+        :param buffer_size: the maximum number of characters buffered before writing the output files
+        :return: the list of output files
+        """
+        filesout = [fileout_prefix + str(k) + '.csv' for k in range(0, sim_length + 1)]
+        created = [False] * len(filesout)
+
+        def flush(header, buffers, last):
+            self._ps2_flush_buffers(filesout, header, buffers, created, create_all=last)
+
+        self._ps2_stream_report(report, sim_length, buffer_size, flush)
+        return filesout
+
+    def ps2_index_report(self, report, sim_length, fileout, buffer_size=PS2_BUFFER_SIZE):
+        """
+        Store a double parameter scan report in one file whose rows are grouped by time point, and write
+        the byte offsets of the time point blocks to an index file (see sbpipe.utils.ps2_index).
+        The report is read once and its blank lines are removed while streaming. Rows are buffered per time point
+        and appended to fileout as one block per time point when the buffered rows exceed buffer_size characters.
+
+        :param report: the double parameter scan report
+        :param sim_length: the length of the simulation
+        :param fileout: the output file
+        :param buffer_size: the maximum number of characters buffered before writing the output file
+        :return: the name of the index file
+        """
+        blocks = []
+        with open(fileout, 'wb') as myfile:
+
+            def flush(header, buffers, last):
+                if myfile.tell() == 0:
+                    myfile.write(header.encode('utf-8'))
+                for k, rows in enumerate(buffers):
+                    if not rows:
+                        continue
+                    block = ''.join(rows).encode('utf-8')
+                    blocks.append((k, myfile.tell(), len(block)))
+                    myfile.write(block)
+                    del rows[:]
+
+            self._ps2_stream_report(report, sim_length, buffer_size, flush)
+        index_file = get_ps2_index_filename(fileout)
+        write_ps2_index(index_file, blocks)
+        return index_file
+
+    def _ps2_stream_report(self, report, sim_length, buffer_size, flush):
+        """
+        Remove the blank lines of a double parameter scan report and buffer its rows per time point.
+
+        :param report: the double parameter scan report
+        :param sim_length: the length of the simulation
+        :param buffer_size: the maximum number of characters buffered before calling flush
+        :param flush: the function called with the header, the list of buffered rows per time point, and
+        a flag which is True for the last call. This function must empty the buffers
+        """
+        buffers = [[] for k in range(0, sim_length + 1)]
+        buffered = 0
+        header = ''
+        with open(report, 'r') as filein, open(report + "~", 'w') as fileout:
+            for line in filein:
+                # remove empty lines
+                if line.isspace():
+                    continue
+                fileout.write(line)
+                if not header:
+                    header = line
+                    continue
+                # extract the i-th time point and copy it to the corresponding i-th buffer
+                tp = line.rstrip().split('\t')[0]
+                if '.' not in tp and 0 <= int(tp) <= sim_length:
+                    buffers[int(tp)].append(line)
+                    buffered += len(line)
+                    if buffered > buffer_size:
+                        flush(header, buffers, False)
+                        buffered = 0
+        shutil.move(report + "~", report)
+        flush(header, buffers, True)
+
+    def _ps2_flush_buffers(self, filesout, header, buffers, created, create_all=False):
+        """
+        Append the buffered rows to the time point files and empty the buffers. A file is created with
+        the header the first time it is written.
+
+        :param filesout: the list of time point files
+        :param header: the header of the time point files
+        :param buffers: the list of buffered rows for each time point file
+        :param created: the list of flags, True if the corresponding time point file was created
+        :param create_all: True if the time point files without rows should also be created
+        """
+        for k, rows in enumerate(buffers):
+            if not rows and (created[k] or not create_all):
+                continue
+            with open(filesout[k], 'a' if created[k] else 'w') as fileout:
+                if not created[k]:
+                    fileout.write(header)
+                    created[k] = True
+                fileout.writelines(rows)
+            del rows[:]
@@ -48,8 +48,7 @@ def pe_collect(inputdir,
 
     # Collect and summarises the parameter estimation results
     try:
-        files_num = simulator.get_best_fits(inputdir, outputdir, fileout_final_estims)
-        simulator.get_all_fits(inputdir, outputdir, fileout_all_estims)
+        files_num = simulator.get_fits(inputdir, outputdir, fileout_final_estims, fileout_all_estims)
         # print('Files retrieved: ' + str(files_num))
     except Exception as e:
         print("simulator: " + simulator + " not found.")
@@ -24,7 +24,8 @@
 
 import os
 import shutil
-from sbpipe.utils.io import replace_str_in_file
+from sbpipe.utils.io import read_file_template
+from sbpipe.utils.io import write_file_template
 
 
 def generic_preproc(infile, outfile):
@@ -45,19 +46,10 @@ def copasi_preproc(infile, outfile):
     :param outfile: the output file
     """
 
-    generic_preproc(infile, outfile)
-    replace_str_in_file(outfile,
-                        os.path.splitext(os.path.basename(infile))[0] + ".csv",
-                        os.path.splitext(os.path.basename(outfile))[0] + ".csv")
-    replace_str_in_file(outfile,
-                        os.path.splitext(os.path.basename(infile))[0] + ".txt",
-                        os.path.splitext(os.path.basename(outfile))[0] + ".csv")
-    replace_str_in_file(outfile,
-                        os.path.splitext(os.path.basename(infile))[0] + ".tsv",
-                        os.path.splitext(os.path.basename(outfile))[0] + ".csv")
-    replace_str_in_file(outfile,
-                        os.path.splitext(os.path.basename(infile))[0] + ".dat",
-                        os.path.splitext(os.path.basename(outfile))[0] + ".csv")
+    model_noext = os.path.splitext(os.path.basename(infile))[0]
+    template = read_file_template(infile, [model_noext + ".csv", model_noext + ".txt",
+                                           model_noext + ".tsv", model_noext + ".dat"])
+    write_file_template(outfile, template, os.path.splitext(os.path.basename(outfile))[0] + ".csv")
 
 
 def preproc(infile, outfile, copasi=False):
@@ -75,7 +75,6 @@ def generic_postproc(infile,
     """
 
     scanned_par_index = -1
-    scanned_par_level = -1
     # Set the number of intervals
     intervals = int(single_param_scan_intervals) + 1
     # Set the number of timepoints
@@ -113,46 +112,9 @@ def generic_postproc(infile,
 
     # print(outfile)
 
-    # Prepare the table content for the output files
-    for j in range(0, intervals):
-        # Read the scanned_par level
-        # Read the second line of a file.
-
-        with open(outfile, 'r') as myfile:
-            # 2 is the number of lines to read, 1 is the i-th element to extract from the list.
-            initial_configuration = list(islice(myfile, 2))[1].replace("\n", "").split('\t')
-            # print(initial_configuration)
-            scanned_par_level = initial_configuration[scanned_par_index]
-
-        if scanned_par_level == -1:
-            print("scanned_par_level not configured!")
-            return
-        else:
-            # print(scanned_par + " level: " + str(scanned_par_level) + " (list index: " + str(scanned_par_index) + ")")
-            pass
-
-        # copy the -th run to a new file: add 1 to timepoints because of the header.
-        round_scanned_par_level = scanned_par_level
-        # Read the first timepoints+1 lines of a file.
-        with open(outfile, 'r') as myfile:
-            table = list(islice(myfile, timepoints + 1))
-
-        # Write the extracted table to a separate file
-        filename = os.path.splitext(outfile)[0].replace('_'+rep, '') + \
-            "__rep_" + rep + "__level_" + str(round_scanned_par_level) + ".csv"
-        with open(filename, 'w') as myfile:
-            for line in table:
-                myfile.write(line)
-
-        with open(outfile, 'r') as myfile:
-            # read all lines
-            lines = myfile.readlines()
-
-        with open(outfile + "~", 'w') as myfile:
-            myfile.writelines(header)
-            myfile.writelines(lines[timepoints + 1:])
-
-        shutil.move(outfile + "~", outfile)
+    # Write each table to a separate file
+    fileout_prefix = os.path.splitext(outfile)[0].replace('_'+rep, '') + "__rep_" + rep + "__level_"
+    simulator.ps1_split_report(outfile, header, scanned_par_index, timepoints, intervals, fileout_prefix)
 
 
 def ps1_postproc(infile,
@@ -23,6 +23,7 @@
 
 
 import re
+import shutil
 from sbpipe.simul.copasi import copasi as copasi_simul
 from sbpipe.simul import pl_simul
 
@@ -40,12 +41,7 @@ def generic_postproc(infile,
     :param copasi: True if the model is a Copasi model
     """
 
-    # copy file removing empty lines
-    with open(infile, 'r') as filein, \
-            open(outfile, 'w') as fileout:
-        for line in filein:
-            if not line.isspace():
-                fileout.write(line)
+    shutil.copyfile(infile, outfile)
 
     if copasi:
         simulator = copasi_simul.Copasi()
@@ -53,27 +49,11 @@ def generic_postproc(infile,
         simulator = pl_simul.PLSimul()
     simulator.replace_str_in_report(outfile)
 
-    # Extract a selected time point from all perturbed time courses contained in the report file
-    with open(outfile, 'r') as filein:
-        header = filein.readline()
-        timepoints = list(range(0, sim_length + 1))
-        filesout = []
-        try:
-            rep = re.findall(r'_\d+.csv', outfile)[0]
-
-            filetemplate = outfile.replace(rep, '')
-            filesout = [open(filetemplate + '__rep' + rep[:-4] + '__tp_%d.csv' % k, 'w') for k in timepoints]
-            # copy the header
-            for fileout in filesout:
-                fileout.write(header)
-            # extract the i-th time point and copy it to the corresponding i-th file
-            for line in filein:
-                tp = line.rstrip().split('\t')[0]
-                if '.' not in tp and int(tp) in timepoints:
-                    filesout[int(tp)].write(line)
-        finally:
-            for fileout in filesout:
-                fileout.close()
+    # Extract a selected time point from all perturbed time courses contained in the report file.
+    # Empty lines are removed from outfile in the same pass.
+    rep = re.findall(r'_\d+.csv', outfile)[0]
+    filetemplate = outfile.replace(rep, '')
+    simulator.ps2_split_report(outfile, sim_length, filetemplate + '__rep' + rep[:-4] + '__tp_')
 
 
 def ps2_postproc(infile,
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# A content-addressed cache of simulated reports.
+# Each entry is keyed on a hash of the model file, the simulator and its settings,
+# and the replica index. Entries are hard-linked (or copied) into the output folder
+# instead of running the simulation again. The least recently used entries are
+# removed when the cache exceeds its maximum size.
+
+import hashlib
+import logging
+import os
+import shutil
+from sbpipe.utils.io import remove_file_silently
+
+logger = logging.getLogger('sbpipe')
+
+
+# The default folder of the result cache.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sbpipe', 'cache')
+
+# The default maximum size of the result cache in MB.
+DEFAULT_CACHE_SIZE = 1024
+
+
+def get_cache_key(model_file, settings, replica):
+    """
+    Return the key of a replica in the result cache.
+
+    :param model_file: the model file, including the path
+    :param settings: a dictionary of the settings affecting the simulated report (e.g. simulator and version)
+    :param replica: the replica index
+    :return: the key as a hexadecimal string
+    """
+    h = hashlib.sha256()
+    with open(model_file, 'rb') as filein:
+        for block in iter(lambda: filein.read(1024 * 1024), b''):
+            h.update(block)
+    for key in sorted(settings):
+        h.update(('\n' + str(key) + '=' + str(settings[key])).encode('utf-8'))
+    h.update(('\nreplica=' + str(replica)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def get_executable_id(executable):
+    """
+    Return a string identifying an executable and its version. This changes when
+    the executable is upgraded.
+
+    :param executable: the executable, including the path
+    :return: the executable, its size and its modification time
+    """
+    if executable is None or not os.path.isfile(executable):
+        return str(executable)
+    stat = os.stat(executable)
+    return executable + ' ' + str(stat.st_size) + ' ' + repr(stat.st_mtime)
+
+
+class ResultCache(object):
+    """
+    A content-addressed cache of simulated reports with a size cap and
+    least recently used eviction.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        """
+        Default constructor.
+
+        :param cache_dir: the folder storing the cached reports
+        :param max_size: the maximum size of the cache in MB
+        """
+        self._cache_dir = cache_dir
+        self._max_size = int(float(max_size) * 1024 * 1024)
+
+    def get_cache_dir(self):
+        """
+        Return the folder storing the cached reports.
+
+        :return: the cache folder
+        """
+        return self._cache_dir
+
+    def _get_entry(self, key):
+        """
+        Return the file of a cache entry.
+
+        :param key: the key of the entry
+        :return: the file name, including the path
+        """
+        return os.path.join(self._cache_dir, key[:2], key)
+
+    def fetch(self, key, fileout):
+        """
+        Hard-link (or copy if this is not possible) a cached report to fileout. The entry is marked
+        as recently used.
+
+        :param key: the key of the entry
+        :param fileout: the output file
+        :return: True if the entry was found, False otherwise
+        """
+        entry = self._get_entry(key)
+        if not os.path.isfile(entry):
+            return False
+        if os.path.exists(fileout):
+            os.remove(fileout)
+        try:
+            os.link(entry, fileout)
+        except (OSError, AttributeError):
+            # different file systems, or os.link is not available
+            shutil.copyfile(entry, fileout)
+        os.utime(entry, None)
+        return True
+
+    def store(self, key, filein):
+        """
+        Store a copy of a report in the cache. The cache is not evicted, so that several
+        reports can be stored before calling evict() once.
+
+        :param key: the key of the entry
+        :param filein: the report to store
+        """
+        entry = self._get_entry(key)
+        if not os.path.exists(os.path.dirname(entry)):
+            os.makedirs(os.path.dirname(entry))
+        # the entry is renamed when complete, so that interrupted copies are never fetched
+        shutil.copyfile(filein, entry + '.tmp')
+        os.rename(entry + '.tmp', entry)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache does not exceed its maximum size.
+        The entries being stored (.tmp) are neither counted nor removed, as these can be written
+        by a concurrent pipeline.
+
+        :return: the number of removed entries
+        """
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self._cache_dir):
+            for f in files:
+                if f.endswith('.tmp'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, f))
+                except OSError:
+                    # removed by a concurrent pipeline
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, f)))
+                total += stat.st_size
+        removed = 0
+        for mtime, size, entry in sorted(entries):
+            if total <= self._max_size:
+                break
+            logger.debug('Removing cache entry ' + entry)
+            remove_file_silently(entry)
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Optional columnar copies of the tab-separated result files. Collections of reports
+# (e.g. the replicas of a model) are stored in one columnar file.
+# These require the Python package pandas and, depending on the format,
+# pyarrow (parquet, feather) or pytables (hdf5).
+
+import logging
+import os
+
+logger = logging.getLogger('sbpipe')
+
+
+# The name of the result format storing tab-separated files only.
+TSV_FORMAT = 'tsv'
+
+# The supported columnar formats and their file extensions.
+COLUMNAR_FORMATS = {'parquet': '.parquet',
+                    'feather': '.feather',
+                    'hdf5': '.h5'}
+
+# The key of the table in hdf5 files.
+HDF5_KEY = 'data'
+
+
+def is_result_format(result_format):
+    """
+    Check whether a result format is supported.
+
+    :param result_format: the result format (tsv, parquet, feather, or hdf5)
+    :return: True if the result format is supported, False otherwise
+    """
+    return result_format == TSV_FORMAT or result_format in COLUMNAR_FORMATS
+
+
+def get_columnar_filename(filename, result_format):
+    """
+    Return the name of the columnar copy of a tab-separated file.
+
+    :param filename: the tab-separated file
+    :param result_format: the columnar format (parquet, feather, or hdf5)
+    :return: the file name with the extension of the columnar format
+    """
+    return os.path.splitext(filename)[0] + COLUMNAR_FORMATS[result_format]
+
+
+def _read_table(source):
+    """
+    Read a tab-separated table. Numeric columns are converted to float64.
+
+    :param source: the tab-separated file, or a file-like object
+    :return: a pandas data frame
+    """
+    import pandas as pd
+    # index_col=False as report rows can end with a tab
+    df = pd.read_csv(source, sep='\t', index_col=False)
+    numeric_cols = df.select_dtypes(include='number').columns
+    df[numeric_cols] = df[numeric_cols].astype('float64')
+    return df
+
+
+def write_columnar(filename, result_format):
+    """
+    Write a columnar copy of a tab-separated file next to it. Numeric columns are stored as float64.
+
+    :param filename: the tab-separated file
+    :param result_format: the columnar format (parquet, feather, or hdf5)
+    :return: the name of the columnar file, or None if this could not be written
+    """
+    return write_columnar_collection([((), filename)], get_columnar_filename(filename, result_format),
+                                     result_format)
+
+
+def write_columnar_collection(tables, fileout, result_format, key_columns=()):
+    """
+    Write tab-separated tables with the same columns to one columnar file. The rows of each table are
+    preceded by the key columns, identifying the table (e.g. the replica). Numeric columns are stored as float64.
+    For parquet and hdf5, the tables are appended one at a time, so the collection is never loaded in memory.
+    Empty tables are skipped.
+
+    :param tables: an iterable of tuples (the values of the key columns, the tab-separated file or a file-like object)
+    :param fileout: the columnar file
+    :param result_format: the columnar format (parquet, feather, or hdf5)
+    :param key_columns: the names of the key columns
+    :return: the name of the columnar file, or None if this could not be written
+    """
+    source = fileout
+    writer = None
+    written = 0
+    try:
+        import pandas as pd
+        frames = []
+        for keys, source in tables:
+            df = _read_table(source)
+            if df.empty:
+                continue
+            for i, column in enumerate(key_columns):
+                df.insert(i, column, keys[i])
+            if result_format == 'parquet':
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(fileout, table.schema)
+                writer.write_table(table)
+            elif result_format == 'hdf5':
+                # the table format allows reading a subset of columns
+                df.to_hdf(fileout, key=HDF5_KEY, mode='a' if written else 'w', format='table', append=True,
+                          index=False)
+            else:
+                frames.append(df)
+            written += 1
+        if frames:
+            pd.concat(frames, ignore_index=True).to_feather(fileout)
+    except ImportError as e:
+        logger.warning('Cannot write ' + result_format + ' files: ' + str(e))
+        return None
+    except Exception as e:
+        logger.warning('Cannot convert ' + str(source) + ' to ' + result_format + ': ' + str(e))
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+    if not written:
+        logger.debug('No table to write to ' + fileout)
+        return None
+    logger.debug('Written ' + fileout)
+    return fileout
+
+
+def remove_columnar(filename):
+    """
+    Remove the columnar copies of a tab-separated file, in any columnar format.
+
+    :param filename: the tab-separated file
+    """
+    for result_format in COLUMNAR_FORMATS:
+        fileout = get_columnar_filename(filename, result_format)
+        if os.path.isfile(fileout):
+            os.remove(fileout)
+
+
+def read_columnar(filename, columns=None):
+    """
+    Read a columnar file written by write_columnar(). The format is inferred from the file extension.
+
+    :param filename: the columnar file
+    :param columns: the list of columns to read, or None for all the columns
+    :return: a pandas data frame
+    """
+    import pandas as pd
+    extension = os.path.splitext(filename)[1]
+    if extension == COLUMNAR_FORMATS['parquet']:
+        return pd.read_parquet(filename, columns=columns)
+    if extension == COLUMNAR_FORMATS['feather']:
+        return pd.read_feather(filename, columns=columns)
+    if extension == COLUMNAR_FORMATS['hdf5']:
+        return pd.read_hdf(filename, key=HDF5_KEY, columns=columns)
+    raise ValueError('Unknown columnar format for file ' + filename)
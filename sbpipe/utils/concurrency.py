@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The automatic concurrency of local jobs.
+# Jobs which wait for I/O or start an interpreter use a fraction of a CPU, so more
+# jobs than CPUs can run at once. Memory-heavy jobs must run fewer at once to fit in
+# memory. The number of concurrent jobs is adapted to the CPU utilisation and the peak
+# memory measured from the terminated jobs, and it is reduced while the CPUs wait for
+# a saturated storage device.
+
+import logging
+import multiprocessing
+import os
+import threading
+
+logger = logging.getLogger('sbpipe')
+
+
+# The value of local_cpus selecting the automatic concurrency.
+AUTO_CPUS = 'auto'
+
+# The number of concurrent jobs run to probe the CPU utilisation and the memory of the jobs.
+PROBE_JOBS = 4
+
+# The maximum number of concurrent jobs per CPU.
+MAX_OVERSUBSCRIPTION = 4
+
+# The fraction of the available memory used by the concurrent jobs if no memory ceiling is set.
+MEMORY_FRACTION = 0.8
+
+# The number of terminated jobs used to compute the CPU utilisation.
+UTILISATION_WINDOW = 32
+
+# The number of jobs per worker process dispatched with a fixed concurrency, before the running jobs terminate.
+PREFETCH_JOBS = 2
+
+# The fraction of CPU time waiting for I/O above which the storage is considered saturated.
+IOWAIT_THRESHOLD = 0.2
+
+# The minimum number of clock ticks per CPU between two measurements of the I/O wait.
+IOWAIT_MIN_TICKS = 10
+
+
+def get_available_memory():
+    """
+    Return the memory available for new processes.
+
+    :return: the available memory in KB, or None if unknown
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_cpu_times():
+    """
+    Return the CPU time of the system spent waiting for I/O and the total CPU time, from /proc/stat (Linux only).
+
+    :return: a tuple (I/O wait, total CPU time) in clock ticks, or None if unknown
+    """
+    try:
+        with open('/proc/stat') as stat:
+            # cpu user nice system idle iowait irq softirq steal [guest guest_nice]. Guest time is in user time
+            times = [int(x) for x in stat.readline().split()[1:9]]
+    except (IOError, OSError, ValueError):
+        return None
+    if len(times) < 5:
+        return None
+    return times[4], sum(times)
+
+
+def get_max_workers(runs):
+    """
+    Return the maximum number of worker processes needed by the automatic concurrency.
+
+    :param runs: the number of jobs
+    :return: the maximum number of concurrent jobs
+    """
+    return max(1, min(runs, multiprocessing.cpu_count() * MAX_OVERSUBSCRIPTION))
+
+
+def get_initial_workers(max_workers):
+    """
+    Return the number of worker processes started by the automatic concurrency. The pool is grown only
+    if the measured jobs allow more concurrent jobs than cpus (and probe jobs).
+
+    :param max_workers: the maximum number of concurrent jobs (see get_max_workers)
+    :return: the initial number of worker processes
+    """
+    return max(1, min(max_workers, max(multiprocessing.cpu_count(), PROBE_JOBS)))
+
+
+def get_grown_workers(workers, limit, max_workers):
+    """
+    Return the number of worker processes of a grown pool. The pool is at least doubled, so that it
+    is grown few times.
+
+    :param workers: the current number of worker processes
+    :param limit: the current number of concurrent jobs
+    :param max_workers: the maximum number of concurrent jobs (see get_max_workers)
+    :return: the number of worker processes
+    """
+    return max(1, min(max_workers, max(limit, 2 * workers)))
+
+
+class Concurrency(object):
+    """
+    A fixed number of concurrent jobs of a computation. Jobs are dispatched through throttle() and
+    reported with add_record(), so that the parameters of a job are only generated shortly before
+    the job can run.
+    """
+
+    def __init__(self, limit, weight=1):
+        """
+        Default constructor.
+
+        :param limit: the maximum number of dispatched jobs which did not terminate
+        :param weight: the number of jobs dispatched together (e.g. replicas per job)
+        """
+        self._limit = max(1, limit)
+        self._weight = max(1, weight)
+        self._running = 0
+        self._stopped = False
+        self._exhausted = False
+        self._cond = threading.Condition()
+
+    def get_limit(self):
+        """
+        Return the current number of concurrent jobs.
+
+        :return: the number of concurrent jobs
+        """
+        return self._limit
+
+    def is_exhausted(self):
+        """
+        Return whether all the job parameters were dispatched.
+
+        :return: True if the parameters passed to throttle() are exhausted
+        """
+        return self._exhausted
+
+    def throttle(self, params, max_limit=None):
+        """
+        Yield the job parameters as long as fewer jobs than the current limit are running.
+        This blocks the consumer (e.g. the task handler of a pool) otherwise.
+
+        :param params: an iterable of job parameters. If this is an iterator, the parameters which are
+        not dispatched are not consumed, so that these can be dispatched by a later call
+        :param max_limit: the limit above which the generator returns (e.g. the number of workers of a pool).
+        If None, the limit is not bounded
+        :return: a generator of the job parameters
+        """
+        params = iter(params)
+        while True:
+            with self._cond:
+                while not self._stopped and self._running >= self._limit * self._weight:
+                    self._cond.wait()
+                if self._stopped or (max_limit is not None and self._limit > max_limit):
+                    return
+            try:
+                job_params = next(params)
+            except StopIteration:
+                self._exhausted = True
+                return
+            with self._cond:
+                self._running += 1
+            yield job_params
+
+    def stop(self):
+        """
+        Stop dispatching jobs, releasing a blocked consumer.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def add_record(self, record):
+        """
+        Report a terminated job, allowing the dispatch of another job.
+
+        :param record: the job record (see sbpipe.utils.parcomp.make_job_record)
+        """
+        with self._cond:
+            self._running -= 1
+            self._update(record)
+            self._cond.notify_all()
+
+    def _update(self, record):
+        """
+        Update the number of concurrent jobs with a terminated job. This is called with the lock held.
+
+        :param record: the job record
+        """
+        pass
+
+
+class AutoConcurrency(Concurrency):
+    """
+    The number of concurrent jobs of a computation, adapted to the CPU utilisation and the peak memory
+    of the terminated jobs, and to the I/O wait of the system. Jobs are dispatched through throttle() and
+    reported with add_record().
+    """
+
+    def __init__(self, max_workers, max_memory=0, weight=1, probe_jobs=PROBE_JOBS):
+        """
+        Default constructor.
+
+        :param max_workers: the maximum number of concurrent jobs
+        :param max_memory: the memory ceiling of the concurrent jobs in MB. If 0, a fraction of the available
+        memory is used
+        :param weight: the number of jobs dispatched together (e.g. replicas per job)
+        :param probe_jobs: the number of concurrent jobs until the first jobs have terminated
+        """
+        self._max_workers = max(1, max_workers)
+        self._probe_jobs = max(1, probe_jobs)
+        Concurrency.__init__(self, min(self._probe_jobs, self._max_workers), weight)
+        self._cpus = multiprocessing.cpu_count()
+        if max_memory > 0:
+            self._max_memory = max_memory * 1024
+        else:
+            available = get_available_memory()
+            self._max_memory = int(available * MEMORY_FRACTION) if available else None
+        self._utilisation = []
+        self._max_rss = 0
+        self._completed = 0
+        self._cpu_times = get_cpu_times()
+        self._iowait = None
+
+    def _update(self, record):
+        __doc__ = Concurrency._update.__doc__
+
+        self._completed += 1
+        if record['WallTime'] and record['UserTime'] is not None and record['SysTime'] is not None:
+            self._utilisation.append((record['UserTime'] + record['SysTime']) / record['WallTime'])
+            del self._utilisation[:-UTILISATION_WINDOW]
+        if record['MaxRSS'] is not None:
+            self._max_rss = max(self._max_rss, record['MaxRSS'])
+        if self._completed >= min(self._probe_jobs, self._max_workers):
+            limit = self._compute_limit()
+            if limit != self._limit:
+                logger.debug('Concurrent jobs: ' + str(limit) + ' (CPU utilisation per job: ' +
+                             '%.2f, peak memory per job: %.1f MB, I/O wait: %s)' %
+                             (self._get_utilisation(), self._max_rss / 1024.0,
+                              'unknown' if self._iowait is None else '%.2f' % self._iowait))
+                self._limit = limit
+
+    def _get_utilisation(self):
+        """
+        Return the median CPU utilisation of the recent jobs.
+
+        :return: the CPU time per wall time of a job. 1.0 if unknown
+        """
+        if not self._utilisation:
+            return 1.0
+        return sorted(self._utilisation)[len(self._utilisation) // 2]
+
+    def _measure_iowait(self):
+        """
+        Update the fraction of the CPU time of the system spent waiting for I/O since the last measurement.
+        This is measured over intervals of at least IOWAIT_MIN_TICKS per CPU, and includes the processes
+        which are not jobs.
+
+        :return: the fraction of CPU time waiting for I/O, or None if unknown
+        """
+        cpu_times = get_cpu_times()
+        if cpu_times is None or self._cpu_times is None:
+            return self._iowait
+        total = cpu_times[1] - self._cpu_times[1]
+        if total >= IOWAIT_MIN_TICKS * self._cpus:
+            # the I/O wait of a CPU can decrease on some kernels
+            self._iowait = max(0.0, (cpu_times[0] - self._cpu_times[0]) / float(total))
+            self._cpu_times = cpu_times
+        return self._iowait
+
+    def _compute_limit(self):
+        """
+        Compute the number of concurrent jobs keeping the CPUs busy within the memory ceiling.
+
+        :return: the number of concurrent jobs
+        """
+        limit = int(self._cpus / max(self._get_utilisation(), 1.0 / MAX_OVERSUBSCRIPTION))
+        iowait = self._measure_iowait()
+        if iowait is not None and iowait > IOWAIT_THRESHOLD:
+            # the CPUs are idle because the storage is saturated. More concurrent jobs would only queue more I/O
+            # requests, so the concurrency is reduced until the I/O wait drops
+            limit = min(limit, self._limit - 1)
+        if self._max_memory and self._max_rss > 0:
+            # the jobs dispatched together run in sequence
+            limit = min(limit, self._max_memory // self._max_rss)
+        return int(max(1, min(limit, self._max_workers)))
@@ -25,6 +25,7 @@ import glob
 import logging
 import os
 import re
+import shutil
 import subprocess
 
 logger = logging.getLogger('sbpipe')
@@ -108,39 +109,109 @@ def replace_str_in_file(filename_out, old_string, new_string):
         file.write(filedata)
 
 
-def replace_str_in_report(report):
+def read_file_template(filename, old_strings):
     """
-    Replace nasty strings in COPASI report file.
+    Read a file and split its content at each occurrence of the strings in old_strings.
+    The returned template can be written many times with write_file_template(), so that
+    the file is read once only.
 
-    :param report: the report
+    :param filename: the file to read
+    :param old_strings: the list of strings to be replaced
+    :return: the list of chunks of the file content
     """
+    with open(filename, 'r') as file:
+        filedata = file.read()
+    pattern = '|'.join(re.escape(old_string) for old_string in old_strings)
+    return re.split(pattern, filedata)
 
-    # `with` ensures that the file is closed correctly
-    # re.sub(pattern, replace, string) is the equivalent of s/pattern/replace/ in sed.
-    with open(report, 'r') as file:
-        lines = file.readlines()
-    with open(report, 'w') as file:
-        # for idx, line in lines:
-        for i in range(len(lines)):
-            if i < 1:
-                # First remove non-alphanumerics and non-underscores.
-                # Then replaces whites with TAB.
-                # Finally use rstrip to remove the TAB at the end.
-                # [^\w] matches anything that is not alphanumeric or underscore
-
-                # global variables
-                lines[i] = lines[i].replace("Values[", "").replace(".InitialValue", "")
-                # compartments
-                lines[i] = lines[i].replace("Compartments[", "").replace(".InitialVolume", "").replace(".Volume", "")
-                # particle numbers
-                lines[i] = lines[i].replace(".InitialParticleNumber", "")
-                # species
-                lines[i] = lines[i].replace("Values[", "").replace("]_0", "")
-
-                file.write(
-                    re.sub(r"\s+", '\t', re.sub(r'[^\w]', " ", lines[i])).rstrip('\t') + '\n')
+
+def write_file_template(filename_out, template, new_string):
+    """
+    Write a template returned by read_file_template() to filename_out, replacing
+    the old strings with new_string.
+
+    :param filename_out: the output file
+    :param template: the list of chunks of the file content
+    :param new_string: the new string replacing the old strings
+    """
+    with open(filename_out, 'w') as file:
+        file.write(new_string.join(template))
+
+
+def rewrite_report_header(report, clean_header, block_size=1024*1024):
+    """
+    Rewrite the header of a report file, leaving its body untouched. Only the first line is passed to
+    clean_header(). The body is copied in blocks of block_size characters, removing the tabs at the end
+    of the file. The file is not rewritten at all if neither the header nor the end of the file change.
+
+    :param report: a report file with its absolute path
+    :param clean_header: a function receiving the header line and returning the new header line
+    :param block_size: the number of characters copied at each iteration
+    :return: True if the report was rewritten, False otherwise
+    """
+    with open(report, 'r') as filein:
+        header = filein.readline()
+    if not header:
+        return False
+    new_header = clean_header(header)
+    if new_header == header:
+        # check whether there are tabs at the end of the file without reading its body
+        with open(report, 'rb') as filein:
+            filein.seek(-1, os.SEEK_END)
+            if filein.read(1) != b'\t':
+                return False
+
+    tmp_report = report + '.tmp'
+    with open(report, 'r') as filein, open(tmp_report, 'w') as fileout:
+        fileout.write(new_header)
+        filein.readline()
+        # tabs are held back until some other character follows them,
+        # so that those at the end of the file are not written.
+        tabs = ''
+        block = filein.read(block_size)
+        while block:
+            stripped = block.rstrip('\t')
+            if stripped:
+                fileout.write(tabs + stripped)
+                tabs = block[len(stripped):]
             else:
-                file.write(lines[i].rstrip('\t'))
+                tabs += block
+            block = filein.read(block_size)
+    shutil.move(tmp_report, report)
+    return True
+
+
+def clean_copasi_report_header(header):
+    """
+    Replace nasty strings in the header of a COPASI report file.
+
+    :param header: the header line
+    :return: the cleaned header line, with fields separated by TAB
+    """
+    # First remove non-alphanumerics and non-underscores.
+    # Then replaces whites with TAB.
+    # Finally use rstrip to remove the TAB at the end.
+    # [^\w] matches anything that is not alphanumeric or underscore
+
+    # global variables
+    header = header.replace("Values[", "").replace(".InitialValue", "")
+    # compartments
+    header = header.replace("Compartments[", "").replace(".InitialVolume", "").replace(".Volume", "")
+    # particle numbers
+    header = header.replace(".InitialParticleNumber", "")
+    # species
+    header = header.replace("Values[", "").replace("]_0", "")
+    # re.sub(pattern, replace, string) is the equivalent of s/pattern/replace/ in sed.
+    return re.sub(r"\s+", '\t', re.sub(r'[^\w]', " ", header)).rstrip('\t') + '\n'
+
+
+def replace_str_in_report(report):
+    """
+    Replace nasty strings in COPASI report file. Only the header is rewritten.
+
+    :param report: the report
+    """
+    rewrite_report_header(report, clean_copasi_report_header)
 
 
 def remove_file_silently(filename):
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The history of job durations of each model.
+# The expected durations are used to estimate the remaining time of a computation.
+# Distinct jobs (e.g. the analyses of the columns) are also dispatched longest-expected-first,
+# so that the longest jobs do not run last while the other workers are idle. The replicas of
+# a job (e.g. the runs of a simulation or of a parameter estimation) share one expected
+# duration, so their order is kept.
+
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger('sbpipe')
+
+
+# The default folder of the job histories.
+DEFAULT_HISTORY_DIR = os.path.join(os.path.expanduser('~'), '.sbpipe', 'history')
+
+# The maximum number of durations stored for each job.
+MAX_SAMPLES = 10
+
+# The job of the iterations which are replicas of the same job (e.g. the replicas of a simulation).
+REPLICA_JOB = 'replica'
+
+
+def get_history_key(task, model_file):
+    """
+    Return the key of the history of a task on a model. The model is identified by its content, so that
+    its history is kept if the model is moved, and is not reused if the model is changed.
+
+    :param task: the string identifying the task (e.g. pipeline and simulator)
+    :param model_file: the model file
+    :return: the key of the history
+    :raise: IOError if the model file cannot be read
+    """
+    with open(model_file, 'rb') as myfile:
+        return task + ':' + hashlib.sha1(myfile.read()).hexdigest()
+
+
+class JobHistory(object):
+    """
+    The durations of the past jobs of a task. The iterations of a task are either replicas of the same
+    job, whose durations are pooled, or distinct jobs (e.g. the analyses of the columns), whose durations
+    are stored by iteration.
+    """
+
+    def __init__(self, history_dir=DEFAULT_HISTORY_DIR, key='', max_samples=MAX_SAMPLES, replicas=True):
+        """
+        Default constructor.
+
+        :param history_dir: the folder storing the job histories
+        :param key: the string identifying the history (see get_history_key)
+        :param max_samples: the maximum number of durations stored for each job
+        :param replicas: True if the iterations are replicas of the same job, False if each iteration
+        (e.g. column name) is a distinct job
+        """
+        self._key = key
+        self._file = os.path.join(history_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+        self._max_samples = max_samples
+        self._replicas = replicas
+        self._durations = None
+
+    def _get_job(self, iter_id):
+        """
+        Return the job of an iteration. All the replicas map to the same job, so they have the same
+        expected duration and ordering them longest-expected-first keeps their order.
+
+        :param iter_id: the iteration as string
+        :return: the job whose durations are used for the iteration
+        """
+        return REPLICA_JOB if self._replicas else iter_id
+
+    def get_file(self):
+        """
+        Return the file storing the history.
+
+        :return: the history file
+        """
+        return self._file
+
+    def _load(self):
+        """
+        Load the history file once. A missing or corrupted file is an empty history.
+
+        :return: a dictionary of jobs and lists of durations in seconds
+        """
+        if self._durations is None:
+            self._durations = dict()
+            if os.path.isfile(self._file):
+                try:
+                    with open(self._file) as filein:
+                        self._durations = json.load(filein)['durations']
+                except (ValueError, KeyError):
+                    logger.warning('Job history ' + self._file + ' is corrupted and will be replaced')
+        return self._durations
+
+    def get_expected_durations(self, iter_ids):
+        """
+        Return the expected duration of each iteration. This is the mean of the past durations of its job or,
+        for jobs without history, the median duration of all the jobs.
+
+        :param iter_ids: the list of iterations as strings
+        :return: a dictionary of iterations and expected durations in seconds, or None if there is no history
+        """
+        durations = self._load()
+        means = dict((k, sum(v) / len(v)) for k, v in durations.items() if v)
+        if not means:
+            return None
+        median = sorted(means.values())[len(means) // 2]
+        return dict((iter_id, means.get(self._get_job(iter_id), median)) for iter_id in iter_ids)
+
+    def update(self, durations):
+        """
+        Add the durations of terminated jobs and save the history.
+
+        :param durations: a dictionary of iterations and durations in seconds
+        """
+        history = self._load()
+        for iter_id, duration in durations.items():
+            job = self._get_job(iter_id)
+            history[job] = (history.get(job, []) + [duration])[-self._max_samples:]
+        if not os.path.exists(os.path.dirname(self._file)):
+            os.makedirs(os.path.dirname(self._file))
+        # the file is renamed when complete, so that concurrent pipelines never read a partial history
+        with open(self._file + '.tmp', 'w') as fileout:
+            json.dump({'key': self._key, 'durations': history}, fileout)
+        os.rename(self._file + '.tmp', self._file)
+
+
+def order_longest_first(iter_ids, expected):
+    """
+    Order the iterations by decreasing expected duration. Iterations with the same expected
+    duration keep their order.
+
+    :param iter_ids: the list of iterations
+    :param expected: a dictionary of iterations and expected durations
+    :return: the ordered list of iterations
+    """
+    return sorted(iter_ids, key=lambda iter_id: -expected[iter_id])
+
+
+def get_useful_parallelism(durations):
+    """
+    Return the number of workers above which a computation is not faster. The computation cannot
+    terminate before its longest job.
+
+    :param durations: the list of job durations
+    :return: the number of workers (at least 1)
+    """
+    longest = max(durations) if durations else 0
+    if longest <= 0:
+        return max(1, len(durations))
+    # ceil(total / longest)
+    return max(1, int(-(-sum(durations) // longest)))
+
+
+def estimate_remaining_time(remaining, workers, done_expected=0, done_actual=0):
+    """
+    Estimate the remaining time of a computation. The expected durations are corrected by the ratio
+    between the actual and expected durations of the terminated jobs.
+
+    :param remaining: the list of expected durations of the jobs which did not terminate
+    :param workers: the number of workers
+    :param done_expected: the expected duration of the terminated jobs
+    :param done_actual: the actual duration of the terminated jobs
+    :return: the estimated remaining time in seconds
+    """
+    if not remaining:
+        return 0.0
+    ratio = done_actual / done_expected if done_expected > 0 and done_actual > 0 else 1.0
+    return ratio * max(sum(remaining) / min(workers, len(remaining)), max(remaining))
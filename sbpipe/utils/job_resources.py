@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The CPU resources of local jobs.
+# Numerical libraries (BLAS, OpenMP, R packages) start as many threads as the CPUs
+# by default. When several jobs run in parallel, this oversubscribes the CPUs. The
+# number of threads of each job is limited through environment variables and each
+# job can be pinned to a disjoint set of CPUs.
+
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger('sbpipe')
+
+
+# The environment variables limiting the number of threads of the numerical libraries.
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                   'NUMEXPR_NUM_THREADS',
+                   # R packages
+                   'MC_CORES', 'R_DATATABLE_NUM_THREADS', 'RCPP_PARALLEL_NUM_THREADS']
+
+
+def get_available_cpus():
+    """
+    Return the CPUs available to this process.
+
+    :return: the sorted list of CPU ids
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+class JobResources(object):
+    """
+    The CPU resources of each job run by a pool of worker processes.
+    """
+
+    def __init__(self, workers, cpus_per_job=0, pin_cpus=False):
+        """
+        Default constructor.
+
+        :param workers: the number of worker processes running the jobs
+        :param cpus_per_job: the number of CPUs of each job. If 0, the available CPUs are shared among the workers
+        and the thread limits already set in the environment are kept
+        :param pin_cpus: True if each job should run on a disjoint set of cpus_per_job CPUs. This is only
+        available on Linux
+        """
+        self._cpus = get_available_cpus()
+        self._workers = max(1, workers)
+        # the thread limits set by the user are only overridden by an explicit number of CPUs per job
+        self._explicit = cpus_per_job > 0
+        if cpus_per_job <= 0:
+            cpus_per_job = max(1, len(self._cpus) // self._workers)
+        self._cpus_per_job = int(cpus_per_job)
+        self._pin_cpus = pin_cpus
+        if pin_cpus and not hasattr(os, 'sched_setaffinity'):
+            logger.warning('CPU pinning is not available on this platform. `pin_cpus` is ignored.')
+            self._pin_cpus = False
+        if self._workers * self._cpus_per_job > len(self._cpus):
+            logger.warning('`local_cpus` (' + str(self._workers) + ') x `cpus_per_job` (' +
+                           str(self._cpus_per_job) + ') exceeds the number of available CPUs (' +
+                           str(len(self._cpus)) + ')')
+
+    def __eq__(self, other):
+        return isinstance(other, JobResources) and self._get_key() == other._get_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def _get_key(self):
+        """
+        Return the settings which distinguish these resources.
+
+        :return: a tuple of settings
+        """
+        return self._workers, self._cpus_per_job, self._explicit, self._pin_cpus
+
+    def get_cpus_per_job(self):
+        """
+        Return the number of CPUs of each job.
+
+        :return: the number of CPUs
+        """
+        return self._cpus_per_job
+
+    def get_env(self):
+        """
+        Return the environment of a job, limiting the number of threads of the numerical libraries.
+
+        :return: a copy of the environment of the current process with THREAD_ENV_VARS set. If cpus_per_job
+        was not given, the variables already in the environment are not changed
+        """
+        env = dict(os.environ)
+        for var in THREAD_ENV_VARS:
+            if self._explicit or var not in env:
+                env[var] = str(self._cpus_per_job)
+        return env
+
+    def get_job_cpus(self):
+        """
+        Return the CPUs of the jobs run by the current worker process. The workers of a pool are numbered
+        consecutively, so each of them is assigned a different set of CPUs, as long as the pool has
+        no more than `workers` workers and there are enough CPUs.
+
+        :return: the set of CPU ids, or None if jobs are not pinned
+        """
+        if not self._pin_cpus:
+            return None
+        identity = multiprocessing.current_process()._identity
+        slot = (identity[-1] - 1) % self._workers if identity else 0
+        first = slot * self._cpus_per_job
+        return set(self._cpus[(first + i) % len(self._cpus)] for i in range(self._cpus_per_job))
+
+
+def init_worker(resources):
+    """
+    Apply the CPU resources to the current worker process. This is the initializer of the pools of worker
+    processes, so that it runs before the jobs import the numerical libraries. The jobs, whether they are
+    function calls or subprocesses, inherit the thread limits and the CPUs of their worker.
+
+    :param resources: the JobResources of the pool
+    """
+    os.environ.update(resources.get_env())
+    cpus = resources.get_job_cpus()
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The timeout of local jobs.
+# A stochastic simulation can occasionally hang or take much longer than the other
+# replicas. Such a job is killed when it exceeds an absolute timeout or a multiple of
+# the median duration of the jobs which have succeeded so far, and is run again a
+# bounded number of times.
+
+import bisect
+import logging
+import multiprocessing
+from contextlib import contextmanager
+
+logger = logging.getLogger('sbpipe')
+
+
+# The number of succeeded jobs required before the median duration is used as timeout.
+MIN_MEDIAN_SAMPLES = 3
+
+
+class JobTimeout(object):
+    """
+    The timeout of the jobs of a computation. This object is sent to the worker processes, which
+    read the current limit while their jobs run.
+    """
+
+    def __init__(self, timeout=0, median_factor=0, retries=1, min_samples=MIN_MEDIAN_SAMPLES):
+        """
+        Default constructor.
+
+        :param timeout: the maximum duration of a job in seconds. If 0, there is no absolute timeout
+        :param median_factor: the maximum duration of a job as a multiple of the median duration of the
+        succeeded jobs. If 0, there is no relative timeout
+        :param retries: the number of times a timed out job is run again
+        :param min_samples: the number of succeeded jobs required to compute the relative timeout
+        """
+        if timeout < 0 or median_factor < 0 or retries < 0:
+            raise ValueError('timeout, median factor and retries cannot be negative.')
+        self._timeout = float(timeout)
+        self._median_factor = float(median_factor)
+        self._retries = int(retries)
+        self._min_samples = max(1, int(min_samples))
+        # the sorted durations of the succeeded jobs. These are only kept by the main process
+        self._durations = []
+        # the manager sharing the relative timeout with the worker processes
+        self._manager = None
+        self._median_limit = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_durations'] = []
+        state['_manager'] = None
+        return state
+
+    def is_set(self):
+        """
+        Return True if a timeout is set.
+
+        :return: True if an absolute or a relative timeout is set
+        """
+        return self._timeout > 0 or self._median_factor > 0
+
+    def get_retries(self):
+        """
+        Return the number of times a timed out job is run again.
+
+        :return: the number of retries
+        """
+        return self._retries
+
+    @contextmanager
+    def monitor(self):
+        """
+        Share the relative timeout with the worker processes. The jobs must be dispatched
+        and the succeeded durations added (see add_duration) within this context.
+        """
+        if self._median_factor <= 0:
+            yield
+            return
+        self._durations = []
+        self._manager = multiprocessing.Manager()
+        self._median_limit = self._manager.Value('d', 0.0)
+        try:
+            yield
+        finally:
+            self._median_limit = None
+            self._manager.shutdown()
+            self._manager = None
+
+    def add_duration(self, duration):
+        """
+        Add the duration of a succeeded job, updating the relative timeout.
+
+        :param duration: the duration of the job in seconds
+        """
+        if self._median_limit is None:
+            return
+        bisect.insort(self._durations, duration)
+        if len(self._durations) >= self._min_samples:
+            self._median_limit.value = self._median_factor * self._durations[len(self._durations) // 2]
+
+    def get_limit(self):
+        """
+        Return the current maximum duration of a job.
+
+        :return: the limit in seconds, or None if no limit applies yet
+        """
+        limits = []
+        if self._timeout > 0:
+            limits.append(self._timeout)
+        if self._median_limit is not None and self._median_limit.value > 0:
+            limits.append(self._median_limit.value)
+        if not limits:
+            return None
+        return min(limits)
@@ -26,16 +26,73 @@
 
 
 from __future__ import print_function
+import datetime
 import logging
 import sys
 import os
 import multiprocessing
 import subprocess
 import shlex
-from time import sleep
+import re
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from itertools import chain, islice
+try:  # Python 2.7
+    from StringIO import StringIO
+except ImportError:  # Python 3
+    from io import StringIO
+try:  # Python 3
+    from shlex import quote
+except ImportError:  # Python 2.7
+    from pipes import quote
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+from sbpipe.utils.tracing import traced, span, add_job_events
+from sbpipe.utils.job_history import estimate_remaining_time, get_useful_parallelism, order_longest_first
+from sbpipe.utils.job_resources import JobResources, init_worker
+from sbpipe.utils.concurrency import AUTO_CPUS, PREFETCH_JOBS, AutoConcurrency, Concurrency, get_grown_workers, \
+    get_initial_workers, get_max_workers
 logger = logging.getLogger('sbpipe')
 
 
+# The maximum number of jobs in a job array. This is the default value for LSF (MAX_JOB_ARRAY_SIZE).
+MAX_JOB_ARRAY_SIZE = 1000
+
+# The maximum number of failed cluster jobs whose output and error files are inspected by quick_debug().
+MAX_DEBUG_TASKS = 10
+
+
+# The file recording the execution of the jobs, stored in the output directory.
+JOBS_FILE = 'jobs.tsv'
+
+# The columns of the job records. Times are in seconds, MaxRSS is in KB.
+JOB_RECORD_COLUMNS = ['Job', 'Command', 'ExitStatus', 'Start', 'End', 'WallTime', 'UserTime', 'SysTime', 'MaxRSS',
+                      'Attempts', 'TimedOut', 'Stderr']
+
+# The maximum number of characters of the standard error stored in a job record.
+MAX_RECORD_STDERR = 500
+
+# The interval in seconds between two checks of the timeout of a running job.
+TIMEOUT_POLL_INTERVAL = 0.5
+
+# The number of final bytes of the standard output and error of a spooled job which are kept in memory.
+SPOOL_TAIL_SIZE = 8192
+
+
+# The pool of worker processes shared by the local computations run within local_pool().
+_local_pool = None
+# The number of workers of _local_pool
+_local_pool_size = 0
+# The JobResources applied to the workers of _local_pool, or None
+_local_pool_resources = None
+# True if the code is running within local_pool()
+_local_pool_scope = False
+
+
 def run_cmd(cmd):
     """
     Run a command using Python subprocess.
@@ -60,8 +117,10 @@ def run_cmd_block(cmd):
     p = subprocess.call(shlex.split(cmd))
 
 
+@traced('parcomp')
 def parcomp(cmd, cmd_iter_substr, output_dir, cluster='local', runs=1, local_cpus=1, output_msg=False,
-            colnames=[]):
+            colnames=[], prepare_job=None, replicas_per_job=1, history=None, timeout=None, spool_output=False,
+            cpus_per_job=0, pin_cpus=False, max_memory=0):
     """
     Generic function to run a command in parallel
 
@@ -70,15 +129,31 @@ def parcomp(cmd, cmd_iter_substr, output_dir, cluster='local', runs=1, local_cpu
     :param output_dir: the output directory
     :param cluster: the cluster type among local (Python multiprocessing), sge, or lsf
     :param runs: the number of runs. Ignored if colnames is not empty
-    :param local_cpus: the number of cpus to use at most
+    :param local_cpus: the number of cpus to use at most, or AUTO_CPUS to adapt the number of concurrent
+    local jobs to their CPU utilisation and memory
     :param output_msg: print the output messages on screen (available for cluster='local' only)
     :param colnames: the name of the columns to process
+    :param prepare_job: a function called with the iteration number (or column name) as string
+    right before the corresponding job is dispatched (e.g. to generate the job input files).
+    :param replicas_per_job: the number of contiguous iterations run in sequence by each job
+    :param history: the JobHistory of the iterations, or None. If set, local jobs are dispatched
+    longest-expected-first and the remaining time is estimated.
+    :param timeout: the JobTimeout of the local jobs, or None
+    :param spool_output: True if the standard output and error of the local jobs should be written to the
+    folders out/ and err/ of output_dir, as for the cluster jobs, instead of being kept in memory
+    :param cpus_per_job: the number of threads of the numerical libraries of each local job. If 0, the
+    available cpus are shared among the local jobs
+    :param pin_cpus: True if each local job should run on a disjoint set of cpus_per_job cpus
+    :param max_memory: the memory ceiling of the concurrent local jobs in MB if local_cpus is AUTO_CPUS.
+    If 0, a fraction of the available memory is used
     :return: True if the computation succeeded.
     """
+    # The execution of each job is recorded in output_dir/JOBS_FILE
     logger.debug("Parallel computation using " + cluster)
     logger.debug("Command: " + cmd)
     logger.debug("Iter ID string: " + cmd_iter_substr)
     logger.debug("# runs: " + str(runs))
+    jobs_file = os.path.join(output_dir, JOBS_FILE)
     if cluster == "sge" or cluster == "lsf":
         out_dir = os.path.join(output_dir, 'out')
         err_dir = os.path.join(output_dir, 'err')
@@ -88,17 +163,23 @@ def parcomp(cmd, cmd_iter_substr, output_dir, cluster='local', runs=1, local_cpu
             os.makedirs(err_dir)
 
         if cluster == "sge":  # use SGE (Sun Grid Engine)
-            return run_jobs_sge(cmd, cmd_iter_substr, out_dir, err_dir, runs, colnames)
+            return run_jobs_sge(cmd, cmd_iter_substr, out_dir, err_dir, runs, colnames, prepare_job, jobs_file,
+                                replicas_per_job)
 
         elif cluster == "lsf":  # use LSF (Platform Load Sharing Facility)
-            return run_jobs_lsf(cmd, cmd_iter_substr, out_dir, err_dir, runs, colnames)
+            return run_jobs_lsf(cmd, cmd_iter_substr, out_dir, err_dir, runs, colnames, prepare_job, jobs_file,
+                                replicas_per_job)
 
     else:  # use local by default (python multiprocessing). This is configured to work locally using multi-core.
         if cluster != "local":
             logger.warning(
                 "Variable cluster is not set correctly in the configuration file. "
                 "Values are: `local`, `lsf`, `sge`. Running `local` by default")
-        return run_jobs_local(cmd, cmd_iter_substr, runs, local_cpus, output_msg, colnames)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        return run_jobs_local(cmd, cmd_iter_substr, runs, local_cpus, output_msg, colnames, prepare_job, jobs_file,
+                              replicas_per_job, history, timeout, output_dir if spool_output else None,
+                              cpus_per_job, pin_cpus, max_memory)
 
 
 def progress_bar(it, total):
@@ -115,69 +196,766 @@ def progress_bar(it, total):
         print()
 
 
-def progress_bar2(it, total):
+def progress_bar2(it, total, eta=None):
     """
     A CLI progress bar.
 
     :param it: current iteration starting from 1
     :param total: total iterations
+    :param eta: the estimated remaining time in seconds, or None if unknown
     """
     percent = ("{0:.1f}").format(100 * (it / float(total)))
     length = 50
     filled = int(length * it // total)
     bar = '#' * filled + '-' * (length - filled)
     progress = '(' + str(it) + ' of ' + str(total) + ')'
+    if eta is not None:
+        progress += ' ETA ' + str(datetime.timedelta(seconds=int(round(eta)))) + '  '
     print('\r%s |%s| %s%% %s' % ('Progress:', bar, percent, progress), end='\r')
     if it == total:
         print()
 
+
 def call_proc(params):
     """
-    Run a command using Python subprocess.
+    Run a command using Python subprocess. If a timeout is given, the command is killed when
+    this expires and is run again up to the number of retries of the timeout. If a spool directory
+    is given, the standard output and error are written to the files j<command id> in its
+    subfolders out/ and err/, and only their final SPOOL_TAIL_SIZE bytes are returned. The command
+    inherits the thread limits and the CPUs of its worker process (see init_worker).
 
-    :param params: A tuple containing (the string of the command to run, the command id)
+    :param params: A tuple containing (the string of the command to run, the command id) or
+    (the string of the command to run, the command id, the JobTimeout or None, the spool directory or None)
+    :return: a tuple containing (the command id, the standard output, the standard error, the job record).
+    The job record reports the last attempt.
     """
-    cmd, id, runs, handler_level = params
-    if handler_level <= logging.INFO:
-        progress_bar(id, runs)
-    if sys.version_info > (3,):
-        with subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE) as p:
-            out, err = p.communicate()
+    cmd, id = params[:2]
+    timeout = params[2] if len(params) > 2 else None
+    spool_dir = params[3] if len(params) > 3 else None
+    attempts = 0
+    while True:
+        attempts += 1
+        if spool_dir is None:
+            stdout, stderr = subprocess.PIPE, subprocess.PIPE
+        else:
+            # each attempt overwrites the spool files
+            out_file, err_file = get_spool_files(spool_dir, id)
+            stdout, stderr = open(out_file, 'wb'), open(err_file, 'wb')
+        start = time.time()
+        try:
+            if sys.version_info > (3,):
+                with subprocess.Popen(shlex.split(cmd), stdout=stdout, stderr=stderr) as p:
+                    out, err, rusage, timed_out = _wait_proc(p, timeout)
+            else:
+                p = subprocess.Popen(shlex.split(cmd), stdout=stdout, stderr=stderr)
+                out, err, rusage, timed_out = _wait_proc(p, timeout)
+        finally:
+            if spool_dir is not None:
+                stdout.close()
+                stderr.close()
+        end = time.time()
+        if not timed_out or attempts > timeout.get_retries():
+            break
+    if spool_dir is not None:
+        out, err = _read_tail(out_file, SPOOL_TAIL_SIZE), _read_tail(err_file, SPOOL_TAIL_SIZE)
+    if rusage is None:
+        record = make_job_record(id, cmd, p.returncode, start, end, err, attempts=attempts, timed_out=timed_out)
     else:
-        p = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        record = make_job_record(id, cmd, p.returncode, start, end, err,
+                                 rusage.ru_utime, rusage.ru_stime, _get_max_rss(rusage), attempts, timed_out)
+    return id, out, err, record
+
+
+class _Watchdog(threading.Thread):
+    """
+    A thread killing a process when the limit of its JobTimeout expires.
+    """
+
+    def __init__(self, p, timeout):
+        """
+        Default constructor.
+
+        :param p: the subprocess.Popen object
+        :param timeout: the JobTimeout of the process
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.expired = False
+        self._p = p
+        self._timeout = timeout
+        self._done = threading.Event()
+
+    def run(self):
+        start = time.time()
+        # the limit is read at each check, as a relative timeout changes while the jobs terminate
+        while not self._done.wait(TIMEOUT_POLL_INTERVAL):
+            limit = self._timeout.get_limit()
+            if limit is not None and time.time() - start > limit:
+                self.expired = True
+                try:
+                    self._p.kill()
+                except OSError:
+                    pass
+                return
+
+    def stop(self):
+        """
+        Stop the thread. This must be called when the process has terminated.
+        """
+        self._done.set()
+        self.join()
+
+
+def _wait_proc(p, timeout=None):
+    """
+    Read the standard output and error of a process and wait for its termination. If available,
+    os.wait4 is used to retrieve the resource usage of the process.
+
+    :param p: the subprocess.Popen object, with piped standard output and error
+    :param timeout: the JobTimeout of the process, or None. The process is killed when this expires.
+    :return: a tuple (standard output, standard error, resource usage, timed out). The resource usage is None if
+    os.wait4 is not available.
+    """
+    if timeout is None or not timeout.is_set():
+        out, err, rusage = _read_proc(p)
+        return out, err, rusage, False
+    watchdog = _Watchdog(p, timeout)
+    watchdog.start()
+    try:
+        out, err, rusage = _read_proc(p)
+    finally:
+        watchdog.stop()
+    return out, err, rusage, watchdog.expired
+
+
+def _read_proc(p):
+    """
+    Read the standard output and error of a process and wait for its termination.
+
+    :param p: the subprocess.Popen object, with both or none of standard output and error piped
+    :return: a tuple (standard output, standard error, resource usage). The standard output and error
+    are None if they are not piped. The resource usage is None if os.wait4 is not available.
+    """
+    if not hasattr(os, 'wait4'):
         out, err = p.communicate()
-    return out, err
+        return out, err, None
+    out, err = None, None
+    if p.stdout is not None:
+        # the standard output is read by a thread, so that neither pipe can fill up
+        chunks = []
+        reader = threading.Thread(target=lambda: chunks.append(p.stdout.read()))
+        reader.start()
+        err = p.stderr.read()
+        reader.join()
+        p.stdout.close()
+        p.stderr.close()
+        out = chunks[0]
+    status, rusage = os.wait4(p.pid, 0)[1:]
+    p.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return out, err, rusage
+
+
+def get_spool_files(spool_dir, id):
+    """
+    Return the files storing the standard output and error of a spooled job. These are named
+    as the files of the cluster jobs.
+
+    :param spool_dir: the spool directory
+    :param id: the job id
+    :return: a tuple (standard output file, standard error file)
+    """
+    return os.path.join(spool_dir, 'out', 'j' + str(id)), os.path.join(spool_dir, 'err', 'j' + str(id))
+
+
+def _read_tail(filename, size):
+    """
+    Read the final bytes of a file.
+
+    :param filename: the file
+    :param size: the maximum number of bytes to read
+    :return: the final bytes of the file
+    """
+    with open(filename, 'rb') as myfile:
+        myfile.seek(0, os.SEEK_END)
+        myfile.seek(max(0, myfile.tell() - size))
+        return myfile.read()
+
+
+def _get_max_rss(rusage):
+    """
+    Return the maximum resident set size of a resource usage in KB.
+
+    :param rusage: the resource usage as returned by os.wait4 or resource.getrusage
+    :return: the maximum resident set size in KB
+    """
+    # ru_maxrss is in bytes on macOS, and in KB on Linux
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss // 1024
+    return rusage.ru_maxrss
 
 
-def run_jobs_local(cmd, cmd_iter_substr, runs=1, local_cpus=1, output_msg=False, colnames=[]):
+def make_job_record(id, cmd, exit_status, start, end, err, user_time=None, sys_time=None, max_rss=None,
+                    attempts=1, timed_out=False):
+    """
+    Return the record of the execution of a job.
+
+    :param id: the job id
+    :param cmd: the executed command
+    :param exit_status: the exit status of the job (None if unknown)
+    :param start: the start time, in seconds since the epoch
+    :param end: the end time, in seconds since the epoch
+    :param err: the standard error of the job (bytes). Only the last MAX_RECORD_STDERR characters are stored
+    :param user_time: the user CPU time in seconds, or None if unknown
+    :param sys_time: the system CPU time in seconds, or None if unknown
+    :param max_rss: the maximum resident set size in KB, or None if unknown
+    :param attempts: the number of times the job was run
+    :param timed_out: True if the last attempt was killed because it timed out
+    :return: a dictionary with keys JOB_RECORD_COLUMNS
     """
-    Run jobs using python multiprocessing locally.
+    err = err.decode('utf-8', 'replace')[-MAX_RECORD_STDERR:]
+    return {'Job': id,
+            'Command': cmd,
+            'ExitStatus': exit_status,
+            'Start': start,
+            'End': end,
+            'WallTime': end - start,
+            'UserTime': user_time,
+            'SysTime': sys_time,
+            'MaxRSS': max_rss,
+            'Attempts': attempts,
+            'TimedOut': int(timed_out),
+            'Stderr': ' '.join(err.split())}
+
+
+def write_job_records(filename, records):
+    """
+    Write job records to a tab-separated file, sorted by job id. Unknown values are left empty.
+
+    :param filename: the output file
+    :param records: the list of job records as returned by make_job_record
+    """
+    def fmt(value):
+        if value is None:
+            return ''
+        if isinstance(value, float):
+            return '%.3f' % value
+        return str(value)
+
+    with open(filename, 'w') as fileout:
+        fileout.write('\t'.join(JOB_RECORD_COLUMNS) + '\n')
+        for record in sorted(records, key=lambda r: r['Job']):
+            fileout.write('\t'.join(fmt(record[col]) for col in JOB_RECORD_COLUMNS) + '\n')
+
+
+def read_job_records(filename):
+    """
+    Read job records from a tab-separated file written by write_job_records.
+
+    :param filename: the file of job records
+    :return: the list of job records. Unknown values and missing columns are None.
+    """
+    records = []
+    with open(filename, 'r') as filein:
+        header = next(filein).rstrip('\n').split('\t')
+        for line in filein:
+            values = line.rstrip('\n').split('\t')
+            record = dict((col, None) for col in JOB_RECORD_COLUMNS)
+            record.update(zip(header, [v if v != '' else None for v in values]))
+            for col in ['Job', 'ExitStatus', 'MaxRSS', 'Attempts', 'TimedOut']:
+                if record[col] is not None:
+                    record[col] = int(record[col])
+            for col in ['Start', 'End', 'WallTime', 'UserTime', 'SysTime']:
+                if record[col] is not None:
+                    record[col] = float(record[col])
+            records.append(record)
+    return records
+
+
+def summarise_job_records(records):
+    """
+    Log a summary of the job records: the failed jobs, the wall time and the peak memory.
+
+    :param records: the list of job records
+    :return: the list of ids of the jobs which failed or did not terminate
+    """
+    if not records:
+        return []
+    failed = sorted(r['Job'] for r in records if r['ExitStatus'] != 0)
+    timed_out = [r for r in records if r['TimedOut']]
+    for r in records:
+        if r['ExitStatus'] is None:
+            logger.warning('Job ' + str(r['Job']) + ' did not terminate: ' + r['Command'])
+        elif r['TimedOut']:
+            logger.warning('Job ' + str(r['Job']) + ' timed out (' + str(r['Attempts']) + ' attempts): ' +
+                           r['Command'])
+        elif r['ExitStatus'] != 0:
+            logger.warning('Job ' + str(r['Job']) + ' exited with status ' + str(r['ExitStatus']) + ': ' +
+                           r['Command'])
+    timed = sorted((r['WallTime'], r['Job']) for r in records if r['WallTime'] is not None)
+    if timed:
+        logger.info('Jobs: ' + str(len(records)) + ' (' + str(len(failed)) + ' failed' +
+                    (', ' + str(len(timed_out)) + ' timed out' if timed_out else '') + '). Wall time: median ' +
+                    '%.2fs, max %.2fs (job %s)' % (timed[len(timed) // 2][0], timed[-1][0], timed[-1][1]))
+    rss = sorted((r['MaxRSS'], r['Job']) for r in records if r['MaxRSS'] is not None)
+    if rss:
+        logger.info('Peak memory: %.1f MB (job %s)' % (rss[-1][0] / 1024.0, rss[-1][1]))
+    return failed
+
+
+def run_recorded_job(record_file, id, cmd):
+    """
+    Run a command and write its job record to record_file. The standard output is inherited, so that it
+    is written to the output file of the cluster job as the job runs. The standard error is forwarded
+    as it is read, and only its final SPOOL_TAIL_SIZE bytes are kept for the record.
+    This is used to record the jobs submitted to a cluster (see sbpipe.utils.run_job).
+
+    :param record_file: the file of the job record
+    :param id: the job id
+    :param cmd: the command to run
+    :return: the exit status of the command
+    """
+    err_stream = sys.stderr.buffer if sys.version_info > (3,) else sys.stderr
+    tail = b''
+    start = time.time()
+    p = subprocess.Popen(shlex.split(cmd), stderr=subprocess.PIPE)
+    for chunk in iter(lambda: os.read(p.stderr.fileno(), 65536), b''):
+        err_stream.write(chunk)
+        err_stream.flush()
+        tail = (tail + chunk)[-SPOOL_TAIL_SIZE:]
+    p.stderr.close()
+    p.stderr = None
+    rusage = _read_proc(p)[2]
+    end = time.time()
+    if rusage is None:
+        record = make_job_record(int(id), cmd, p.returncode, start, end, tail)
+    else:
+        record = make_job_record(int(id), cmd, p.returncode, start, end, tail,
+                                 rusage.ru_utime, rusage.ru_stime, _get_max_rss(rusage))
+    write_job_records(record_file, [record])
+    # processes terminated by a signal are reported as the shell does
+    return record['ExitStatus'] if record['ExitStatus'] >= 0 else 128 - record['ExitStatus']
+
+
+def get_local_cpus(local_cpus):
+    """
+    Return the number of worker processes to use for local computations.
+
+    :param local_cpus: the number of requested cpus, or AUTO_CPUS
+    :return: local_cpus, bounded by the number of physical cpus. 1 if local_cpus <= 0. The number
+    of physical cpus if local_cpus is AUTO_CPUS.
+    """
+    if local_cpus == AUTO_CPUS:
+        return multiprocessing.cpu_count()
+    if local_cpus <= 0:
+        return 1
+    if local_cpus > multiprocessing.cpu_count():
+        logger.warning('`local_cpus` is higher than the physical number of CPUs (' +
+                       str(multiprocessing.cpu_count()) + '). Setting `local_cpus` to ' +
+                       str(multiprocessing.cpu_count()))
+        return multiprocessing.cpu_count()
+    return local_cpus
+
+
+@contextmanager
+def local_pool():
+    """
+    Share one pool of worker processes among all the local computations run within this context
+    (e.g. data generation and data analysis of a pipeline). The pool is created by the first call
+    to run_jobs_local() and is closed when the context exits.
+    """
+    global _local_pool_scope
+    _local_pool_scope = True
+    try:
+        yield
+    except BaseException:
+        close_local_pool(terminate=True)
+        raise
+    finally:
+        _local_pool_scope = False
+        close_local_pool()
+
+
+def close_local_pool(terminate=False):
+    """
+    Close the shared pool of worker processes, if this exists.
+
+    :param terminate: True if the running jobs should be stopped, False if they should be completed
+    """
+    global _local_pool, _local_pool_size, _local_pool_resources
+    if _local_pool is not None:
+        if terminate:
+            _local_pool.terminate()
+        else:
+            _local_pool.close()
+        _local_pool.join()
+        logger.debug('Closed multiprocessing.Pool with ' + str(_local_pool_size))
+    _local_pool = None
+    _local_pool_size = 0
+    _local_pool_resources = None
+
+
+def _get_local_pool(local_cpus, resources=None, private=False):
+    """
+    Return a pool of local_cpus worker processes. Within local_pool(), the shared pool is returned.
+    This is re-created if it has less than local_cpus workers or if its workers have different resources.
+
+    :param local_cpus: the number of worker processes
+    :param resources: the JobResources applied to the worker processes when they start (see init_worker),
+    or None if the pool can have any resources
+    :param private: True if a new pool should be returned even within local_pool()
+    :return: a tuple (pool, shared). If shared is False, the pool must be closed by the caller.
+    """
+    global _local_pool, _local_pool_size, _local_pool_resources
+    initargs = dict() if resources is None else dict(initializer=init_worker, initargs=(resources,))
+    if private or not _local_pool_scope:
+        logger.debug('Initialised multiprocessing.Pool with ' + str(local_cpus))
+        return multiprocessing.Pool(local_cpus, **initargs), False
+    if _local_pool is None or _local_pool_size < local_cpus or \
+            (resources is not None and resources != _local_pool_resources):
+        close_local_pool()
+        _local_pool = multiprocessing.Pool(local_cpus, **initargs)
+        _local_pool_size = local_cpus
+        _local_pool_resources = resources
+        logger.debug('Initialised shared multiprocessing.Pool with ' + str(local_cpus))
+    return _local_pool, True
+
+
+def _get_job_resources(local_cpus, workers, cpus_per_job=0, pin_cpus=False):
+    """
+    Return the CPU resources of the jobs run by a pool of worker processes.
+
+    :param local_cpus: the number of requested cpus, or AUTO_CPUS
+    :param workers: the number of worker processes of the pool
+    :param cpus_per_job: the number of threads of the numerical libraries of each job. If 0, the
+    available cpus are shared among the jobs
+    :param pin_cpus: True if each job should run on a disjoint set of cpus_per_job cpus
+    :return: the JobResources
+    """
+    if local_cpus != AUTO_CPUS:
+        return JobResources(workers, cpus_per_job, pin_cpus)
+    # the automatic concurrency can run more jobs than cpus, so these cannot have disjoint sets of cpus.
+    # The threads are limited as if each cpu ran one job.
+    if pin_cpus:
+        logger.warning('`pin_cpus` is ignored if `local_cpus` is `auto`.')
+    return JobResources(multiprocessing.cpu_count(), cpus_per_job)
+
+
+def _log_job_output(out, err, output_msg=False):
+    """
+    Log the standard output and error of a job.
+
+    :param out: the standard output of the job (bytes)
+    :param err: the standard error of the job (bytes)
+    :param output_msg: print the output messages on screen
+    :return: True if the standard error does not contain the word `error`.
+    """
+    # convert byte to str. Necessary for Python 3+.
+    # this is also compatible with Python 2.7
+    # the tail of a spooled output can start within a multi-byte character
+    out = out.decode('utf-8', 'replace')
+    err = err.decode('utf-8', 'replace')
+
+    clean = True
+    if 'error' in err.lower():
+        logger.error('\n' + err)
+        clean = False
+    elif 'warning' in err.lower():
+        logger.warning('\n' + err)
+    else:
+        logger.debug('\n' + err)
+
+    if 'error' in out.lower():
+        logger.error('\n' + out)
+    elif 'warning' in out.lower():
+        logger.warning('\n' + out)
+    else:
+        if output_msg:
+            logger.info('\n' + out)
+        else:
+            logger.debug('\n' + out)
+    return clean
+
+
+def run_jobs_local(cmd, cmd_iter_substr, runs=1, local_cpus=1, output_msg=False, colnames=[], prepare_job=None,
+                   jobs_file=None, replicas_per_job=1, history=None, timeout=None, spool_dir=None, cpus_per_job=0,
+                   pin_cpus=False, max_memory=0):
+    """
+    Run jobs using python multiprocessing locally. The output of each job is checked as soon as
+    the job terminates. Within local_pool(), the pool of worker processes is reused.
 
     :param cmd: the full command to run as a job
     :param cmd_iter_substr: the substring in command to be replaced with a number
     :param runs: the number of runs. Ignored if colnames is not empty
     :param local_cpus: The number of available cpus. If local_cpus <=0, only one core will be used.
+    If AUTO_CPUS, the number of concurrent jobs is adapted to their CPU utilisation and memory.
     :param output_msg: print the output messages on screen (available for cluster_type='local' only)
     :param colnames: the name of the columns to process
+    :param prepare_job: a function called with the iteration number (or column name) as string
+    right before the corresponding job is dispatched.
+    :param jobs_file: the file storing the job records, or None if these should not be stored
+    :param replicas_per_job: the number of contiguous commands run in sequence by each worker invocation
+    :param history: the JobHistory of the iterations, or None. If this contains past durations, the jobs
+    expected to be longest are dispatched first. The durations of the successful jobs are added to the history.
+    :param timeout: the JobTimeout of the jobs, or None. Timed out jobs are killed and run again up to
+    the number of retries of the timeout. The job records report whether a job timed out.
+    :param spool_dir: the directory whose subfolders out/ and err/ store the standard output and error of
+    each job (see get_spool_files), or None if these should be kept in memory
+    :param cpus_per_job: the number of threads of the numerical libraries of each job (see JobResources).
+    If 0, the available cpus are shared among the local_cpus jobs
+    :param pin_cpus: True if each job should run on a disjoint set of cpus_per_job cpus (Linux only)
+    :param max_memory: the memory ceiling of the concurrent jobs in MB if local_cpus is AUTO_CPUS (see
+    AutoConcurrency). If 0, a fraction of the available memory is used
     :return: True
     """
+    if len(colnames) > 0:
+        runs = len(colnames)
+        iter_ids = colnames
+    else:
+        iter_ids = [str(i+1) for i in range(0, runs)]
+    # the job id is the position of the iteration, whatever the dispatch order
+    job_ids = dict((iter_id, i+1) for i, iter_id in enumerate(iter_ids))
+    if spool_dir is not None:
+        for folder in [os.path.join(spool_dir, 'out'), os.path.join(spool_dir, 'err')]:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+    expected = None
+    if history is not None:
+        expected = history.get_expected_durations(iter_ids)
+    dispatched = iter_ids
+    if expected is not None:
+        dispatched = order_longest_first(iter_ids, expected)
+        if local_cpus != AUTO_CPUS:
+            _check_useful_parallelism(list(expected.values()), local_cpus)
+        expected = dict((job_ids[iter_id], duration) for iter_id, duration in expected.items())
+
+    def params():
+        # jobs are prepared lazily, as the pool dispatches them (see _run_pool_jobs)
+        for iter_id in dispatched:
+            if prepare_job is not None:
+                with span('parcomp.prepare_job'):
+                    prepare_job(iter_id)
+            command = cmd.replace(cmd_iter_substr, iter_id)
+            logger.debug(command)
+            yield command, job_ids[iter_id], timeout, spool_dir
+
+    def update_history(records):
+        history.update(dict((iter_ids[r['Job'] - 1], r['WallTime']) for r in records if r['ExitStatus'] == 0))
+
+    def update_timeout(record):
+        if record['ExitStatus'] == 0:
+            timeout.add_duration(record['WallTime'])
+
+    if timeout is None or not timeout.is_set():
+        outcome = _run_pool_jobs(call_proc, params(), runs, local_cpus, output_msg, cmd.split(" ")[0], jobs_file,
+                                 replicas_per_job, expected, update_history if history is not None else None,
+                                 max_memory=max_memory, cpus_per_job=cpus_per_job, pin_cpus=pin_cpus)
+    else:
+        with timeout.monitor():
+            outcome = _run_pool_jobs(call_proc, params(), runs, local_cpus, output_msg, cmd.split(" ")[0],
+                                     jobs_file, replicas_per_job, expected,
+                                     update_history if history is not None else None, update_timeout, max_memory,
+                                     cpus_per_job, pin_cpus)
+    if spool_dir is not None:
+        logger.info("The output of each job is stored in the folders: ")
+        logger.info("\t" + os.path.join(spool_dir, 'out') + ' (standard output)')
+        logger.info("\t" + os.path.join(spool_dir, 'err') + ' (standard error)')
+    return outcome
+
+
+def _check_useful_parallelism(durations, local_cpus):
+    """
+    Warn if more cpus are used than the expected job durations can keep busy. The computation
+    cannot terminate before its longest job.
 
-    # Create a Pool.
-    pool = multiprocessing.Pool(1)
-    if local_cpus > 0:
-        if local_cpus <= multiprocessing.cpu_count():
-            # Create a pool with local_cpus
-            pool = multiprocessing.Pool(local_cpus)
-            logger.debug('Initialised multiprocessing.Pool with ' + str(local_cpus))
-        else:
-            logger.warning('`local_cpus` is higher than the physical number of CPUs (' +
-                           str(multiprocessing.cpu_count()) + '). Setting `local_cpus` to ' +
-                           str(multiprocessing.cpu_count()))
-            pool = multiprocessing.Pool(multiprocessing.cpu_count())
+    :param durations: the list of expected job durations in seconds
+    :param local_cpus: the number of requested cpus
+    """
+    useful = get_useful_parallelism(durations)
+    cpus = min(local_cpus, multiprocessing.cpu_count())
+    if cpus > useful:
+        logger.warning('`local_cpus` (' + str(cpus) + ') exceeds the useful parallelism of this computation (' +
+                       str(useful) + '). The longest job is expected to take ' +
+                       str(datetime.timedelta(seconds=int(round(max(durations))))))
 
-    logger.info("Starting computation...")
 
-    results = []
+def call_func(params):
+    """
+    Run a Python function, capturing its standard output and error. Exceptions are
+    reported in the standard error.
+
+    :param params: A tuple containing (the function, the tuple of arguments, the function call id)
+    :return: a tuple containing (the function call id, the standard output, the standard error, the job record).
+    The job record reports the peak memory of the worker process.
+    """
+    func, args, id = params
+    start = time.time()
+    usage = resource.getrusage(resource.RUSAGE_SELF) if resource is not None else None
+    exit_status = 0
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = StringIO(), StringIO()
+    try:
+        func(*args)
+    except Exception:
+        traceback.print_exc()
+        exit_status = 1
+    finally:
+        out, err = sys.stdout.getvalue(), sys.stderr.getvalue()
+        sys.stdout, sys.stderr = stdout, stderr
+    end = time.time()
+    out, err = out.encode('utf-8'), err.encode('utf-8')
+    cmd = func.__name__ + str(args)
+    if usage is None:
+        return id, out, err, make_job_record(id, cmd, exit_status, start, end, err)
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    return id, out, err, make_job_record(id, cmd, exit_status, start, end, err,
+                                         end_usage.ru_utime - usage.ru_utime, end_usage.ru_stime - usage.ru_stime,
+                                         _get_max_rss(end_usage))
+
+
+def run_funcs_local(func, args_list, local_cpus=1, output_msg=False, jobs_file=None, replicas_per_job=1,
+                    max_memory=0, history=None, cpus_per_job=0, pin_cpus=False, private_pool=False):
+    """
+    Run a Python function for each tuple of arguments using python multiprocessing locally.
+    The function is executed within the worker processes, so no new interpreter is started. The function
+    calls, and the processes they start, run with the thread limits and the CPUs of their worker (see init_worker).
+    Within local_pool(), the pool of worker processes is reused.
+
+    :param func: a module level function (it must be pickled)
+    :param args_list: the list of tuples of arguments. Each tuple corresponds to a job
+    :param local_cpus: The number of available cpus. If local_cpus <=0, only one core will be used.
+    :param output_msg: print the output messages on screen
+    :param jobs_file: the file storing the job records, or None if these should not be stored
+    :param replicas_per_job: the number of contiguous function calls run in sequence by each worker invocation
+    :param max_memory: the memory ceiling of the concurrent jobs in MB if local_cpus is AUTO_CPUS
+    :param history: the JobHistory of the calls, whose iterations are the call ids as strings, or None.
+    If set, the calls expected to be longest are dispatched first and the durations of the successful calls
+    are added to the history.
+    :param cpus_per_job: the number of threads of the numerical libraries of each call (see JobResources).
+    If 0, the available cpus are shared among the local_cpus calls
+    :param pin_cpus: True if each call should run on a disjoint set of cpus_per_job cpus (Linux only)
+    :param private_pool: True if the calls should run in a new pool of worker processes, which exit when the
+    calls have terminated (e.g. to release the state kept by the workers), even within local_pool()
+    :return: True
+    """
+    params = [(func, args, i+1) for i, args in enumerate(args_list)]
+    if history is None:
+        return _run_pool_jobs(call_func, params, len(params), local_cpus, output_msg, func.__name__, jobs_file,
+                              replicas_per_job, max_memory=max_memory, cpus_per_job=cpus_per_job, pin_cpus=pin_cpus,
+                              private_pool=private_pool)
+    expected = history.get_expected_durations([str(id) for func, args, id in params])
+    if expected is not None:
+        params.sort(key=lambda param: -expected[str(param[2])])
+        expected = dict((int(id), duration) for id, duration in expected.items())
+
+    def update_history(records):
+        history.update(dict((str(r['Job']), r['WallTime']) for r in records if r['ExitStatus'] == 0))
+
+    return _run_pool_jobs(call_func, params, len(params), local_cpus, output_msg, func.__name__, jobs_file,
+                          replicas_per_job, expected, update_history, max_memory=max_memory,
+                          cpus_per_job=cpus_per_job, pin_cpus=pin_cpus, private_pool=private_pool)
+
+
+def map_local(func, iterable, local_cpus=1, chunksize=1):
+    """
+    Apply a function to each item using python multiprocessing locally. Results are yielded in the
+    order of the items as soon as they are available. If only one cpu is used, the items are processed
+    by the current process. Within local_pool(), the pool of worker processes is reused.
+
+    :param func: a module level function (it must be pickled)
+    :param iterable: the items to process
+    :param local_cpus: The number of available cpus. If local_cpus <=0, only one core will be used.
+    :param chunksize: the number of items sent to a worker process at once
+    :return: a generator of the results
+    """
+    local_cpus = get_local_cpus(local_cpus)
+    if local_cpus == 1:
+        for item in iterable:
+            yield func(item)
+        return
+    pool, shared = _get_local_pool(local_cpus)
+    try:
+        for result in pool.imap(func, iterable, chunksize):
+            yield result
+    finally:
+        if not shared:
+            pool.close()
+            pool.join()
+
+
+def call_batch(params):
+    """
+    Run a batch of jobs in sequence within the same worker process.
+
+    :param params: A tuple containing (the worker function, the list of job parameters)
+    :return: the list of the results of the worker function
+    """
+    worker, batch = params
+    return [worker(job_params) for job_params in batch]
+
+
+def _get_batches(worker, params, size):
+    """
+    Group contiguous job parameters in batches. Parameters are consumed lazily.
+
+    :param worker: the worker function
+    :param params: an iterable of job parameters
+    :param size: the maximum number of jobs per batch
+    :return: a generator of tuples (worker, list of job parameters)
+    """
+    params = iter(params)
+    batch = list(islice(params, size))
+    while batch:
+        yield worker, batch
+        batch = list(islice(params, size))
+
+
+def _run_pool_jobs(worker, params, runs, local_cpus, output_msg, job_name, jobs_file=None, replicas_per_job=1,
+                   expected=None, on_complete=None, on_record=None, max_memory=0, cpus_per_job=0, pin_cpus=False,
+                   private_pool=False):
+    """
+    Run jobs using a pool of worker processes. The output and the exit status of each job are checked as soon as
+    the job terminates.
+
+    :param worker: a function returning a tuple (job id, standard output, standard error, job record) for each params
+    :param params: an iterable of job parameters
+    :param runs: the number of jobs
+    :param local_cpus: The number of available cpus. If local_cpus <=0, only one core will be used.
+    If AUTO_CPUS, the number of concurrent jobs is adapted by an AutoConcurrency, starting with a worker
+    per cpu.
+    :param output_msg: print the output messages on screen
+    :param job_name: the name of the executed program, used in the output messages
+    :param jobs_file: the file storing the job records, or None if these should not be stored
+    :param replicas_per_job: the number of contiguous jobs run in sequence by each worker invocation.
+    Output, records and progress are still reported for each job
+    :param expected: a dictionary of job ids and expected durations in seconds used to estimate the remaining
+    time, or None
+    :param on_complete: a function called with the list of job records when all the jobs have terminated, or None
+    :param on_record: a function called with the record of each job as soon as this terminates, or None
+    :param max_memory: the memory ceiling of the concurrent jobs in MB if local_cpus is AUTO_CPUS
+    :param cpus_per_job: the number of threads of the numerical libraries of each job (see JobResources)
+    :param pin_cpus: True if each job should run on a disjoint set of cpus_per_job cpus. This is ignored
+    if local_cpus is AUTO_CPUS
+    :param private_pool: True if the jobs should run in a new pool, closed when they have terminated
+    :return: True
+    """
+
+    params = iter(params)
+    if local_cpus == AUTO_CPUS:
+        # the pool starts with a worker per cpu. Jobs are dispatched when allowed. If the concurrency exceeds
+        # the workers, the running jobs are completed and the remaining jobs run in a larger pool.
+        max_workers = get_max_workers(runs)
+        concurrency = AutoConcurrency(max_workers, max_memory, replicas_per_job)
+        workers = get_initial_workers(max_workers)
+        max_limit = workers
+    else:
+        workers = get_local_cpus(local_cpus)
+        # the task handler of the pool would consume all the parameters at once. Instead, a job is
+        # dispatched (and its inputs prepared) only when few jobs are waiting for a worker.
+        concurrency = Concurrency(workers * PREFETCH_JOBS, replicas_per_job)
+        max_limit = None
+
+    logger.info("Starting computation...")
 
     # get the current level for the StreamHandler
     # this must be executed at run-time
@@ -186,53 +964,64 @@ def run_jobs_local(cmd, cmd_iter_substr, runs=1, local_cpus=1, output_msg=False,
     else:
         handler_level = logging.INFO
 
-    if len(colnames) > 0:
-        runs = len(colnames)
-        for i, column in enumerate(colnames):
-            command = cmd.replace(cmd_iter_substr, column)
-            logger.debug(command)
-            params = (command, i+1, runs, handler_level)
-            results.append(pool.apply_async(call_proc, (params,)))
-    else:
-        for i in range(0, runs):
-            command = cmd.replace(cmd_iter_substr, str(i+1))
-            logger.debug(command)
-            params = (command, i+1, runs, handler_level)
-            results.append(pool.apply_async(call_proc, (params,)))
-
-    # Close the pool and wait for each running task to complete
-    pool.close()
-    pool.join()
-
     failed = 0
-    for result in results:
-
-        out, err = result.get()
-        # convert byte to str. Necessary for Python 3+.
-        # this is also compatible with Python 2.7
-        out = out.decode('utf-8')
-        err = err.decode('utf-8')
-
-        if 'error' in err.lower():
-            logger.error('\n' + err)
-            failed += 1
-        elif 'warning' in err.lower():
-            logger.warning('\n' + err)
-        else:
-            logger.debug('\n' + err)
-
-        if 'error' in out.lower():
-            logger.error('\n' + out)
-        elif 'warning' in out.lower():
-            logger.warning('\n' + out)
-        else:
-            if output_msg:
-                logger.info('\n' + out)
-            else:
-                logger.debug('\n' + out)
+    completed = 0
+    records = []
+    # the expected durations of the jobs which did not terminate
+    remaining = dict(expected or {})
+    done_expected = done_actual = 0.0
+    try:
+        while True:
+            # the workers apply the resources of the jobs when they start, so these are sized from the pool
+            pool, shared = _get_local_pool(workers, _get_job_resources(local_cpus, workers, cpus_per_job, pin_cpus),
+                                           private_pool)
+            try:
+                # results are processed in order of completion
+                if replicas_per_job > 1:
+                    results = chain.from_iterable(pool.imap_unordered(
+                        call_batch, _get_batches(worker, concurrency.throttle(params, max_limit), replicas_per_job)))
+                else:
+                    results = pool.imap_unordered(worker, concurrency.throttle(params, max_limit))
+                for id, out, err, record in results:
+                    completed += 1
+                    records.append(record)
+                    logger.debug('Terminated job ' + str(id) + ' with exit status ' + str(record['ExitStatus']))
+                    if on_record is not None:
+                        on_record(record)
+                    concurrency.add_record(record)
+                    if not _log_job_output(out, err, output_msg) or record['ExitStatus'] != 0:
+                        failed += 1
+                    eta = None
+                    if id in remaining:
+                        done_expected += remaining.pop(id)
+                        done_actual += record['WallTime']
+                        eta = estimate_remaining_time(list(remaining.values()),
+                                                      concurrency.get_limit() if local_cpus == AUTO_CPUS else workers,
+                                                      done_expected, done_actual)
+                    if handler_level <= logging.INFO:
+                        progress_bar2(completed, runs, eta)
+            finally:
+                if not shared:
+                    # Close the pool and wait for each running task to complete
+                    pool.close()
+                    pool.join()
+            if max_limit is None or concurrency.is_exhausted():
+                break
+            workers = max_limit = get_grown_workers(workers, concurrency.get_limit(), max_workers)
+            logger.debug('Growing the pool to ' + str(workers) + ' workers')
+    finally:
+        concurrency.stop()
 
     # Print the status of the parallel computation.
     logger.info("Computation terminated.")
+    if local_cpus == AUTO_CPUS:
+        logger.info('Concurrent jobs at the end of the computation: ' + str(concurrency.get_limit()))
+    if jobs_file is not None:
+        write_job_records(jobs_file, records)
+    summarise_job_records(records)
+    add_job_events(job_name, records)
+    if on_complete is not None:
+        on_complete(records)
     if failed == runs:
         logger.warning('All computations seem to have errors in the standard error.')
         logger.warning("For additional information, run SBpipe using the `--verbose` option.")
@@ -241,174 +1030,308 @@ def run_jobs_local(cmd, cmd_iter_substr, runs=1, local_cpus=1, output_msg=False,
         logger.warning("Some computation might have failed. Do all output files exist?")
         logger.warning("For additional information, run SBpipe using the `--verbose` option.")
     else:
-        logger.info("If errors occur, check that " + cmd.split(" ")[0] + " runs correctly.")
+        logger.info("If errors occur, check that " + job_name + " runs correctly.")
         logger.info("For additional information, run SBpipe using the `--verbose` option.")
     return True
 
 
-def run_jobs_sge(cmd, cmd_iter_substr, out_dir, err_dir, runs=1, colnames=[]):
+def write_job_array_script(cmd, cmd_iter_substr, iter_ids, task_id_var, filename, record_dir=None,
+                           replicas_per_job=1):
     """
-    Run jobs using a Sun Grid Engine (SGE) cluster.
+    Write a shell script running the commands of a job array. The commands are grouped in batches of
+    replicas_per_job contiguous commands. The script runs the batch whose position (starting from 1) is
+    the task index of the job array, set by the cluster in the environment variable task_id_var.
+    The commands of a batch are run in sequence. The task fails if any of its commands fails.
 
     :param cmd: the full command to run as a job
-    :param cmd_iter_substr: the substring in command to be replaced with a number
-    :param out_dir: the directory containing the standard output from qsub
-    :param err_dir: the directory containing the standard error from qsub
-    :param runs: the number of runs. Ignored if colnames is not empty
-    :param colnames: the name of the columns to process
-    :return: True if the computation succeeded.
+    :param cmd_iter_substr: the substring in command to be replaced with an element of iter_ids
+    :param iter_ids: the list of iteration numbers (or column names) as strings
+    :param task_id_var: the environment variable containing the task index (e.g. SGE_TASK_ID)
+    :param filename: the script file
+    :param record_dir: the directory storing the record of each job (see get_job_record_file), or None
+    if the jobs should not be recorded. Jobs are recorded only on the nodes which can run sbpipe.utils.run_job
+    with the current interpreter; the other nodes run the bare commands
+    :param replicas_per_job: the number of commands run by each task
+    """
+    with open(filename, 'w') as script:
+        script.write('#!/bin/sh\n')
+        if record_dir is not None:
+            # make sbpipe importable on the cluster nodes, whether or not it is installed there
+            sbpipe_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            script.write('PYTHONPATH=' + quote(sbpipe_path) + '${PYTHONPATH:+:$PYTHONPATH}; export PYTHONPATH\n')
+            # the commands run without a record on the nodes which cannot run sbpipe.utils.run_job
+            script.write('if ' + quote(sys.executable) + ' -c "import sbpipe.utils.run_job" >/dev/null 2>&1; '
+                         'then record=1; else record=; fi\n')
+        script.write('case "$' + task_id_var + '" in\n')
+        for task, first in enumerate(range(0, len(iter_ids), replicas_per_job)):
+            commands = []
+            for i in range(first, min(first + replicas_per_job, len(iter_ids))):
+                command = cmd.replace(cmd_iter_substr, iter_ids[i])
+                if record_dir is not None:
+                    # the command is run by sbpipe.utils.run_job, which records its execution
+                    recorded = ' '.join([quote(sys.executable), '-m', 'sbpipe.utils.run_job',
+                                         quote(get_job_record_file(record_dir, i+1)), str(i+1), quote(command)])
+                    command = 'if [ -n "$record" ]; then ' + recorded + '; else ' + command + '; fi'
+                commands.append(command)
+            if len(commands) == 1 and record_dir is None:
+                script.write('  ' + str(task+1) + ') exec ' + commands[0] + ' ;;\n')
+            elif len(commands) == 1:
+                script.write('  ' + str(task+1) + ') ' + commands[0] + '\n')
+                script.write('    exit $? ;;\n')
+            else:
+                script.write('  ' + str(task+1) + ') status=0\n')
+                for command in commands:
+                    script.write('    ' + command + ' || status=$?\n')
+                script.write('    exit $status ;;\n')
+        script.write('esac\n')
+        script.write('echo "Error: unknown task index $' + task_id_var + '" >&2\n')
+        script.write('exit 1\n')
+    os.chmod(filename, 0o755)
+
+
+def get_job_record_file(record_dir, task):
     """
-    # Test this with echo "ls -la" | xargs xargs using Python environment.
-    # The following works:
-    # lsCMD = "ls -la"
-    # echo_cmd=["echo", lsCMD]
-    # xargsCMD=["xargs", "xargs"]
-    # echo_proc = subprocess.Popen(echo_cmd, stdout=subprocess.PIPE)
-    # xargsProc = subprocess.Popen(xargsCMD, stdin=echo_proc.stdout)
+    Return the file of the record of a cluster job.
 
-    logger.info("Starting computation...")
-    jobs = ""
-    cmd_iter_substr = cmd_iter_substr.strip('/')
+    :param record_dir: the directory storing the job records
+    :param task: the task index of the job (starting from 1)
+    :return: the record file
+    """
+    return os.path.join(record_dir, 'r' + str(task) + '.tsv')
 
-    # get the current level for the StreamHandler
-    # this must be executed at run-time
-    if len(logger.handlers) > 1:
-        handler_level = logger.handlers[1].level
+
+def collect_job_records(record_dir, iter_ids, cmd, cmd_iter_substr, jobs_file):
+    """
+    Collect the records of the cluster jobs in jobs_file. Jobs without a record did not terminate,
+    and are reported with an unknown exit status.
+
+    :param record_dir: the directory storing the job records
+    :param iter_ids: the list of iteration numbers (or column names) as strings
+    :param cmd: the full command run as a job
+    :param cmd_iter_substr: the substring in command replaced with an element of iter_ids
+    :param jobs_file: the file storing the job records
+    :return: the list of job records
+    """
+    records = []
+    for i, iter_id in enumerate(iter_ids):
+        record_file = get_job_record_file(record_dir, i+1)
+        if os.path.isfile(record_file):
+            records.extend(read_job_records(record_file))
+            os.remove(record_file)
+        else:
+            records.append(dict((col, None) for col in JOB_RECORD_COLUMNS))
+            records[-1]['Job'] = i+1
+            records[-1]['Command'] = cmd.replace(cmd_iter_substr, iter_id)
+    write_job_records(jobs_file, records)
+    return records
+
+
+def run_cluster_cmds(cluster_cmds):
+    """
+    Run cluster commands concurrently and wait for their termination.
+    Commands submitting jobs should block until the jobs have terminated (e.g. `qsub -sync y` or
+    `bsub -K`), so that the termination of the jobs is notified by the cluster instead of being polled.
+
+    :param cluster_cmds: the list of commands
+    :return: the list of standard output (and error) of the commands
+    """
+    procs = []
+    for cluster_cmd in cluster_cmds:
+        logger.debug(cluster_cmd)
+        procs.append(subprocess.Popen(cluster_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+    outputs = []
+    for p in procs:
+        outputs.append(p.communicate()[0].decode('utf-8'))
+        logger.debug(outputs[-1])
+    return outputs
+
+
+def check_job_states(job_states, iter_ids, replicas_per_job=1):
+    """
+    Report the jobs which did not terminate successfully.
+
+    :param job_states: a dictionary of task indexes (starting from 1) and exit status (0 if successful)
+    :param iter_ids: the list of iteration numbers (or column names) as strings
+    :param replicas_per_job: the number of contiguous iterations run by each task
+    :return: the list of iteration numbers (or column names) of the failed jobs. If a task runs more
+    iterations, all its iterations are returned (see the job records for the exit status of each iteration)
+    """
+    failed = [iter_id for i, iter_id in enumerate(iter_ids) if job_states.get(i // replicas_per_job + 1) != 0]
+    if failed and replicas_per_job > 1:
+        logger.warning(str(len(failed)) + " of " + str(len(iter_ids)) +
+                       " replicas were run by jobs which failed or did not terminate: " + ", ".join(failed))
+    elif failed:
+        logger.warning(str(len(failed)) + " of " + str(len(iter_ids)) +
+                       " jobs failed or did not terminate: " + ", ".join(failed))
     else:
-        handler_level = logging.INFO
+        logger.debug("All " + str(len(iter_ids)) + " jobs terminated successfully.")
+    return failed
+
+
+def get_failed_tasks(job_states, jobs):
+    """
+    Return the task indexes of the jobs of an array which did not terminate successfully.
+
+    :param job_states: a dictionary of task indexes (starting from 1) and exit status (0 if successful)
+    :param jobs: the number of jobs of the array
+    :return: the list of task indexes
+    """
+    return [task for task in range(1, jobs + 1) if job_states.get(task) != 0]
+
+
+def _prepare_job_array(cmd, cmd_iter_substr, out_dir, runs, colnames, prepare_job, task_id_var, replicas_per_job=1):
+    """
+    Prepare the job inputs and the script of a job array. The jobs record their execution in out_dir.
 
+    :return: a tuple (job name, script file, iteration numbers or column names)
+    """
+    cmd_iter_substr = cmd_iter_substr.strip('/')
     if len(colnames) > 0:
-        runs = len(colnames)
-        for i, column in enumerate(colnames):
-            # Now the same with qsub
-            jobs = "j" + column + "_" + cmd_iter_substr + "," + jobs
-            qsub_cmd = ["qsub", "-cwd", "-V", "-N", "j" + column + "_" + cmd_iter_substr, "-o", os.path.join(out_dir, "j" + column), "-e", os.path.join(err_dir, "j" + column), "-b", "y", cmd.replace(cmd_iter_substr, column)]
-            logger.debug(qsub_cmd)
-            #logger.info('Starting Task ' + column)
-            if sys.version_info > (3,):
-                with subprocess.Popen(qsub_cmd, stdout=subprocess.PIPE) as p:
-                    p.communicate()[0]
-            else:
-                qsub_proc = subprocess.Popen(qsub_cmd, stdout=subprocess.PIPE)
-                qsub_proc.communicate()[0]
-            if handler_level <= logging.INFO:
-                sleep(0.01)
-                progress_bar(i+1, runs)
+        iter_ids = colnames
     else:
-        for i in range(0, runs):
-            # Now the same with qsub
-            jobs = "j" + str(i+1) + "_" + cmd_iter_substr + "," + jobs
-            qsub_cmd = ["qsub", "-cwd", "-V", "-N", "j" + str(i+1) + "_" + cmd_iter_substr, "-o", os.path.join(out_dir, "j" + str(i+1)), "-e", os.path.join(err_dir, "j" + str(i+1)), "-b", "y", cmd.replace(cmd_iter_substr, str(i+1))]
-            logger.debug(qsub_cmd)
-            #logger.info('Starting Task ' + str(i+1))
-            if sys.version_info > (3,):
-                with subprocess.Popen(qsub_cmd, stdout=subprocess.PIPE) as p:
-                    p.communicate()[0]
-            else:
-                qsub_proc = subprocess.Popen(qsub_cmd, stdout=subprocess.PIPE)
-                qsub_proc.communicate()[0]
-            if handler_level <= logging.INFO:
-                sleep(0.01)
-                progress_bar(i+1, runs)
-    # Check here when these jobs are finished before proceeding
-    # don't add names for output and error files as they can generate errors..
-    qsub_cmd = ["qsub", "-sync", "y", "-b", "y", "-o", "/dev/null", "-e", "/dev/null", "-hold_jid", jobs[:-1], "sbpipe_" + cmd_iter_substr, "1"]
-    if sys.version_info > (3,):
-        with subprocess.Popen(qsub_cmd, stdout=subprocess.PIPE) as p:
-            p.communicate()[0]
+        iter_ids = [str(i+1) for i in range(0, runs)]
+    if prepare_job is not None:
+        for iter_id in iter_ids:
+            with span('parcomp.prepare_job'):
+                prepare_job(iter_id)
+    job_name = "j" + cmd_iter_substr
+    script = os.path.join(out_dir, job_name + ".sh")
+    write_job_array_script(cmd, cmd_iter_substr, iter_ids, task_id_var, script, out_dir, replicas_per_job)
+    return job_name, script, iter_ids
+
+
+def get_job_count(runs, replicas_per_job=1):
+    """
+    Return the number of jobs running runs iterations in batches.
+
+    :param runs: the number of iterations
+    :param replicas_per_job: the number of contiguous iterations run by each job
+    :return: the number of jobs
+    """
+    return (runs + replicas_per_job - 1) // replicas_per_job
+
+
+def _log_submission(runs, replicas_per_job):
+    """
+    Log the number of submitted jobs.
+
+    :param runs: the number of iterations
+    :param replicas_per_job: the number of contiguous iterations run by each job
+    """
+    if replicas_per_job > 1:
+        logger.info("Submitting " + str(get_job_count(runs, replicas_per_job)) + " jobs (" + str(runs) +
+                    " replicas, " + str(replicas_per_job) + " per job)")
     else:
-        qsub_proc = subprocess.Popen(qsub_cmd, stdout=subprocess.PIPE)
-        qsub_proc.communicate()[0]
-    logger.debug(qsub_cmd)
-    logger.info("Computation terminated.")
-    return quick_debug(cmd, out_dir, err_dir)
+        logger.info("Submitting " + str(runs) + " jobs")
 
 
-def run_jobs_lsf(cmd, cmd_iter_substr, out_dir, err_dir, runs=1, colnames=[]):
+def _get_job_array_ranges(jobs):
     """
-    Run jobs using a Load Sharing Facility (LSF) cluster.
+    Split the task indexes of jobs in ranges of at most MAX_JOB_ARRAY_SIZE.
+
+    :param jobs: the number of jobs
+    :return: the list of tuples (first task index, last task index)
+    """
+    return [(start, min(start + MAX_JOB_ARRAY_SIZE - 1, jobs))
+            for start in range(1, jobs + 1, MAX_JOB_ARRAY_SIZE)]
+
+
+def run_jobs_sge(cmd, cmd_iter_substr, out_dir, err_dir, runs=1, colnames=[], prepare_job=None, jobs_file=None,
+                 replicas_per_job=1):
+    """
+    Run jobs using a Sun Grid Engine (SGE) cluster. Jobs are submitted as array jobs.
+    The exit status of each job is retrieved from `qsub -sync y`.
 
     :param cmd: the full command to run as a job
     :param cmd_iter_substr: the substring in command to be replaced with a number
-    :param out_dir: the directory containing the standard output from bsub
-    :param err_dir: the directory containing the standard error from bsub
+    :param out_dir: the directory containing the standard output from qsub. The file of each job is named j<task>,
+    where <task> is the task index of the job in the array
+    :param err_dir: the directory containing the standard error from qsub (named as the standard output)
     :param runs: the number of runs. Ignored if colnames is not empty
     :param colnames: the name of the columns to process
+    :param prepare_job: a function called with the iteration number (or column name) as string
+    before the jobs are submitted.
+    :param jobs_file: the file storing the job records. If None, this is stored in out_dir
+    :param replicas_per_job: the number of contiguous iterations run in sequence by each job of the array
     :return: True if the computation succeeded.
     """
     logger.info("Starting computation...")
-    jobs = ""
-    cmd_iter_substr = cmd_iter_substr.strip('/')
+    job_name, script, iter_ids = _prepare_job_array(cmd, cmd_iter_substr, out_dir, runs, colnames,
+                                                    prepare_job, 'SGE_TASK_ID', replicas_per_job)
+    # $TASK_ID is replaced by SGE with the task index
+    qsub_cmds = [["qsub", "-cwd", "-V", "-sync", "y", "-t", str(first) + "-" + str(last), "-N", job_name,
+                  "-o", os.path.join(out_dir, "j$TASK_ID"), "-e", os.path.join(err_dir, "j$TASK_ID"),
+                  "-b", "y", script]
+                 for first, last in _get_job_array_ranges(get_job_count(len(iter_ids), replicas_per_job))]
+    _log_submission(len(iter_ids), replicas_per_job)
+    job_states = dict()
+    for output in run_cluster_cmds(qsub_cmds):
+        # e.g. Job 4242.3 exited with exit code 0.
+        for task, exit_code in re.findall(r'Job \d+\.(\d+) exited with exit code (\d+)', output):
+            job_states[int(task)] = int(exit_code)
+    logger.info("Computation terminated.")
+    check_job_states(job_states, iter_ids, replicas_per_job)
+    if jobs_file is None:
+        jobs_file = os.path.join(out_dir, JOBS_FILE)
+    records = collect_job_records(out_dir, iter_ids, cmd, cmd_iter_substr.strip('/'), jobs_file)
+    summarise_job_records(records)
+    add_job_events(cmd.split(" ")[0], records)
+    return quick_debug(cmd, out_dir, err_dir,
+                       get_failed_tasks(job_states, get_job_count(len(iter_ids), replicas_per_job)))
 
-    # get the current level for the StreamHandler
-    # this must be executed at run-time
-    if len(logger.handlers) > 1:
-        handler_level = logger.handlers[1].level
-    else:
-        handler_level = logging.INFO
 
-    if len(colnames) > 0:
-        runs = len(colnames)
-        for i, column in enumerate(colnames):
-            jobs = "done(j" + column + "_" + cmd_iter_substr + ")&&" + jobs
-            bsub_cmd = ["bsub", "-cwd", "-J", "j" + column + "_" + cmd_iter_substr, "-o", os.path.join(out_dir, "j" + column), "-e",
-                        os.path.join(err_dir, "j" + column), cmd.replace(cmd_iter_substr, column)]
-            logger.debug(bsub_cmd)
-            #logger.info('Starting Task ' + column)
-            if sys.version_info > (3,):
-                with subprocess.Popen(bsub_cmd, stdout=subprocess.PIPE) as p:
-                    p.communicate()[0]
-            else:
-                bsub_proc = subprocess.Popen(bsub_cmd, stdout=subprocess.PIPE)
-                bsub_proc.communicate()[0]
-            if handler_level <= logging.INFO:
-                sleep(0.01)
-                progress_bar(i+1, runs)
-    else:
-        for i in range(0, runs):
-            jobs = "done(j" + str(i+1) + "_" + cmd_iter_substr + ")&&" + jobs
-            bsub_cmd = ["bsub", "-cwd", "-J", "j" + str(i+1) + "_" + cmd_iter_substr, "-o", os.path.join(out_dir, "j" + str(i+1)), "-e", os.path.join(err_dir, "j" + str(i+1)), cmd.replace(cmd_iter_substr, str(i+1))]
-            logger.debug(bsub_cmd)
-            #logger.info('Starting Task ' + str(i+1))
-            if sys.version_info > (3,):
-                with subprocess.Popen(bsub_cmd, stdout=subprocess.PIPE) as p:
-                    p.communicate()[0]
-            else:
-                bsub_proc = subprocess.Popen(bsub_cmd, stdout=subprocess.PIPE)
-                bsub_proc.communicate()[0]
-            if handler_level <= logging.INFO:
-                sleep(0.01)
-                progress_bar(i + 1, runs)
-    # Check here when these jobs are finished before proceeding
-    import random
-    import string
-    job_name = ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(7))
-    bsub_cmd = ["bsub", "-J", job_name, "-o", "/dev/null", "-e", "/dev/null", "-w", jobs[:-2], "sbpipe_" + cmd_iter_substr, "1"]
-    logger.debug(bsub_cmd)
-    if sys.version_info > (3,):
-        with subprocess.Popen(bsub_cmd, stdout=subprocess.PIPE) as p:
-            p.communicate()[0]
-    else:
-        bsub_proc = subprocess.Popen(bsub_cmd, stdout=subprocess.PIPE)
-        bsub_proc.communicate()[0]
-    # Something better than the following would be highly desirable
-    import time
-    found = True
-    while found:
-        time.sleep(2)
-        if sys.version_info > (3,):
-            with subprocess.Popen(["bjobs", "-psr"], stdout=subprocess.PIPE) as p:
-                output = p.communicate()[0]
-        else:
-            my_poll = subprocess.Popen(["bjobs", "-psr"], stdout=subprocess.PIPE)
-            output = my_poll.communicate()[0]
-        if job_name not in output:
-            found = False
+def run_jobs_lsf(cmd, cmd_iter_substr, out_dir, err_dir, runs=1, colnames=[], prepare_job=None, jobs_file=None,
+                 replicas_per_job=1):
+    """
+    Run jobs using a Load Sharing Facility (LSF) cluster. Jobs are submitted as job arrays
+    using `bsub -K`, which returns when the job array has terminated. The exit status of the jobs
+    is then retrieved with one call to `bjobs`.
+
+    :param cmd: the full command to run as a job
+    :param cmd_iter_substr: the substring in command to be replaced with a number
+    :param out_dir: the directory containing the standard output from bsub. The file of each job is named j<task>,
+    where <task> is the task index of the job in the array
+    :param err_dir: the directory containing the standard error from bsub (named as the standard output)
+    :param runs: the number of runs. Ignored if colnames is not empty
+    :param colnames: the name of the columns to process
+    :param prepare_job: a function called with the iteration number (or column name) as string
+    before the jobs are submitted.
+    :param jobs_file: the file storing the job records. If None, this is stored in out_dir
+    :param replicas_per_job: the number of contiguous iterations run in sequence by each job of the array
+    :return: True if the computation succeeded.
+    """
+    logger.info("Starting computation...")
+    job_name, script, iter_ids = _prepare_job_array(cmd, cmd_iter_substr, out_dir, runs, colnames,
+                                                    prepare_job, 'LSB_JOBINDEX', replicas_per_job)
+    # %I is replaced by LSF with the job array index
+    bsub_cmds = [["bsub", "-K", "-cwd", os.getcwd(),
+                  "-J", job_name + "_" + str(first) + "[" + str(first) + "-" + str(last) + "]",
+                  "-o", os.path.join(out_dir, "j%I"), "-e", os.path.join(err_dir, "j%I"), script]
+                 for first, last in _get_job_array_ranges(get_job_count(len(iter_ids), replicas_per_job))]
+    _log_submission(len(iter_ids), replicas_per_job)
+    job_ids = []
+    for output in run_cluster_cmds(bsub_cmds):
+        # e.g. Job <4242> is submitted to default queue <normal>.
+        job_ids.extend(re.findall(r'Job <(\d+)> is submitted', output))
     logger.info("Computation terminated.")
-    return quick_debug(cmd, out_dir, err_dir)
+    job_states = dict()
+    if job_ids:
+        bjobs_cmd = ["bjobs", "-a", "-w"] + job_ids
+        output = run_cluster_cmds([bjobs_cmd])[0]
+        # e.g. 4242    user    DONE  normal  host1  host2  jname_1[3]  Jan  1 10:00
+        for state, task in re.findall(r'^\d+\s+\S+\s+(\w+)\s+.*?\S+\[(\d+)\]', output, re.MULTILINE):
+            job_states[int(task)] = 0 if state == 'DONE' else 1
+    check_job_states(job_states, iter_ids, replicas_per_job)
+    if jobs_file is None:
+        jobs_file = os.path.join(out_dir, JOBS_FILE)
+    records = collect_job_records(out_dir, iter_ids, cmd, cmd_iter_substr.strip('/'), jobs_file)
+    summarise_job_records(records)
+    add_job_events(cmd.split(" ")[0], records)
+    return quick_debug(cmd, out_dir, err_dir,
+                       get_failed_tasks(job_states, get_job_count(len(iter_ids), replicas_per_job)))
 
 
-def quick_debug(cmd, out_dir, err_dir):
+def quick_debug(cmd, out_dir, err_dir, failed_tasks=None):
     """
     Look up for `error` and `warning` in the standard output and error files.
     A simple debugging function checking the generated log files. We don't stop the computation because it happens
@@ -417,20 +1340,27 @@ def quick_debug(cmd, out_dir, err_dir):
     :param cmd: the executed command
     :param out_dir: the directory containing the standard output files
     :param err_dir: the directory contining the standard error files
+    :param failed_tasks: the task indexes of the jobs which failed (see get_failed_tasks). The files of the
+    first MAX_DEBUG_TASKS failed jobs are inspected. If None or empty, the files of the first job are inspected
     :return: True
     """
     outcome = True
 
     logger.debug("Running parcomp.quick_debug()")
 
-    filename = os.path.join(err_dir, "j1")
-    if os.path.isfile(filename):
-        if not is_output_file_clean(filename, 'standard error'):
-            outcome = False
-    filename = os.path.join(out_dir, "j1")
-    if os.path.isfile(filename):
-        if not is_output_file_clean(filename, 'standard output'):
-            outcome = False
+    tasks = failed_tasks[:MAX_DEBUG_TASKS] if failed_tasks else [1]
+    if failed_tasks and len(failed_tasks) > MAX_DEBUG_TASKS:
+        logger.warning('Inspecting the output of the first ' + str(MAX_DEBUG_TASKS) + ' of ' +
+                       str(len(failed_tasks)) + ' failed jobs')
+    for task in tasks:
+        filename = os.path.join(err_dir, "j" + str(task))
+        if os.path.isfile(filename):
+            if not is_output_file_clean(filename, 'standard error of job ' + str(task)):
+                outcome = False
+        filename = os.path.join(out_dir, "j" + str(task))
+        if os.path.isfile(filename):
+            if not is_output_file_clean(filename, 'standard output of job ' + str(task)):
+                outcome = False
     if not outcome:
         logger.warning("\nSome computation might have failed. Please check the output in the folders:")
         logger.warning("\t" + out_dir + ' (standard output)')
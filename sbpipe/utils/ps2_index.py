@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Indexed storage of double parameter scan results.
+# Each replica is stored in one tab-separated file whose rows are grouped by
+# time point, plus an index file recording the byte offset and length of
+# each block of rows. A time point is read by seeking to its blocks, without
+# splitting the report into one file per time point.
+
+import logging
+import mmap
+import os
+
+logger = logging.getLogger('sbpipe')
+
+
+# The layout storing one file per replica and time point.
+SPLIT_LAYOUT = 'split'
+
+# The layout storing one file per replica and an index of its time point blocks.
+INDEXED_LAYOUT = 'indexed'
+
+PS2_LAYOUTS = [SPLIT_LAYOUT, INDEXED_LAYOUT]
+
+# The extension of the index files.
+INDEX_EXT = '.idx'
+
+# The header of the index files.
+INDEX_HEADER = 'TimePoint\tOffset\tLength\n'
+
+# The number of time points plotted with the indexed layout if these are not selected.
+DEFAULT_PLOT_TIMEPOINTS = 10
+
+
+def get_ps2_index_filename(filename):
+    """
+    Return the name of the index of an indexed double parameter scan file.
+
+    :param filename: the indexed double parameter scan file
+    :return: the name of the index file
+    """
+    return os.path.splitext(filename)[0] + INDEX_EXT
+
+
+def write_ps2_index(index_file, blocks):
+    """
+    Write the index of an indexed double parameter scan file.
+
+    :param index_file: the index file
+    :param blocks: the list of (time point, byte offset, byte length) blocks
+    """
+    with open(index_file, 'w') as fileout:
+        fileout.write(INDEX_HEADER)
+        for tp, offset, length in blocks:
+            fileout.write(str(tp) + '\t' + str(offset) + '\t' + str(length) + '\n')
+
+
+def read_ps2_index(index_file):
+    """
+    Read the index of an indexed double parameter scan file.
+
+    :param index_file: the index file
+    :return: a dictionary mapping each time point to the list of its (byte offset, byte length) blocks
+    """
+    index = dict()
+    with open(index_file, 'r') as filein:
+        next(filein)
+        for line in filein:
+            tp, offset, length = [int(x) for x in line.split('\t')]
+            index.setdefault(tp, []).append((offset, length))
+    return index
+
+
+def select_timepoints(timepoints, count=DEFAULT_PLOT_TIMEPOINTS):
+    """
+    Select evenly spaced time points, including the first and the last.
+
+    :param timepoints: the list of time points
+    :param count: the number of time points to select
+    :return: the sorted list of selected time points
+    """
+    timepoints = sorted(timepoints)
+    if len(timepoints) <= count:
+        return timepoints
+    if count < 2:
+        return timepoints[-1:]
+    return sorted(set(timepoints[(len(timepoints) - 1) * i // (count - 1)] for i in range(count)))
+
+
+def read_ps2_timepoint_lines(filename, timepoint, index=None):
+    """
+    Read the rows of a time point from an indexed double parameter scan file.
+
+    :param filename: the indexed double parameter scan file
+    :param timepoint: the time point to read
+    :param index: the index of filename as returned by read_ps2_index. If None, this is read from file
+    :return: the header line and the list of rows of the time point, as strings ending with a new line
+    """
+    if index is None:
+        index = read_ps2_index(get_ps2_index_filename(filename))
+    with open(filename, 'rb') as filein:
+        mm = mmap.mmap(filein.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = mm.readline().decode('utf-8')
+            rows = []
+            for offset, length in index.get(timepoint, []):
+                rows.extend(mm[offset:offset + length].decode('utf-8').splitlines(True))
+        finally:
+            mm.close()
+    return header, rows
+
+
+def read_ps2_timepoint(filename, timepoint, index=None):
+    """
+    Read the table of a time point from an indexed double parameter scan file.
+    Each row contains the time, the two scanned parameters, and the other readouts.
+
+    :param filename: the indexed double parameter scan file
+    :param timepoint: the time point to read
+    :param index: the index of filename as returned by read_ps2_index. If None, this is read from file
+    :return: the list of column names and the list of rows, each as a list of floats
+    """
+    header, rows = read_ps2_timepoint_lines(filename, timepoint, index)
+    columns = header.rstrip().split('\t')
+    return columns, [[float(x) for x in row.rstrip().split('\t')] for row in rows]
+
+
+def extract_ps2_timepoint(filename, timepoint, fileout, index=None):
+    """
+    Write the rows of a time point of an indexed double parameter scan file to a separate file,
+    as generated by the split layout.
+
+    :param filename: the indexed double parameter scan file
+    :param timepoint: the time point to extract
+    :param fileout: the output file
+    :param index: the index of filename as returned by read_ps2_index. If None, this is read from file
+    """
+    header, rows = read_ps2_timepoint_lines(filename, timepoint, index)
+    with open(fileout, 'w') as myfile:
+        myfile.write(header)
+        myfile.writelines(rows)
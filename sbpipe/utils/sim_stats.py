@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Native statistics for the time courses generated by the pipeline simulation.
+# These require the Python packages numpy and scipy.
+
+import logging
+import os
+
+logger = logging.getLogger('sbpipe')
+
+
+# The statistics computed for each variable and time point, in the order of the output columns.
+STATISTICS = ['Mean', 'StdDev', 'Variance', 'StdErr', 'CI95', 'CoeffVar',
+              'Minimum', 'Quantile25', 'Median', 'Quantile75', 'Maximum']
+
+# The statistics and the time courses by variable are not sbpiper's tables, so they are stored separately
+STATS_PREFIX = 'sim_stats_numpy_'
+BY_VAR_FOLDER = 'simulate_data_by_var_numpy'
+
+
+def load_replicas(files):
+    """
+    Load a set of simulated time courses into a single array.
+
+    :param files: the list of replica reports. The header of the first report is used for all of them.
+    :return: a tuple (header, data) where header is the list of column names and data is an array with shape
+        (replicas, time points, columns). If the replicas have a different number of time points, only the time
+        points in common are loaded.
+    """
+    import numpy as np
+    with open(files[0], 'r') as filein:
+        header = filein.readline().rstrip('\n').rstrip('\t').split('\t')
+    # usecols discards the empty field after a trailing tab
+    replicas = [np.loadtxt(filein, delimiter='\t', skiprows=1, usecols=range(len(header)), ndmin=2)
+                for filein in files]
+    return header, _stack_replicas(replicas)
+
+
+def load_replicas_collection(filename, columns):
+    """
+    Load a set of simulated time courses from a columnar collection (see Simul.sim_postproc).
+    Only the columns Replica, Time and columns are read.
+
+    :param filename: the columnar collection, whose column Replica contains the replica number
+    :param columns: the names of the variables to load
+    :return: a tuple (replica numbers, header, data) where header is the list of column names (Time, then
+        columns) and data is an array with shape (replicas, time points, columns).
+    """
+    from sbpipe.utils.columnar import read_columnar
+    header = ['Time'] + [column for column in columns if column != 'Time']
+    df = read_columnar(filename, ['Replica'] + header)
+    numbers = []
+    replicas = []
+    for number, rows in df.groupby('Replica', sort=True):
+        numbers.append(int(number))
+        replicas.append(rows[header].to_numpy(dtype='float64'))
+    return numbers, header, _stack_replicas(replicas)
+
+
+def _stack_replicas(replicas):
+    """
+    Stack the time courses of the replicas into a single array.
+
+    :param replicas: the list of arrays with shape (time points, columns)
+    :return: an array with shape (replicas, time points, columns). If the replicas have a different number of time
+        points, only the time points in common are kept.
+    """
+    import numpy as np
+    timepoints = min(replica.shape[0] for replica in replicas)
+    if any(replica.shape[0] != timepoints for replica in replicas):
+        logger.warning('Replicas have a different number of time points. Only the first ' + str(timepoints) +
+                       ' time points are analysed.')
+    return np.stack([replica[:timepoints] for replica in replicas])
+
+
+def compute_sim_stats(data):
+    """
+    Compute the statistics of each variable and time point across the replicas.
+
+    :param data: an array with shape (replicas, time points, variables)
+    :return: an array with shape (len(STATISTICS), time points, variables)
+    """
+    import numpy as np
+    from scipy.stats import t
+    runs = data.shape[0]
+    mean = data.mean(axis=0)
+    if runs > 1:
+        sd = data.std(axis=0, ddof=1)
+        t_quantile = t.ppf(0.975, runs - 1)
+    else:
+        sd = np.zeros_like(mean)
+        t_quantile = 0.0
+    stderr = sd / np.sqrt(runs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coeffvar = sd / mean
+    quantiles = np.percentile(data, [0, 25, 50, 75, 100], axis=0)
+    return np.stack([mean, sd, sd ** 2, stderr, t_quantile * stderr, coeffvar] + list(quantiles))
+
+
+def summarise_replicas(files, columns, stats_prefix, by_var_prefix, collection=None):
+    """
+    Summarise a set of simulated time courses. The replicas are loaded once and the statistics of all
+    the variables are computed together. For each variable, two tab-separated files are written:
+    the statistics (stats_prefix + variable + '.csv') and the time courses of all the replicas
+    (by_var_prefix + variable + '.csv').
+
+    :param files: the list of replica reports
+    :param columns: the names of the variables to summarise
+    :param stats_prefix: the prefix of the files of statistics, including the path
+    :param by_var_prefix: the prefix of the files of replicas by variable, including the path
+    :param collection: the columnar collection of the replica reports, or None. If set, the replicas
+        are read from this file instead of files
+    :return: the number of summarised variables
+    """
+    import numpy as np
+    if collection is None:
+        header, data = load_replicas(files)
+        replica_names = [os.path.splitext(os.path.basename(filein))[0] for filein in files]
+    else:
+        numbers, header, data = load_replicas_collection(collection, columns)
+        model = os.path.splitext(os.path.basename(collection))[0]
+        replica_names = [model + '_' + str(number) for number in numbers]
+    columns = [column for column in columns if column in header]
+    time = data[0, :, header.index('Time')]
+    data = data[:, :, [header.index(column) for column in columns]]
+    stats = compute_sim_stats(data)
+    logger.debug('Summarised ' + str(len(replica_names)) + ' replicas')
+    for i, column in enumerate(columns):
+        np.savetxt(stats_prefix + column + '.csv',
+                   np.column_stack([time, stats[:, :, i].T]),
+                   fmt='%.15g', delimiter='\t', comments='',
+                   header='\t'.join(['Time'] + [column + '_' + name for name in STATISTICS]))
+        np.savetxt(by_var_prefix + column + '.csv',
+                   np.column_stack([time, data[:, :, i].T]),
+                   fmt='%.15g', delimiter='\t', comments='',
+                   header='\t'.join(['Time'] + replica_names))
+    return len(columns)
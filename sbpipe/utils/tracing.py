@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+# Tracing of the pipeline stages.
+# Spans are recorded as complete events of the Chrome trace event format, so that a trace
+# can be inspected with chrome://tracing or https://ui.perfetto.dev . Tracing is disabled by
+# default. In this case, span() returns a shared context manager doing nothing.
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('sbpipe')
+
+
+# The active tracer, or None if tracing is disabled.
+_tracer = None
+
+
+class Tracer(object):
+    """
+    Collect the spans of a pipeline execution.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._pid = os.getpid()
+
+    def add_event(self, name, start, end, category='sbpipe', tid=None, args=None):
+        """
+        Add a complete event.
+
+        :param name: the name of the event
+        :param start: the start time, in seconds since the epoch
+        :param end: the end time, in seconds since the epoch
+        :param category: the category of the event
+        :param tid: the lane of the event. If None, the current thread is used
+        :param args: a dictionary of arguments shown with the event, or None
+        """
+        if tid is None:
+            tid = threading.current_thread().name
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': self._pid, 'tid': tid,
+                 'ts': int(start * 1e6), 'dur': max(0, int((end - start) * 1e6))}
+        if args:
+            event['args'] = args
+        self._events.append(event)
+
+    def get_events(self):
+        """
+        Return the recorded events.
+
+        :return: the list of events, ordered by start time
+        """
+        return sorted(self._events, key=lambda e: e['ts'])
+
+    def write_chrome_trace(self, filename):
+        """
+        Write the recorded events in the Chrome trace event format (JSON).
+
+        :param filename: the trace file
+        """
+        with open(filename, 'w') as fileout:
+            json.dump({'traceEvents': self.get_events(), 'displayTimeUnit': 'ms'}, fileout)
+
+    def get_summary(self):
+        """
+        Return the time spent in each span. Nested spans are included in the time of their parents.
+
+        :return: a list of tuples (name, calls, total seconds, mean seconds, max seconds), sorted by total time
+        """
+        stats = dict()
+        for event in self._events:
+            durations = stats.setdefault(event['name'], [])
+            durations.append(event['dur'] / 1e6)
+        summary = [(name, len(d), sum(d), sum(d) / len(d), max(d)) for name, d in stats.items()]
+        return sorted(summary, key=lambda s: s[2], reverse=True)
+
+    def format_summary(self):
+        """
+        Return the summary of the recorded spans as a text table.
+
+        :return: the table as a string
+        """
+        summary = self.get_summary()
+        width = max([len('Span')] + [len(s[0]) for s in summary])
+        lines = ['%-*s %8s %12s %12s %12s' % (width, 'Span', 'Calls', 'Total (s)', 'Mean (s)', 'Max (s)')]
+        for name, calls, total, mean, maximum in summary:
+            lines.append('%-*s %8d %12.3f %12.3f %12.3f' % (width, name, calls, total, mean, maximum))
+        return '\n'.join(lines)
+
+
+class _Span(object):
+    """
+    A context manager recording a span in a tracer.
+    """
+
+    def __init__(self, tracer, name, category, args):
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._tracer.add_event(self._name, self._start, time.time(), self._category, args=self._args)
+        return False
+
+
+class _NullSpan(object):
+    """
+    A context manager doing nothing, used when tracing is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def start_tracing():
+    """
+    Enable tracing. The spans are recorded in a new tracer.
+
+    :return: the tracer
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing():
+    """
+    Disable tracing.
+
+    :return: the tracer recording the spans, or None if tracing was not enabled
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer():
+    """
+    Return the active tracer.
+
+    :return: the tracer, or None if tracing is disabled
+    """
+    return _tracer
+
+
+def span(name, category='sbpipe', **args):
+    """
+    Return a context manager recording a span if tracing is enabled.
+
+    :param name: the name of the span
+    :param category: the category of the span
+    :param args: the arguments shown with the span
+    :return: the context manager
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, category, args)
+
+
+def traced(name=None, category='sbpipe'):
+    """
+    Decorator recording each call of a function as a span if tracing is enabled.
+
+    :param name: the name of the span. If None, this is `module.function`
+    :param category: the category of the span
+    :return: the decorator
+    """
+    def decorator(func):
+        span_name = name or func.__module__.split('.')[-1] + '.' + func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _Span(_tracer, span_name, category, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_job_events(job_name, records):
+    """
+    Add the executed jobs to the trace if tracing is enabled. Jobs running at the same time are shown
+    in separate lanes.
+
+    :param job_name: the name of the executed program
+    :param records: the job records (see sbpipe.utils.parcomp.make_job_record)
+    """
+    if _tracer is None:
+        return
+    job_name = os.path.basename(job_name)
+    # the end time of the last job in each lane
+    lanes = []
+    for record in sorted([r for r in records if r['Start'] is not None and r['End'] is not None],
+                         key=lambda r: r['Start']):
+        lane = next((i for i, end in enumerate(lanes) if end <= record['Start']), len(lanes))
+        if lane == len(lanes):
+            lanes.append(record['End'])
+        else:
+            lanes[lane] = record['End']
+        _tracer.add_event(job_name, record['Start'], record['End'], 'job', 'job ' + str(lane + 1),
+                          {'job': record['Job'], 'exit_status': record['ExitStatus'],
+                           'max_rss_kb': record['MaxRSS']})
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+# Benchmark of the orchestration overhead of SBpipe.
+# A fake simulator and synthetic reports are used, so that the measured time is spent by
+# SBpipe only: job dispatch, report moving and cleaning, collection of parameter estimates,
+# and post-processing of parameter scans. Each benchmark is run for an increasing number of
+# runs (replicas). The results are written in a JSON file, which can be compared with the
+# results of a previous release.
+#
+# Usage (from the SBpipe root folder):
+# $ python -m tests.benchmarks.bench_orchestration --scales 10,100,1000 --output new.json
+# $ python -m tests.benchmarks.bench_orchestration --compare old.json --output new.json
+
+
+from __future__ import print_function
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+from tests.context import sbpipe
+from sbpipe import sbpipe_version
+from sbpipe.simul.copasi.copasi import Copasi
+from sbpipe.simul.simul import Simul
+from sbpipe.utils.parcomp import parcomp
+from tests.benchmarks.fake_simul import FakeSimul, write_fake_model
+from tests.benchmarks.reports import write_pe_report, write_ps1_report, write_ps2_report, write_sim_report
+
+
+# The default numbers of runs.
+DEFAULT_SCALES = [10, 100, 1000, 10000, 100000]
+
+# The default shape of the synthetic reports.
+DEFAULT_SHAPE = {'timepoints': 100, 'columns': 10, 'levels': 5, 'scans': 10, 'sim_length': 10,
+                 'parameters': 10, 'evaluations': 20, 'local_cpus': multiprocessing.cpu_count()}
+
+# The ratio between the new and the old time above which a benchmark is reported as a regression.
+DEFAULT_THRESHOLD = 1.25
+
+
+def bench_parcomp(workdir, runs, shape):
+    """
+    Time the dispatch of jobs doing nothing.
+    """
+    start = timeit.default_timer()
+    parcomp('true ITER', 'ITER', workdir, 'local', runs, shape['local_cpus'])
+    return timeit.default_timer() - start
+
+
+def bench_fake_sim(workdir, runs, shape):
+    """
+    Time a complete time course simulation using the fake simulator.
+    """
+    inputdir = os.path.join(workdir, 'Models')
+    outputdir = os.path.join(workdir, 'sim_data')
+    os.makedirs(inputdir)
+    os.makedirs(outputdir)
+    write_fake_model(os.path.join(inputdir, 'model.py'), shape['timepoints'], shape['columns'])
+    orig_wd = os.getcwd()
+    # reports are written in the current directory
+    os.chdir(workdir)
+    try:
+        start = timeit.default_timer()
+        FakeSimul().sim('model.py', inputdir, outputdir, 'local', shape['local_cpus'], runs)
+        return timeit.default_timer() - start
+    finally:
+        os.chdir(orig_wd)
+
+
+def bench_move_reports(workdir, runs, shape):
+    """
+    Time moving the simulated reports to the output folder, including cleaning their headers.
+    """
+    sim = FakeSimul()
+    outputdir = os.path.join(workdir, 'sim_data')
+    os.makedirs(outputdir)
+    model_group = sim._get_model_group('model.py')
+    for i in range(runs):
+        write_sim_report(os.path.join(workdir, model_group + str(i + 1) + '.csv'),
+                         shape['timepoints'], shape['columns'], clean_header=False)
+    start = timeit.default_timer()
+    sim._move_reports(workdir, outputdir, 'model.py', sim._groupid)
+    return timeit.default_timer() - start
+
+
+def bench_replace_str_in_report(workdir, runs, shape):
+    """
+    Time cleaning the headers of the simulated reports.
+    """
+    sim = FakeSimul()
+    reports = [os.path.join(workdir, 'model_' + str(i + 1) + '.csv') for i in range(runs)]
+    for report in reports:
+        write_sim_report(report, shape['timepoints'], shape['columns'], clean_header=False)
+    start = timeit.default_timer()
+    for report in reports:
+        sim.replace_str_in_report(report)
+    return timeit.default_timer() - start
+
+
+def _write_pe_reports(workdir, runs, shape):
+    """
+    Write the parameter estimation reports in workdir/pe_data.
+
+    :return: the folder of the reports
+    """
+    inputdir = os.path.join(workdir, 'pe_data')
+    os.makedirs(inputdir)
+    for i in range(runs):
+        write_pe_report(os.path.join(inputdir, 'model_' + str(i + 1) + '.csv'),
+                        shape['parameters'], shape['evaluations'])
+    return inputdir
+
+
+def bench_get_fits(workdir, runs, shape):
+    """
+    Time the collection of the final and all the parameter estimates, as in the pipeline.
+    """
+    inputdir = _write_pe_reports(workdir, runs, shape)
+    start = timeit.default_timer()
+    Copasi().get_fits(inputdir, workdir)
+    return timeit.default_timer() - start
+
+
+def bench_ps1_postproc(workdir, runs, shape):
+    """
+    Time the post-processing of single parameter scan reports.
+    """
+    for i in range(runs):
+        write_ps1_report(os.path.join(workdir, 'model_' + str(i + 1) + '.csv'), shape['levels'], shape['timepoints'])
+    start = timeit.default_timer()
+    Simul().ps1_postproc('model.cps', 'k1', shape['timepoints'] - 1, shape['levels'] - 1, workdir)
+    return timeit.default_timer() - start
+
+
+def bench_ps2_postproc(workdir, runs, shape):
+    """
+    Time the post-processing of double parameter scan reports.
+    """
+    for i in range(runs):
+        write_ps2_report(os.path.join(workdir, 'model_' + str(i + 1) + '.csv'), shape['scans'], shape['sim_length'])
+    start = timeit.default_timer()
+    Simul().ps2_postproc('model.cps', shape['sim_length'], workdir)
+    return timeit.default_timer() - start
+
+
+# The benchmarks. Each function is called as func(workdir, runs, shape) and returns the elapsed time in seconds.
+BENCHMARKS = [('parcomp', bench_parcomp),
+              ('fake_sim', bench_fake_sim),
+              ('move_reports', bench_move_reports),
+              ('replace_str_in_report', bench_replace_str_in_report),
+              ('get_fits', bench_get_fits),
+              ('ps1_postproc', bench_ps1_postproc),
+              ('ps2_postproc', bench_ps2_postproc)]
+
+
+def run_benchmarks(names=None, scales=DEFAULT_SCALES, shape=None, repeat=1):
+    """
+    Run the benchmarks.
+
+    :param names: the names of the benchmarks to run. If None, all the benchmarks are run
+    :param scales: the list of numbers of runs
+    :param shape: a dictionary overriding DEFAULT_SHAPE
+    :param repeat: the number of repetitions of each benchmark. The minimum time is reported
+    :return: a dictionary containing the environment, the shape of the reports and the results
+    """
+    report_shape = dict(DEFAULT_SHAPE)
+    report_shape.update(shape or {})
+    results = []
+    for name, func in BENCHMARKS:
+        if names is not None and name not in names:
+            continue
+        for runs in scales:
+            times = []
+            for r in range(repeat):
+                workdir = tempfile.mkdtemp()
+                try:
+                    times.append(func(workdir, runs, report_shape))
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            results.append({'benchmark': name, 'runs': runs, 'seconds': min(times),
+                            'seconds_per_run': min(times) / runs})
+    return {'sbpipe': sbpipe_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'date': datetime.datetime.now().replace(microsecond=0).isoformat(),
+            'shape': report_shape,
+            'results': results}
+
+
+def compare_benchmarks(old, new, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the results of two benchmark runs. Only the benchmarks run at the same scale are compared.
+
+    :param old: the old results, as returned by run_benchmarks
+    :param new: the new results, as returned by run_benchmarks
+    :param threshold: the ratio between the new and the old time above which a benchmark is a regression
+    :return: the list of regressions as tuples (benchmark, runs, old seconds, new seconds)
+    """
+    old_times = dict(((r['benchmark'], r['runs']), r['seconds']) for r in old['results'])
+    regressions = []
+    for r in new['results']:
+        old_time = old_times.get((r['benchmark'], r['runs']))
+        if old_time is not None and r['seconds'] > old_time * threshold:
+            regressions.append((r['benchmark'], r['runs'], old_time, r['seconds']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench_orchestration',
+                                     description='Benchmark the orchestration overhead of SBpipe.')
+    parser.add_argument('--benchmarks',
+                        help='comma-separated benchmarks to run among: ' + ', '.join(b[0] for b in BENCHMARKS))
+    parser.add_argument('--scales',
+                        help='comma-separated numbers of runs',
+                        default=','.join(str(s) for s in DEFAULT_SCALES))
+    parser.add_argument('--repeat', help='repetitions of each benchmark', type=int, default=1)
+    for key in sorted(DEFAULT_SHAPE):
+        parser.add_argument('--' + key.replace('_', '-'), type=int, default=DEFAULT_SHAPE[key],
+                            help='report shape: ' + key)
+    parser.add_argument('--output', help='the JSON file of the results', default='sbpipe_benchmarks.json')
+    parser.add_argument('--compare', help='a JSON file of previous results to compare with', metavar='FILE')
+    parser.add_argument('--threshold', help='the slowdown ratio reported as regression', type=float,
+                        default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    names = args.benchmarks.split(',') if args.benchmarks else None
+    scales = [int(s) for s in args.scales.split(',')]
+    shape = dict((key, getattr(args, key)) for key in DEFAULT_SHAPE)
+    results = run_benchmarks(names, scales, shape, args.repeat)
+    with open(args.output, 'w') as fileout:
+        json.dump(results, fileout, indent=2, sort_keys=True)
+
+    print('benchmark\truns\tseconds\tseconds_per_run')
+    for r in results['results']:
+        print(r['benchmark'] + '\t' + str(r['runs']) + '\t' + '{0:.4f}'.format(r['seconds']) + '\t' +
+              '{0:.6f}'.format(r['seconds_per_run']))
+
+    if args.compare:
+        with open(args.compare) as filein:
+            regressions = compare_benchmarks(json.load(filein), results, args.threshold)
+        for benchmark, runs, old_time, new_time in regressions:
+            print('Regression: ' + benchmark + ' (' + str(runs) + ' runs): ' +
+                  '{0:.4f}s -> {1:.4f}s'.format(old_time, new_time))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+# Benchmark for the single parameter scan post-processing.
+# The post-processing time per level should be constant, as each report is read once.
+#
+# Usage (from the SBpipe root folder):
+# $ python -m tests.benchmarks.bench_ps1_postproc [timepoints]
+
+
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from tests.context import sbpipe
+from sbpipe.simul.simul import Simul
+from tests.benchmarks.reports import write_ps1_report
+
+
+def bench_ps1_postproc(levels, timepoints):
+    """
+    Time the post-processing of a single parameter scan report.
+
+    :param levels: the number of scanned levels
+    :param timepoints: the number of time points per level
+    :return: the elapsed time in seconds
+    """
+    outputdir = tempfile.mkdtemp()
+    try:
+        write_ps1_report(os.path.join(outputdir, 'model_1.csv'), levels, timepoints)
+        start = timeit.default_timer()
+        Simul().ps1_postproc('model.cps', 'k1', timepoints - 1, levels - 1, outputdir)
+        return timeit.default_timer() - start
+    finally:
+        shutil.rmtree(outputdir, ignore_errors=True)
+
+
+def main(argv=None):
+    timepoints = 5000
+    if argv and len(argv) > 1:
+        timepoints = int(argv[1])
+    print('levels\ttimepoints\tseconds\tseconds_per_level')
+    for levels in [25, 50, 100, 200]:
+        elapsed = bench_ps1_postproc(levels, timepoints)
+        print(str(levels) + '\t' + str(timepoints) + '\t' + '{0:.4f}'.format(elapsed) + '\t' +
+              '{0:.6f}'.format(elapsed / levels))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+# Benchmark for the double parameter scan post-processing.
+# Each report is read once and split into sim_length+1 files, one per time point,
+# keeping at most one output file open.
+#
+# Usage (from the SBpipe root folder):
+# $ python -m tests.benchmarks.bench_ps2_postproc [scans]
+
+
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from tests.context import sbpipe
+from sbpipe.simul.simul import Simul
+from tests.benchmarks.reports import write_ps2_report
+
+
+def bench_ps2_postproc(scans, sim_length):
+    """
+    Time the post-processing of a double parameter scan report.
+
+    :param scans: the number of scanned combinations of the two parameters
+    :param sim_length: the length of each simulation
+    :return: the elapsed time in seconds
+    """
+    outputdir = tempfile.mkdtemp()
+    try:
+        write_ps2_report(os.path.join(outputdir, 'model_1.csv'), scans, sim_length)
+        start = timeit.default_timer()
+        Simul().ps2_postproc('model.cps', sim_length, outputdir)
+        return timeit.default_timer() - start
+    finally:
+        shutil.rmtree(outputdir, ignore_errors=True)
+
+
+def main(argv=None):
+    scans = 20
+    if argv and len(argv) > 1:
+        scans = int(argv[1])
+    print('sim_length\tscans\tseconds\tseconds_per_timepoint')
+    for sim_length in [10, 100, 1000, 10000]:
+        elapsed = bench_ps2_postproc(scans, sim_length)
+        print(str(sim_length) + '\t' + str(scans) + '\t' + '{0:.4f}'.format(elapsed) + '\t' +
+              '{0:.6f}'.format(elapsed / (sim_length + 1)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
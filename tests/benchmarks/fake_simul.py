@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# A fake simulator for benchmarking SBpipe. Models are Python scripts writing
+# a time course report of fixed size, without any numerical integration.
+
+import os
+import sys
+from tests.context import sbpipe
+from sbpipe.simul.pl_simul import PLSimul
+
+
+# The template of a fake model. The report is written by tests.benchmarks.reports.write_sim_report.
+FAKE_MODEL = """import sys
+sys.path.insert(0, {root!r})
+from tests.benchmarks.reports import write_sim_report
+write_sim_report(sys.argv[1], {timepoints}, {columns}, clean_header=False)
+"""
+
+
+def write_fake_model(model, timepoints, columns):
+    """
+    Write a fake model. When executed as `python model report`, this writes a time course report.
+
+    :param model: the model file
+    :param timepoints: the number of time points of the report
+    :param columns: the number of model variables of the report
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(model, 'w') as myfile:
+        myfile.write(FAKE_MODEL.format(root=root, timepoints=timepoints, columns=columns))
+
+
+class FakeSimul(PLSimul):
+    """
+    A simulator running fake models with the current Python interpreter.
+    """
+
+    def __init__(self):
+        __doc__ = PLSimul.__init__.__doc__
+
+        PLSimul.__init__(self, lang=sys.executable, lang_err_msg='Python interpreter not found')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Synthetic reports for benchmarking SBpipe without running a simulator.
+
+
+def write_ps1_report(report, levels, timepoints, blank_sep=True):
+    """
+    Write a single parameter scan report as generated by Copasi.
+
+    :param report: the report file
+    :param levels: the number of scanned levels
+    :param timepoints: the number of time points per level
+    :param blank_sep: True if the tables are separated by a blank line
+    """
+    with open(report, 'w') as myfile:
+        myfile.write('Time\tA\tk1\n')
+        for l in range(levels):
+            for t in range(timepoints):
+                myfile.write(str(t) + '\t' + str(t * 0.5) + '\t' + str(l * 10) + '\t\n')
+            if blank_sep:
+                myfile.write('\n')
+
+
+def write_ps2_report(report, scans, sim_length, blank_sep=True):
+    """
+    Write a double parameter scan report as generated by Copasi.
+
+    :param report: the report file
+    :param scans: the number of scanned combinations of the two parameters
+    :param sim_length: the length of each simulation
+    :param blank_sep: True if the time courses are separated by a blank line
+    """
+    with open(report, 'w') as myfile:
+        myfile.write('Time\tA\tk1\tk2\n')
+        for s in range(scans):
+            for t in range(sim_length + 1):
+                myfile.write(str(t) + '\t' + str(t * 0.5) + '\t' + str(s // 10) + '\t' + str(s % 10) + '\t\n')
+            if blank_sep:
+                myfile.write('\n')
+
+
+def write_sim_report(report, timepoints, columns, clean_header=True):
+    """
+    Write a time course report.
+
+    :param report: the report file
+    :param timepoints: the number of time points
+    :param columns: the number of model variables
+    :param clean_header: False if the header should be written as by a simulator, with quoted names
+    """
+    names = ['X' + str(c + 1) for c in range(columns)]
+    with open(report, 'w') as myfile:
+        if clean_header:
+            myfile.write('Time\t' + '\t'.join(names) + '\n')
+        else:
+            myfile.write('"time" ' + ' '.join('"' + name + '"' for name in names) + '\n')
+        for t in range(timepoints):
+            myfile.write(str(t) + ''.join('\t' + str(t * 0.5 + c) for c in range(columns)) + '\n')
+
+
+def write_pe_report(report, parameters, evaluations):
+    """
+    Write a parameter estimation report as generated by Copasi.
+
+    :param report: the report file
+    :param parameters: the number of estimated parameters
+    :param evaluations: the number of improving function evaluations
+    """
+    with open(report, 'w') as myfile:
+        myfile.write('Parameter\tEstimation\tTask\n\n')
+        myfile.write('List of Fitting Items:\n')
+        for p in range(parameters):
+            myfile.write('    1e-04 <= Values[k' + str(p + 1) + '].InitialValue <= 1e+01; Start Value = 1\n')
+        myfile.write('\n[Function Evaluations]\t[Best Value]\t[Best Parameters]\n')
+        for e in range(evaluations):
+            myfile.write(str(e * 10 + 1) + '\t' + str(1000.0 / (e + 1)) + '\t(\t' +
+                         '\t'.join(str(0.1 * (p + e)) for p in range(parameters)) + '\t)\n')
+        myfile.write('\n')
@@ -0,0 +1,54 @@
+import numpy as np
+from scipy.integrate import odeint
+import pandas as pd
+
+# This model defines the function sbpipe_simulate(report_filename, seed).
+# SBpipe imports the model once per worker process and calls this function for each run,
+# instead of running the model as a script.
+
+
+# Model definition
+# ---------------------------------------------
+def insulin_receptor(y, t, inp, p):
+    dy0 = - p[0] * y[0] * inp[0] + p[2] * y[2]
+    dy1 = + p[0] * y[0] * inp[0] - p[1] * y[1]
+    dy2 = + p[1] * y[1] - p[2] * y[2]
+    return [dy0, dy1, dy2]
+
+# input
+inp = [1]
+# Parameters
+p = [0.475519, 0.471947, 0.0578119]
+# a tuple for the arguments (see odeint syntax)
+config = (inp, p)
+
+# initial value
+y0 = np.array([16.5607, 0, 0])
+
+# vector of time steps
+time = np.linspace(0.0, 20.0, 100)
+# ---------------------------------------------
+
+
+def sbpipe_simulate(report_filename, seed):
+    # the seed is ignored as this model is deterministic
+    # simulate the model
+    y = odeint(insulin_receptor, y0=y0, t=time, args=config)
+
+    # we generate as little as possible to speed up testing.
+    d = {'time': pd.Series(time),
+         'IR_beta_pY1146': pd.Series(y[:, 1])}
+    df = pd.DataFrame(d)
+
+    # Write the output. The output file must be the model name with csv or txt extension.
+    # Fields must be separated by TAB, and row indexes must be discarded.
+    df.to_csv(report_filename, sep='\t', index=False, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    import sys
+    # Retrieve the report file name (necessary for stochastic simulations)
+    report_filename = "insulin_receptor_module.csv"
+    if len(sys.argv) > 1:
+        report_filename = sys.argv[1]
+    sbpipe_simulate(report_filename, None)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.copasi.copasi import Copasi
+from tests.benchmarks.bench_orchestration import BENCHMARKS, compare_benchmarks, run_benchmarks
+from tests.benchmarks.fake_simul import FakeSimul, write_fake_model
+from tests.benchmarks.reports import write_pe_report
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self._orig_wd = os.getcwd()
+        self._tmpdir = tempfile.mkdtemp()
+        os.chdir(self._tmpdir)
+
+    def tearDown(self):
+        os.chdir(self._orig_wd)
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_fake_simul(self):
+        write_fake_model(os.path.join(self._tmpdir, 'model.py'), 3, 2)
+        outputdir = os.path.join(self._tmpdir, 'sim_data')
+        os.makedirs(outputdir)
+        self.assertTrue(FakeSimul().sim('model.py', self._tmpdir, outputdir, 'local', 1, 2))
+        for i in range(1, 3):
+            with open(os.path.join(outputdir, 'model_' + str(i) + '.csv')) as report:
+                self.assertEqual(report.readlines(), ['Time\tX1\tX2\n', '0\t0.0\t1.0\n', '1\t0.5\t1.5\n',
+                                                      '2\t1.0\t2.0\n'])
+
+    def test_pe_report(self):
+        report = os.path.join(self._tmpdir, 'model_1.csv')
+        write_pe_report(report, 3, 4)
+        copasi = Copasi()
+        self.assertTrue(copasi.is_fits_report_complete(report))
+        parameters, best_fit, all_fits = copasi._read_fits(report)
+        self.assertEqual(parameters, ['Values[k1].InitialValue', 'Values[k2].InitialValue',
+                                      'Values[k3].InitialValue'])
+        self.assertEqual(len(all_fits), 4)
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(scales=[1, 2], shape={'timepoints': 5, 'local_cpus': 1})
+        self.assertEqual(len(results['results']), 2 * len(BENCHMARKS))
+        self.assertEqual(results['shape']['timepoints'], 5)
+        self.assertEqual([r['benchmark'] for r in results['results']][0:2], ['parcomp', 'parcomp'])
+        slower = {'results': [dict(r, seconds=r['seconds'] * 2) for r in results['results']]}
+        self.assertEqual(compare_benchmarks(results, results), [])
+        self.assertEqual(len(compare_benchmarks(results, slower)), 2 * len(BENCHMARKS))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.simul import Simul
+import sbpipe.utils.cache as cache_module
+from sbpipe.utils.cache import ResultCache, get_cache_key
+
+
+class ReportSimul(Simul):
+    """
+    A simulator writing one report per replica, recording the simulated replicas.
+    """
+
+    def __init__(self):
+        Simul.__init__(self)
+        self.simulated = []
+
+    def _run_par_comput(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False,
+                        iter_ids=None):
+        if iter_ids is None:
+            iter_ids = [str(i + 1) for i in range(0, runs)]
+        for iter_id in iter_ids:
+            with open(os.path.join(outputdir, 'model_' + iter_id + '.csv'), 'w') as report:
+                report.write('Time\tA\n0\t' + iter_id + '\n')
+        self.simulated.extend(iter_ids)
+        return True
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._model = os.path.join(self._dir, 'model.txt')
+        with open(self._model, 'w') as myfile:
+            myfile.write('A = 1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def test_cache_key(self):
+        key = get_cache_key(self._model, {'simulator': 'Copasi'}, 1)
+        self.assertEqual(key, get_cache_key(self._model, {'simulator': 'Copasi'}, 1))
+        self.assertNotEqual(key, get_cache_key(self._model, {'simulator': 'Copasi'}, 2))
+        self.assertNotEqual(key, get_cache_key(self._model, {'simulator': 'Python'}, 1))
+        with open(self._model, 'a') as myfile:
+            myfile.write('B = 2\n')
+        self.assertNotEqual(key, get_cache_key(self._model, {'simulator': 'Copasi'}, 1))
+
+    def test_cache_lru(self):
+        # each entry is 100 bytes. The cache can store two entries.
+        cache = ResultCache(os.path.join(self._dir, 'cache'), 250 / (1024.0 * 1024))
+        report = os.path.join(self._dir, 'report.csv')
+        with open(report, 'w') as myfile:
+            myfile.write('x' * 100)
+        cache.store('aa01', report)
+        cache.store('aa02', report)
+        self.assertEqual(cache.evict(), 0)
+        # aa01 becomes the most recently used entry
+        past = time.time() - 100
+        os.utime(os.path.join(self._dir, 'cache', 'aa', 'aa02'), (past, past))
+        os.utime(os.path.join(self._dir, 'cache', 'aa', 'aa01'), (past - 10, past - 10))
+        self.assertTrue(cache.fetch('aa01', os.path.join(self._dir, 'fetched.csv')))
+        cache.store('bb03', report)
+        # an entry being stored by a concurrent pipeline is neither counted nor removed
+        with open(os.path.join(self._dir, 'cache', 'aa', 'aa04.tmp'), 'w') as myfile:
+            myfile.write('x' * 100)
+        self.assertEqual(cache.evict(), 1)
+        self.assertTrue(os.path.isfile(os.path.join(self._dir, 'cache', 'aa', 'aa04.tmp')))
+        self.assertFalse(cache.fetch('aa02', os.path.join(self._dir, 'fetched.csv')))
+        self.assertTrue(cache.fetch('aa01', os.path.join(self._dir, 'fetched.csv')))
+        self.assertTrue(cache.fetch('bb03', os.path.join(self._dir, 'fetched.csv')))
+        with open(os.path.join(self._dir, 'fetched.csv')) as myfile:
+            self.assertEqual(myfile.read(), 'x' * 100)
+
+    def test_run_replicas(self):
+        outputdir = os.path.join(self._dir, 'sim_data')
+        os.mkdir(outputdir)
+        simul = ReportSimul()
+        simul.set_cache(ResultCache(os.path.join(self._dir, 'cache')))
+        self.assertTrue(simul._run_replicas('model.txt', self._dir, outputdir, runs=2))
+        self.assertEqual(simul.simulated, ['1', '2'])
+        # the reports are removed as in generate_data(). The cached replicas are not simulated again.
+        shutil.rmtree(outputdir)
+        os.mkdir(outputdir)
+        simul = ReportSimul()
+        simul.set_cache(ResultCache(os.path.join(self._dir, 'cache')))
+        self.assertTrue(simul._run_replicas('model.txt', self._dir, outputdir, runs=3))
+        self.assertEqual(simul.simulated, ['3'])
+        for i in range(1, 4):
+            with open(os.path.join(outputdir, 'model_' + str(i) + '.csv')) as report:
+                self.assertEqual(report.read(), 'Time\tA\n0\t' + str(i) + '\n')
+
+    def test_run_replicas_evict_once(self):
+        # the cache is walked once after storing all the replicas
+        walks = []
+        walk = cache_module.os.walk
+
+        def count_walk(top, *args, **kwargs):
+            walks.append(top)
+            return walk(top, *args, **kwargs)
+
+        outputdir = os.path.join(self._dir, 'sim_data')
+        os.mkdir(outputdir)
+        simul = ReportSimul()
+        simul.set_cache(ResultCache(os.path.join(self._dir, 'cache')))
+        cache_module.os.walk = count_walk
+        try:
+            self.assertTrue(simul._run_replicas('model.txt', self._dir, outputdir, runs=50))
+        finally:
+            cache_module.os.walk = walk
+        # os.walk can recurse into the subfolders through os.walk
+        self.assertEqual(walks.count(os.path.join(self._dir, 'cache')), 1)
+        self.assertEqual(sum(len(files) for root, dirs, files in os.walk(os.path.join(self._dir, 'cache'))), 50)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.simul import Simul
+from sbpipe.utils.columnar import read_columnar
+from sbpipe.utils.columnar import write_columnar
+from tests.benchmarks.reports import write_ps1_report, write_ps2_report
+
+try:
+    import pandas
+    import pyarrow
+    columnar_libs = True
+except ImportError:
+    columnar_libs = False
+
+
+@unittest.skipUnless(columnar_libs, 'Python pandas or pyarrow not found')
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def test_write_read_columnar(self):
+        report = os.path.join(self._outputdir, 'model_1.csv')
+        with open(report, 'w') as myfile:
+            myfile.write('Time\tA\tB\n0\t1\t2\t\n1\t3\t4\t\n')
+        for result_format in ['parquet', 'feather']:
+            fileout = write_columnar(report, result_format)
+            self.assertEqual(os.path.splitext(fileout)[0], os.path.splitext(report)[0])
+            df = read_columnar(fileout, columns=['Time', 'B'])
+            self.assertEqual(list(df.columns), ['Time', 'B'])
+            self.assertEqual(str(df['Time'].dtype), 'float64')
+            self.assertEqual(list(df['B']), [2.0, 4.0])
+
+    def _list_columnar(self):
+        return sorted(f for f in os.listdir(self._outputdir) if not f.endswith('.csv'))
+
+    def test_sim_postproc_columnar(self):
+        for r in [1, 2, 10]:
+            with open(os.path.join(self._outputdir, 'model_' + str(r) + '.csv'), 'w') as myfile:
+                myfile.write('Time\tA\n0\t' + str(r) + '\t\n1\t' + str(r) + '\t\n')
+        simul = Simul()
+        simul.set_result_format('feather')
+        simul.sim_postproc('model.cps', self._outputdir)
+        # one file stores all the replicas
+        self.assertEqual(self._list_columnar(), ['model.feather'])
+        df = read_columnar(os.path.join(self._outputdir, 'model.feather'), columns=['Replica', 'A'])
+        self.assertEqual(list(df['Replica']), [1, 1, 2, 2, 10, 10])
+        self.assertEqual(list(df['A']), [1.0, 1.0, 2.0, 2.0, 10.0, 10.0])
+        # the collection of a previous run is removed
+        simul.set_result_format('tsv')
+        simul.sim_postproc('model.cps', self._outputdir)
+        self.assertEqual(self._list_columnar(), [])
+
+    def test_ps1_postproc_columnar(self):
+        write_ps1_report(os.path.join(self._outputdir, 'model_1.csv'), 3, 4)
+        simul = Simul()
+        simul.set_result_format('parquet')
+        simul.ps1_postproc('model.cps', 'k1', 3, 3, self._outputdir)
+        self.assertEqual(self._list_columnar(), ['model.parquet'])
+        df = read_columnar(os.path.join(self._outputdir, 'model.parquet'))
+        self.assertEqual(list(df.columns), ['Replica', 'Time', 'A', 'k1'])
+        self.assertEqual(list(df['k1']), [0.0] * 4 + [10.0] * 4 + [20.0] * 4)
+
+    def test_ps2_postproc_columnar(self):
+        for layout in ['split', 'indexed']:
+            outputdir = os.path.join(self._outputdir, layout)
+            os.mkdir(outputdir)
+            write_ps2_report(os.path.join(outputdir, 'model_1.csv'), 4, 2)
+            simul = Simul()
+            simul.set_result_format('parquet')
+            simul.set_ps2_layout(layout)
+            simul.ps2_postproc('model.cps', 2, outputdir)
+            self.assertEqual([f for f in os.listdir(outputdir) if f.endswith('.parquet')], ['model.parquet'])
+            df = read_columnar(os.path.join(outputdir, 'model.parquet'))
+            self.assertEqual(list(df.columns)[:2], ['Replica', 'TimePoint'])
+            self.assertEqual(list(df['TimePoint']), [0] * 4 + [1] * 4 + [2] * 4)
+            self.assertEqual(list(df['k2']), [0.0, 1.0, 2.0, 3.0] * 3)
+
+    def test_result_format_unknown(self):
+        self.assertRaises(ValueError, Simul().set_result_format, 'xlsx')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
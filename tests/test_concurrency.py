@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from tests.context import sbpipe
+from sbpipe.utils import concurrency as concurrency_module
+from sbpipe.utils import parcomp
+from sbpipe.utils.concurrency import AUTO_CPUS, MAX_OVERSUBSCRIPTION, PROBE_JOBS, AutoConcurrency, Concurrency, \
+    get_available_memory, get_grown_workers, get_initial_workers, get_max_workers
+
+
+def record(wall_time, cpu_time, max_rss):
+    return {'WallTime': wall_time, 'UserTime': cpu_time, 'SysTime': 0.0, 'MaxRSS': max_rss}
+
+
+class GrowingConcurrency(Concurrency):
+    """
+    A concurrency increased by each terminated job.
+    """
+
+    def _update(self, record):
+        self._limit += 1
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def test_limits(self):
+        cpus = multiprocessing.cpu_count()
+        self.assertEqual(get_max_workers(2 * cpus * MAX_OVERSUBSCRIPTION), cpus * MAX_OVERSUBSCRIPTION)
+        self.assertEqual(get_max_workers(0), 1)
+        # the pool starts with a worker per cpu and is at least doubled when grown
+        self.assertEqual(get_initial_workers(get_max_workers(1000)), max(cpus, PROBE_JOBS))
+        self.assertEqual(get_initial_workers(1), 1)
+        self.assertEqual(get_grown_workers(cpus, cpus + 1, 4 * cpus), 2 * cpus)
+        self.assertEqual(get_grown_workers(cpus, 3 * cpus, 4 * cpus), 3 * cpus)
+        self.assertEqual(get_grown_workers(cpus, 3 * cpus, cpus + 1), cpus + 1)
+        self.assertTrue(get_available_memory() > 0)
+        # I/O bound jobs oversubscribe the cpus
+        concurrency = AutoConcurrency(100 * cpus, max_memory=1024 * 1024, probe_jobs=2)
+        self.assertEqual(concurrency.get_limit(), 2)
+        for i in range(2):
+            concurrency.add_record(record(1.0, 0.1, 1024))
+        self.assertEqual(concurrency.get_limit(), cpus * MAX_OVERSUBSCRIPTION)
+        # multi-threaded jobs use more than one cpu
+        concurrency = AutoConcurrency(100 * cpus, max_memory=1024 * 1024, probe_jobs=1)
+        concurrency.add_record(record(1.0, 2.0 * cpus, 1024))
+        self.assertEqual(concurrency.get_limit(), 1)
+        # the concurrent jobs fit in the memory ceiling (MaxRSS is in KB)
+        concurrency = AutoConcurrency(100 * cpus, max_memory=100, probe_jobs=1)
+        concurrency.add_record(record(1.0, 0.1, 30 * 1024))
+        self.assertEqual(concurrency.get_limit(), 3)
+
+    def test_iowait(self):
+        cpus = multiprocessing.cpu_count()
+        ticks = [(0, 0)]
+        get_cpu_times = concurrency_module.get_cpu_times
+        concurrency_module.get_cpu_times = lambda: ticks[-1]
+        try:
+            concurrency = AutoConcurrency(100 * cpus, max_memory=1024 * 1024, probe_jobs=1)
+            # I/O bound jobs oversubscribe the cpus while the storage keeps up
+            ticks.append((cpus, 100 * cpus))
+            concurrency.add_record(record(1.0, 0.1, 1024))
+            self.assertEqual(concurrency.get_limit(), cpus * MAX_OVERSUBSCRIPTION)
+            # the cpus wait for a saturated storage, so the concurrency is reduced
+            ticks.append((51 * cpus, 200 * cpus))
+            concurrency.add_record(record(1.0, 0.1, 1024))
+            self.assertEqual(concurrency.get_limit(), cpus * MAX_OVERSUBSCRIPTION - 1)
+            # the last measurement is kept over too short an interval
+            ticks.append((52 * cpus, 201 * cpus))
+            concurrency.add_record(record(1.0, 0.1, 1024))
+            self.assertEqual(concurrency.get_limit(), cpus * MAX_OVERSUBSCRIPTION - 2)
+            ticks.append((52 * cpus, 300 * cpus))
+            concurrency.add_record(record(1.0, 0.1, 1024))
+            self.assertEqual(concurrency.get_limit(), cpus * MAX_OVERSUBSCRIPTION)
+        finally:
+            concurrency_module.get_cpu_times = get_cpu_times
+
+    def test_throttle(self):
+        concurrency = AutoConcurrency(4, max_memory=1024, probe_jobs=1)
+        params = concurrency.throttle(range(3))
+        self.assertEqual(next(params), 0)
+        dispatched = []
+        thread = threading.Thread(target=lambda: dispatched.extend(params))
+        thread.daemon = True
+        thread.start()
+        thread.join(0.2)
+        # the second job waits for the first job to terminate
+        self.assertEqual(dispatched, [])
+        concurrency.add_record(record(1.0, 1.0 * multiprocessing.cpu_count(), 1024))
+        for i in range(50):
+            if dispatched:
+                break
+            time.sleep(0.1)
+        # the jobs still to dispatch are dropped
+        concurrency.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(dispatched, [1])
+
+    def test_throttle_max_limit(self):
+        concurrency = GrowingConcurrency(2)
+        params = iter(range(4))
+        dispatched = concurrency.throttle(params, 2)
+        self.assertEqual([next(dispatched), next(dispatched)], [0, 1])
+        # the limit exceeds the workers, so the jobs not dispatched are left for a larger pool
+        concurrency.add_record(record(1.0, 1.0, 1024))
+        self.assertEqual(list(dispatched), [])
+        self.assertFalse(concurrency.is_exhausted())
+        dispatched = concurrency.throttle(params, 3)
+        self.assertEqual([next(dispatched), next(dispatched)], [2, 3])
+        concurrency.stop()
+        self.assertEqual(list(dispatched), [])
+        self.assertFalse(concurrency.is_exhausted())
+        concurrency = Concurrency(3)
+        self.assertEqual(list(concurrency.throttle(iter(range(2)), 3)), [0, 1])
+        self.assertTrue(concurrency.is_exhausted())
+
+    def test_run_jobs_local_auto_grow(self):
+        # the pool starts with one worker. The probe jobs exceed this, so the pool grows
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        get_initial = parcomp.get_initial_workers
+        parcomp.get_initial_workers = lambda max_workers: 1
+        try:
+            with parcomp.local_pool():
+                self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=10, local_cpus=AUTO_CPUS))
+                self.assertEqual(parcomp._local_pool_size, get_grown_workers(1, PROBE_JOBS, get_max_workers(10)))
+        finally:
+            parcomp.get_initial_workers = get_initial
+        self.assertEqual(len(os.listdir(self._outputdir)), 10)
+
+    def test_run_jobs_local_auto(self):
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        jobs_file = os.path.join(self._outputdir, parcomp.JOBS_FILE)
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=10, local_cpus=AUTO_CPUS, jobs_file=jobs_file,
+                                               replicas_per_job=2))
+        records = parcomp.read_job_records(jobs_file)
+        self.assertEqual([r['ExitStatus'] for r in records], [0] * 10)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.utils.io import read_file_template
+from sbpipe.utils.io import write_file_template
+from sbpipe.utils.io import replace_str_in_report
+
+
+class TestIO(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def test_file_template(self):
+        model = os.path.join(self._outputdir, 'model.cps')
+        with open(model, 'w') as myfile:
+            myfile.write('<Report target="model.csv"/>\n<Report target="model.txt"/>\n<Task name="model.dat"/>\n')
+        template = read_file_template(model, ['model.csv', 'model.txt', 'model.tsv', 'model.dat'])
+        for i in range(1, 4):
+            write_file_template(os.path.join(self._outputdir, 'model_' + str(i) + '.cps'),
+                                template, 'model_' + str(i) + '.csv')
+        with open(os.path.join(self._outputdir, 'model_2.cps')) as myfile:
+            self.assertEqual(myfile.read(), '<Report target="model_2.csv"/>\n<Report target="model_2.csv"/>\n'
+                                            '<Task name="model_2.csv"/>\n')
+
+    def test_replace_str_in_report(self):
+        report = os.path.join(self._outputdir, 'report.csv')
+        with open(report, 'w') as myfile:
+            myfile.write('Time\tValues[k1].InitialValue\t[X]_0\t\n0\t1\t2\t\n1\t3\t4\t\t')
+        replace_str_in_report(report)
+        with open(report) as myfile:
+            self.assertEqual(myfile.read(), 'Time\tk1\tX\n0\t1\t2\t\n1\t3\t4')
+
+    def test_replace_str_in_clean_report(self):
+        report = os.path.join(self._outputdir, 'report.csv')
+        with open(report, 'w') as myfile:
+            myfile.write('Time\tk1\tX\n0\t1\t2\n')
+        mtime = os.path.getmtime(report) - 10
+        os.utime(report, (mtime, mtime))
+        replace_str_in_report(report)
+        # the report is already clean and is not rewritten
+        self.assertEqual(os.path.getmtime(report), mtime)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
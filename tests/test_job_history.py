@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.utils import parcomp
+from sbpipe.pl.pipeline import Pipeline
+from sbpipe.utils.job_history import JobHistory, estimate_remaining_time, get_history_key, \
+    get_useful_parallelism, order_longest_first
+
+
+def sleep_for(seconds):
+    import time
+    time.sleep(seconds)
+
+
+class TestJobHistory(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._history_dir = os.path.join(self._dir, 'history')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def test_expected_durations(self):
+        history = JobHistory(self._history_dir, 'Sim:analysis', max_samples=2, replicas=False)
+        self.assertIsNone(history.get_expected_durations(['1', '2']))
+        history.update({'1': 10.0, '2': 2.0, '3': 3.0})
+        history.update({'1': 20.0})
+        history.update({'1': 30.0})
+        # a new history is read from file. Only the last 2 durations are kept.
+        history = JobHistory(self._history_dir, 'Sim:analysis', max_samples=2, replicas=False)
+        # jobs without history are expected to take the median duration
+        self.assertEqual(history.get_expected_durations(['1', '2', '4']), {'1': 25.0, '2': 2.0, '4': 3.0})
+        self.assertIsNone(JobHistory(self._history_dir, 'Sim:model.cps').get_expected_durations(['1']))
+
+    def test_replicas(self):
+        # the durations of the replicas of the same job are pooled
+        history = JobHistory(self._history_dir, 'Sim:model.cps', max_samples=3)
+        history.update({'1': 1.0, '2': 2.0})
+        history.update({'1': 3.0, '2': 4.0})
+        self.assertEqual(history.get_expected_durations(['1', '5']), {'1': 3.0, '5': 3.0})
+
+    def test_history_key(self):
+        model = os.path.join(self._dir, 'model.cps')
+        with open(model, 'w') as myfile:
+            myfile.write('model')
+        key = get_history_key('Sim:Copasi', model)
+        # the key depends on the content of the model, not on its path
+        os.rename(model, model + '.bak')
+        with open(model, 'w') as myfile:
+            myfile.write('model')
+        self.assertEqual(get_history_key('Sim:Copasi', model), key)
+        with open(model, 'w') as myfile:
+            myfile.write('changed model')
+        self.assertNotEqual(get_history_key('Sim:Copasi', model), key)
+        self.assertNotEqual(get_history_key('ParScan1:Copasi', model + '.bak'), key)
+
+    def test_job_options(self):
+        pipeline = Pipeline()
+        job_options = pipeline.parse_job_options({'model': 'model.cps', 'job_timeout': 10})
+        # the job history is not recorded by default
+        self.assertFalse(job_options['job_history'])
+        self.assertIsNone(pipeline.get_job_history(job_options, 'model.cps', 'Copasi'))
+        self.assertEqual(pipeline.get_job_timeout(job_options).get_limit(), 10.0)
+        job_options = pipeline.parse_job_options({'job_history': True, 'history_dir': self._history_dir})
+        self.assertIsNone(pipeline.get_job_timeout(job_options))
+        # the model cannot be read
+        self.assertIsNone(pipeline.get_job_history(job_options, os.path.join(self._dir, 'model.cps'), 'Copasi'))
+        model = os.path.join(self._dir, 'model.cps')
+        with open(model, 'w') as myfile:
+            myfile.write('model')
+        history = pipeline.get_job_history(job_options, model, 'Copasi')
+        self.assertTrue(history.get_file().startswith(self._history_dir))
+
+    def test_set_job_options(self):
+        sim = Pipeline.get_simul_obj('Python')
+        model = os.path.join(self._dir, 'model.py')
+        with open(model, 'w') as myfile:
+            myfile.write('model')
+        job_options = Pipeline.parse_job_options({'result_format': 'parquet', 'result_cache': True,
+                                                  'cache_dir': os.path.join(self._dir, 'cache'),
+                                                  'replicas_per_job': 2, 'job_history': True,
+                                                  'history_dir': self._history_dir, 'job_timeout': 10,
+                                                  'spool_output': True, 'cpus_per_job': 1, 'max_memory': 100})
+        Pipeline.set_job_options(sim, job_options, model, 'Python')
+        self.assertEqual(sim.get_result_format(), 'parquet')
+        self.assertEqual(sim.get_cache().get_cache_dir(), os.path.join(self._dir, 'cache'))
+        self.assertEqual(sim.get_replicas_per_job(), 2)
+        self.assertTrue(sim.get_job_history().get_file().startswith(self._history_dir))
+        self.assertEqual(sim.get_job_timeout().get_limit(), 10.0)
+        self.assertTrue(sim.get_spool_output())
+        self.assertEqual(sim.get_cpus_per_job(), 1)
+        self.assertEqual(sim.get_max_memory(), 100)
+        # the default options
+        Pipeline.set_job_options(sim, None, model, 'Python')
+        self.assertEqual(sim.get_result_format(), 'tsv')
+        self.assertIsNone(sim.get_cache())
+        self.assertIsNone(sim.get_job_history())
+        self.assertIsNone(sim.get_job_timeout())
+        self.assertFalse(sim.get_spool_output())
+
+    def test_corrupted_history(self):
+        history = JobHistory(self._history_dir, 'Sim:model.cps')
+        os.makedirs(self._history_dir)
+        with open(history.get_file(), 'w') as myfile:
+            myfile.write('{"durat')
+        self.assertIsNone(history.get_expected_durations(['1']))
+        history.update({'1': 1.0})
+        self.assertEqual(JobHistory(self._history_dir, 'Sim:model.cps').get_expected_durations(['1']), {'1': 1.0})
+
+    def test_scheduling(self):
+        self.assertEqual(order_longest_first(['1', '2', '3', '4'], {'1': 1, '2': 5, '3': 1, '4': 7}),
+                         ['4', '2', '1', '3'])
+        self.assertEqual(get_useful_parallelism([10, 1, 1, 1]), 2)
+        self.assertEqual(get_useful_parallelism([1, 1, 1, 1]), 4)
+        self.assertEqual(get_useful_parallelism([0, 0]), 2)
+        self.assertEqual(estimate_remaining_time([], 4), 0)
+        self.assertEqual(estimate_remaining_time([2, 2, 2, 2], 2), 4)
+        self.assertEqual(estimate_remaining_time([8, 1, 1], 4), 8)
+        # the terminated jobs took twice as long as expected
+        self.assertEqual(estimate_remaining_time([2, 2], 2, 3, 6), 4)
+
+    def test_run_jobs_local_history(self):
+        history = JobHistory(self._history_dir, 'Sim:analysis', replicas=False)
+        history.update({'1': 1.0, '2': 3.0, '3': 2.0})
+        out = os.path.join(self._dir, 'order.txt')
+        command = 'sh -c "echo ITER >> ' + out + '"'
+        jobs_file = os.path.join(self._dir, parcomp.JOBS_FILE)
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=3, local_cpus=1, jobs_file=jobs_file,
+                                               history=history))
+        with open(out) as myfile:
+            self.assertEqual(myfile.read().split(), ['2', '3', '1'])
+        # job ids are the run numbers
+        records = parcomp.read_job_records(jobs_file)
+        self.assertEqual([r['Command'] for r in records], [command.replace('ITER', str(i)) for i in range(1, 4)])
+        with open(history.get_file()) as myfile:
+            self.assertIn('"1": [1.0, ', myfile.read())
+
+    def test_run_funcs_local_history(self):
+        history = JobHistory(self._history_dir, 'Sim:model.py')
+        jobs_file = os.path.join(self._dir, parcomp.JOBS_FILE)
+        self.assertTrue(parcomp.run_funcs_local(sleep_for, [(0.01,), (0.01,)], jobs_file=jobs_file, history=history))
+        expected = JobHistory(self._history_dir, 'Sim:model.py').get_expected_durations(['1'])
+        self.assertTrue(expected['1'] >= 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
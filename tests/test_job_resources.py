@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.utils import parcomp
+from sbpipe.utils.job_resources import THREAD_ENV_VARS, JobResources, get_available_cpus
+
+
+def write_worker_resources(filename):
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else 0
+    with open(filename, 'w') as myfile:
+        myfile.write(os.environ['OMP_NUM_THREADS'] + ' ' + str(cpus))
+
+
+class TestJobResources(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def test_thread_env(self):
+        env = JobResources(2, cpus_per_job=3).get_env()
+        for var in THREAD_ENV_VARS:
+            self.assertEqual(env[var], '3')
+        self.assertEqual(env['PATH'], os.environ['PATH'])
+        # the available cpus are shared among the workers
+        self.assertEqual(JobResources(1).get_cpus_per_job(), len(get_available_cpus()))
+        self.assertEqual(JobResources(len(get_available_cpus()) + 1).get_cpus_per_job(), 1)
+        self.assertIsNone(JobResources(1).get_job_cpus())
+
+    def test_thread_env_user(self):
+        os.environ['OMP_NUM_THREADS'] = '7'
+        try:
+            # the limits set by the user are kept, unless the cpus of each job are set
+            self.assertEqual(JobResources(2).get_env()['OMP_NUM_THREADS'], '7')
+            self.assertEqual(JobResources(2, cpus_per_job=3).get_env()['OMP_NUM_THREADS'], '3')
+        finally:
+            del os.environ['OMP_NUM_THREADS']
+
+    def test_auto_resources(self):
+        # jobs are not pinned, as the automatic concurrency can run more jobs than cpus
+        resources = parcomp._get_job_resources(parcomp.AUTO_CPUS, 4 * len(get_available_cpus()), 1, True)
+        self.assertIsNone(resources.get_job_cpus())
+        self.assertEqual(resources.get_env()['MC_CORES'], '1')
+        self.assertEqual(parcomp._get_job_resources(2, 2, 1, False), JobResources(2, 1))
+        self.assertNotEqual(parcomp._get_job_resources(2, 2, 1, False), JobResources(2, 2))
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'), 'CPU pinning is not available')
+    def test_job_cpus(self):
+        cpus = JobResources(1, cpus_per_job=1, pin_cpus=True).get_job_cpus()
+        self.assertEqual(len(cpus), 1)
+        self.assertTrue(cpus.issubset(get_available_cpus()))
+
+    def test_run_jobs_local_threads(self):
+        command = 'sh -c "echo $OMP_NUM_THREADS $MC_CORES > ' + os.path.join(self._outputdir, 'job_ITER') + '"'
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=2, local_cpus=1, cpus_per_job=1))
+        for i in ['1', '2']:
+            with open(os.path.join(self._outputdir, 'job_' + i)) as myfile:
+                self.assertEqual(myfile.read(), '1 1\n')
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'), 'CPU pinning is not available')
+    def test_run_jobs_local_pin_cpus(self):
+        command = sys.executable + ' -c "import os, sys; ' \
+            'open(sys.argv[1], \'w\').write(str(len(os.sched_getaffinity(0))))" ' + \
+            os.path.join(self._outputdir, 'job_ITER')
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=2, local_cpus=1, cpus_per_job=1,
+                                               pin_cpus=True))
+        for i in ['1', '2']:
+            with open(os.path.join(self._outputdir, 'job_' + i)) as myfile:
+                self.assertEqual(myfile.read(), '1')
+
+    def test_run_funcs_local_resources(self):
+        args_list = [(os.path.join(self._outputdir, 'job_' + i),) for i in ['1', '2']]
+        pin_cpus = hasattr(os, 'sched_setaffinity')
+        # the function calls run with the thread limits and the cpus of their worker
+        self.assertTrue(parcomp.run_funcs_local(write_worker_resources, args_list, local_cpus=1, cpus_per_job=1,
+                                                pin_cpus=pin_cpus))
+        for i in ['1', '2']:
+            with open(os.path.join(self._outputdir, 'job_' + i)) as myfile:
+                self.assertEqual(myfile.read(), '1 1' if pin_cpus else '1 0')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
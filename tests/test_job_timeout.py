@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.pl_simul import PLSimul
+from sbpipe.utils import parcomp
+from sbpipe.utils.job_timeout import JobTimeout
+
+
+# A model writing one row of its report. The second replica hangs.
+HANGING_MODEL = """import sys
+import time
+with open(sys.argv[1], 'w') as report:
+    report.write('Time\\tX\\n0\\t1\\n')
+if sys.argv[1].endswith('2.csv'):
+    time.sleep(30)
+"""
+
+
+class TestJobTimeout(unittest.TestCase):
+
+    def setUp(self):
+        self._orig_wd = os.getcwd()
+        self._tmpdir = tempfile.mkdtemp()
+        os.chdir(self._tmpdir)
+
+    def tearDown(self):
+        os.chdir(self._orig_wd)
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_limit(self):
+        self.assertFalse(JobTimeout().is_set())
+        self.assertIsNone(JobTimeout().get_limit())
+        self.assertEqual(JobTimeout(timeout=10).get_limit(), 10)
+        self.assertRaises(ValueError, JobTimeout, -1)
+        timeout = JobTimeout(timeout=10, median_factor=3, min_samples=2)
+        with timeout.monitor():
+            timeout.add_duration(1.0)
+            self.assertEqual(timeout.get_limit(), 10)
+            timeout.add_duration(2.0)
+            self.assertEqual(timeout.get_limit(), 6)
+            timeout.add_duration(5.0)
+            self.assertEqual(timeout.get_limit(), 6)
+            timeout.add_duration(5.0)
+            self.assertEqual(timeout.get_limit(), 10)
+        self.assertEqual(timeout.get_limit(), 10)
+
+    def test_call_proc_timeout(self):
+        start = time.time()
+        id, out, err, record = parcomp.call_proc(('sleep 30', 2, JobTimeout(timeout=0.5, retries=1)))
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(record['TimedOut'], 1)
+        self.assertEqual(record['Attempts'], 2)
+        self.assertNotEqual(record['ExitStatus'], 0)
+        id, out, err, record = parcomp.call_proc(('true', 3, JobTimeout(timeout=10)))
+        self.assertEqual((record['ExitStatus'], record['TimedOut'], record['Attempts']), (0, 0, 1))
+
+    def test_run_jobs_local_median_timeout(self):
+        command = sys.executable + ' -c "import sys, time; time.sleep(30 if sys.argv[1] == \'4\' else 0)" ITER'
+        jobs_file = os.path.join(self._tmpdir, parcomp.JOBS_FILE)
+        start = time.time()
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=4, local_cpus=1, jobs_file=jobs_file,
+                                               timeout=JobTimeout(median_factor=5, retries=0)))
+        self.assertLess(time.time() - start, 10)
+        records = parcomp.read_job_records(jobs_file)
+        self.assertEqual([r['TimedOut'] for r in records], [0, 0, 0, 1])
+        self.assertEqual([r['ExitStatus'] == 0 for r in records], [True, True, True, False])
+
+    def test_timed_out_replicas(self):
+        with open(os.path.join(self._tmpdir, 'model.py'), 'w') as myfile:
+            myfile.write(HANGING_MODEL)
+        outputdir = os.path.join(self._tmpdir, 'sim_data')
+        os.makedirs(outputdir)
+        simul = PLSimul(lang=sys.executable, lang_err_msg='Python interpreter not found')
+        simul.set_job_timeout(JobTimeout(timeout=1, retries=0))
+        self.assertTrue(simul.sim('model.py', self._tmpdir, outputdir, 'local', 1, 3))
+        # the report of the hanging replica is removed, as this may be truncated
+        self.assertEqual(sorted(f for f in os.listdir(outputdir) if f.endswith('.csv')),
+                         ['model_1.csv', 'model_3.csv'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.utils import parcomp
+
+
+class TestParcompLocal(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def test_run_jobs_local(self):
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=4, local_cpus=2))
+        self.assertEqual(sorted(os.listdir(self._outputdir)), ['job_1', 'job_2', 'job_3', 'job_4'])
+
+    def test_run_jobs_local_colnames(self):
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', local_cpus=2, colnames=['A', 'B']))
+        self.assertEqual(sorted(os.listdir(self._outputdir)), ['job_A', 'job_B'])
+
+    def test_run_jobs_local_prepare_job(self):
+        prepared = []
+
+        def prepare_job(iter_id):
+            prepared.append(iter_id)
+            with open(os.path.join(self._outputdir, 'in_' + iter_id), 'w') as myfile:
+                myfile.write(iter_id)
+
+        command = 'cp ' + os.path.join(self._outputdir, 'in_ITER') + ' ' + os.path.join(self._outputdir, 'out_ITER')
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=3, local_cpus=2, prepare_job=prepare_job))
+        self.assertEqual(prepared, ['1', '2', '3'])
+        for i in ['1', '2', '3']:
+            self.assertTrue(os.path.isfile(os.path.join(self._outputdir, 'out_' + i)))
+
+    def test_run_jobs_local_prepare_job_lazily(self):
+        terminated = []
+
+        def prepare_job(iter_id):
+            # the number of jobs which had terminated when this job was prepared
+            terminated.append(len(os.listdir(self._outputdir)))
+
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=8, local_cpus=1, prepare_job=prepare_job))
+        # with one worker, at most PREFETCH_JOBS jobs are dispatched ahead of the terminated jobs
+        for i, count in enumerate(terminated):
+            self.assertTrue(count >= i - parcomp.PREFETCH_JOBS, str(terminated))
+
+    def test_local_pool_reuse(self):
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        with parcomp.local_pool():
+            parcomp.run_jobs_local(command, 'ITER', runs=2, local_cpus=1)
+            pool = parcomp._local_pool
+            self.assertIsNotNone(pool)
+            parcomp.run_jobs_local(command, 'ITER', runs=3, local_cpus=1)
+            self.assertIs(parcomp._local_pool, pool)
+        self.assertIsNone(parcomp._local_pool)
+        self.assertEqual(len(os.listdir(self._outputdir)), 3)
+
+    def test_call_proc_record(self):
+        id, out, err, record = parcomp.call_proc(('sh -c "echo failed >&2; exit 3"', 5))
+        self.assertEqual(id, 5)
+        self.assertEqual(record['Job'], 5)
+        self.assertEqual(record['ExitStatus'], 3)
+        self.assertEqual(record['Stderr'], 'failed')
+        self.assertTrue(record['WallTime'] >= 0)
+        self.assertTrue(record['End'] >= record['Start'])
+        if hasattr(os, 'wait4'):
+            self.assertTrue(record['MaxRSS'] > 0)
+            self.assertTrue(record['UserTime'] >= 0)
+
+    def test_run_jobs_local_records(self):
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        jobs_file = os.path.join(self._outputdir, parcomp.JOBS_FILE)
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=3, local_cpus=2, jobs_file=jobs_file))
+        records = parcomp.read_job_records(jobs_file)
+        self.assertEqual([r['Job'] for r in records], [1, 2, 3])
+        self.assertEqual([r['ExitStatus'] for r in records], [0, 0, 0])
+        self.assertEqual(records[1]['Command'], command.replace('ITER', '2'))
+        self.assertEqual(parcomp.summarise_job_records(records), [])
+
+    def test_run_jobs_local_replicas_per_job(self):
+        command = 'touch ' + os.path.join(self._outputdir, 'job_ITER')
+        jobs_file = os.path.join(self._outputdir, parcomp.JOBS_FILE)
+        prepared = []
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=5, local_cpus=2, prepare_job=prepared.append,
+                                               jobs_file=jobs_file, replicas_per_job=2))
+        self.assertEqual(prepared, ['1', '2', '3', '4', '5'])
+        self.assertEqual(sorted(os.listdir(self._outputdir)), ['job_' + str(i) for i in range(1, 6)] + ['jobs.tsv'])
+        records = parcomp.read_job_records(jobs_file)
+        self.assertEqual([r['Job'] for r in records], [1, 2, 3, 4, 5])
+        self.assertEqual(records[4]['Command'], command.replace('ITER', '5'))
+
+    def test_call_proc_spool(self):
+        os.makedirs(os.path.join(self._outputdir, 'out'))
+        os.makedirs(os.path.join(self._outputdir, 'err'))
+        command = sys.executable + ' -c "print(\'x\' * 10000); raise SystemExit(\'an error\')"'
+        id, out, err, record = parcomp.call_proc((command, 4, None, self._outputdir))
+        out_file, err_file = parcomp.get_spool_files(self._outputdir, 4)
+        self.assertEqual(out_file, os.path.join(self._outputdir, 'out', 'j4'))
+        # the spool files contain the whole output, while only its tail is kept in memory
+        self.assertEqual(os.path.getsize(out_file), 10001)
+        self.assertEqual(out, b'x' * (parcomp.SPOOL_TAIL_SIZE - 1) + b'\n')
+        with open(err_file, 'rb') as myfile:
+            self.assertEqual(myfile.read(), err)
+        self.assertEqual(record['ExitStatus'], 1)
+        self.assertEqual(record['Stderr'], 'an error')
+
+    def test_run_jobs_local_spool(self):
+        command = 'echo ITER'
+        self.assertTrue(parcomp.run_jobs_local(command, 'ITER', runs=3, local_cpus=2, spool_dir=self._outputdir))
+        for i in range(1, 4):
+            out_file, err_file = parcomp.get_spool_files(self._outputdir, i)
+            with open(out_file) as myfile:
+                self.assertEqual(myfile.read(), str(i) + '\n')
+            self.assertEqual(os.path.getsize(err_file), 0)
+
+    def test_job_array_records(self):
+        script = os.path.join(self._outputdir, 'jobs.sh')
+        command = 'sh -c "echo ITER; exit ITER"'
+        parcomp.write_job_array_script(command, 'ITER', ['0', '2'], 'TASK_ID', script, self._outputdir)
+        env = dict(os.environ)
+        env['TASK_ID'] = '2'
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        p = subprocess.Popen([script], stdout=subprocess.PIPE, env=env)
+        out = p.communicate()[0]
+        self.assertEqual(p.returncode, 2)
+        self.assertEqual(out.decode('utf-8'), '2\n')
+        # the first task did not run
+        jobs_file = os.path.join(self._outputdir, parcomp.JOBS_FILE)
+        records = parcomp.collect_job_records(self._outputdir, ['0', '2'], command, 'ITER', jobs_file)
+        self.assertEqual(parcomp.summarise_job_records(records), [1, 2])
+        records = parcomp.read_job_records(jobs_file)
+        self.assertEqual([r['ExitStatus'] for r in records], [None, 2])
+        self.assertEqual(records[0]['Command'], 'sh -c "echo 0; exit 0"')
+        self.assertFalse(os.path.exists(parcomp.get_job_record_file(self._outputdir, 2)))
+
+    def test_job_array_unrecorded(self):
+        script = os.path.join(self._outputdir, 'jobs.sh')
+        command = 'sh -c "echo ITER; exit ITER"'
+        executable = sys.executable
+        # a node without the interpreter running sbpipe runs the bare commands
+        sys.executable = os.path.join(self._outputdir, 'python')
+        try:
+            parcomp.write_job_array_script(command, 'ITER', ['1', '2', '3'], 'TASK_ID', script, self._outputdir,
+                                           replicas_per_job=2)
+        finally:
+            sys.executable = executable
+        env = dict(os.environ)
+        env['TASK_ID'] = '1'
+        p = subprocess.Popen([script], stdout=subprocess.PIPE, env=env)
+        out = p.communicate()[0]
+        self.assertEqual(p.returncode, 2)
+        self.assertEqual(out.decode('utf-8'), '1\n2\n')
+        self.assertFalse(os.path.exists(parcomp.get_job_record_file(self._outputdir, 1)))
+
+    def test_run_recorded_job(self):
+        record_file = os.path.join(self._outputdir, 'r1.tsv')
+        out_file = os.path.join(self._outputdir, 'out')
+        command = 'sh -c "echo out; echo err >&2; exit 3"'
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(out_file, 'w') as stdout:
+            p = subprocess.Popen([sys.executable, '-m', 'sbpipe.utils.run_job', record_file, '1', command],
+                                 stdout=stdout, stderr=subprocess.PIPE, env=env)
+            err = p.communicate()[1]
+        self.assertEqual(p.returncode, 3)
+        # the output of the job is written to the output file of the wrapper, not buffered
+        with open(out_file) as myfile:
+            self.assertEqual(myfile.read(), 'out\n')
+        self.assertEqual(err, b'err\n')
+        record = parcomp.read_job_records(record_file)[0]
+        self.assertEqual(record['ExitStatus'], 3)
+        self.assertEqual(record['Stderr'], 'err')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.utils import parcomp
+
+
+# Fake qsub: runs the tasks of an array job sequentially and reports their exit codes as `qsub -sync y`.
+FAKE_QSUB = r'''
+import os, subprocess, sys
+args = sys.argv[1:]
+opts = {}
+while args[0] in ('-cwd', '-V', '-sync', '-t', '-N', '-o', '-e', '-b'):
+    if args[0] in ('-cwd', '-V'):
+        args = args[1:]
+    else:
+        opts[args[0]] = args[1]
+        args = args[2:]
+first, last = [int(x) for x in opts['-t'].split('-')]
+print('Your job-array 42.' + opts['-t'] + ':1 ("' + opts['-N'] + '") has been submitted')
+for task in range(first, last + 1):
+    env = dict(os.environ, SGE_TASK_ID=str(task))
+    with open(opts['-o'].replace('$TASK_ID', str(task)), 'w') as out, \
+            open(opts['-e'].replace('$TASK_ID', str(task)), 'w') as err:
+        code = subprocess.call(args, stdout=out, stderr=err, env=env)
+    print('Job 42.' + str(task) + ' exited with exit code ' + str(code) + '.')
+'''
+
+# Fake bsub: runs the elements of a job array sequentially as `bsub -K` and stores their states.
+FAKE_BSUB = r'''
+import os, re, subprocess, sys
+args = sys.argv[1:]
+opts = {}
+while args[0] in ('-K', '-cwd', '-J', '-o', '-e'):
+    if args[0] == '-K':
+        args = args[1:]
+    else:
+        opts[args[0]] = args[1]
+        args = args[2:]
+name, first, last = re.match(r'(.*)\[(\d+)-(\d+)\]', opts['-J']).groups()
+job_id = str(os.getpid())
+print('Job <' + job_id + '> is submitted to default queue <normal>.')
+with open(os.path.join(os.environ['FAKE_LSF_DB'], job_id), 'w') as db:
+    for task in range(int(first), int(last) + 1):
+        env = dict(os.environ, LSB_JOBINDEX=str(task))
+        with open(opts['-o'].replace('%I', str(task)), 'w') as out, \
+                open(opts['-e'].replace('%I', str(task)), 'w') as err:
+            code = subprocess.call(args, stdout=out, stderr=err, env=env)
+        db.write(job_id + ' user ' + ('DONE' if code == 0 else 'EXIT') + ' normal host host ' +
+                 name + '[' + str(task) + '] Jan  1 10:00\n')
+'''
+
+# Fake bjobs: prints the states of the requested jobs.
+FAKE_BJOBS = r'''
+import os, sys
+print('JOBID USER STAT QUEUE FROM_HOST EXEC_HOST JOB_NAME SUBMIT_TIME')
+for job_id in sys.argv[3:]:
+    with open(os.path.join(os.environ['FAKE_LSF_DB'], job_id)) as db:
+        sys.stdout.write(db.read())
+'''
+
+
+class TestParcompCluster(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._bin = os.path.join(self._tmpdir, 'bin')
+        self._outputdir = os.path.join(self._tmpdir, 'output')
+        self._db = os.path.join(self._tmpdir, 'lsf_db')
+        for folder in [self._bin, self._outputdir, self._db]:
+            os.makedirs(folder)
+        for name, code in [('qsub', FAKE_QSUB), ('bsub', FAKE_BSUB), ('bjobs', FAKE_BJOBS)]:
+            with open(os.path.join(self._bin, name), 'w') as myfile:
+                myfile.write('#!' + sys.executable + '\n' + code)
+            os.chmod(os.path.join(self._bin, name), 0o755)
+        self._orig_path = os.environ['PATH']
+        os.environ['PATH'] = self._bin + os.pathsep + self._orig_path
+        os.environ['FAKE_LSF_DB'] = self._db
+        self._orig_max_job_array_size = parcomp.MAX_JOB_ARRAY_SIZE
+        parcomp.MAX_JOB_ARRAY_SIZE = 2
+
+    def tearDown(self):
+        os.environ['PATH'] = self._orig_path
+        del os.environ['FAKE_LSF_DB']
+        parcomp.MAX_JOB_ARRAY_SIZE = self._orig_max_job_array_size
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _run_parcomp(self, cluster, command, runs=1, colnames=[], replicas_per_job=1):
+        with self.assertLogs('sbpipe', level='DEBUG') as logs:
+            self.assertTrue(parcomp.parcomp(command, 'ITER', self._tmpdir, cluster, runs, colnames=colnames,
+                                            replicas_per_job=replicas_per_job))
+        return '\n'.join(logs.output)
+
+    def test_sge_job_array(self):
+        self._run_parcomp('sge', 'touch ' + os.path.join(self._outputdir, 'job_ITER'), runs=5)
+        self.assertEqual(sorted(os.listdir(self._outputdir)), ['job_' + str(i) for i in range(1, 6)])
+        self.assertTrue(os.path.isfile(os.path.join(self._tmpdir, 'out', 'j5')))
+
+    def test_lsf_job_array(self):
+        self._run_parcomp('lsf', 'touch ' + os.path.join(self._outputdir, 'job_ITER'), colnames=['A', 'B', 'C'])
+        self.assertEqual(sorted(os.listdir(self._outputdir)), ['job_A', 'job_B', 'job_C'])
+        self.assertTrue(os.path.isfile(os.path.join(self._tmpdir, 'err', 'j3')))
+
+    def test_sge_failed_jobs(self):
+        output = self._run_parcomp('sge', 'test ITER -ne 3', runs=4)
+        self.assertIn('1 of 4 jobs failed or did not terminate: 3', output)
+
+    def test_sge_failed_jobs_debug(self):
+        # the output of the failed job is inspected, not only the output of the first job
+        output = self._run_parcomp('sge', 'sh -c "test ITER -ne 3 || { echo error ITER >&2; exit 1; }"', runs=4)
+        self.assertIn('Found word `error` in standard error of job 3', output)
+        self.assertNotIn('standard error of job 1', output)
+
+    def test_lsf_failed_jobs(self):
+        output = self._run_parcomp('lsf', 'test ITER -gt 2', runs=3)
+        self.assertIn('2 of 3 jobs failed or did not terminate: 1, 2', output)
+
+    def test_sge_replicas_per_job(self):
+        output = self._run_parcomp('sge', 'touch ' + os.path.join(self._outputdir, 'job_ITER'), runs=5,
+                                   replicas_per_job=2)
+        self.assertIn('Submitting 3 jobs (5 replicas, 2 per job)', output)
+        self.assertEqual(sorted(os.listdir(self._outputdir)), ['job_' + str(i) for i in range(1, 6)])
+        self.assertEqual(sorted(os.listdir(os.path.join(self._tmpdir, 'out'))), ['j1', 'j2', 'j3', 'jITER.sh'])
+
+    def test_lsf_replicas_per_job_failed(self):
+        output = self._run_parcomp('lsf', 'test ITER -ne 3', runs=4, replicas_per_job=2)
+        self.assertIn('2 of 4 replicas were run by jobs which failed or did not terminate: 3, 4', output)
+        records = parcomp.read_job_records(os.path.join(self._tmpdir, parcomp.JOBS_FILE))
+        self.assertEqual([r['ExitStatus'] for r in records], [0, 0, 1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
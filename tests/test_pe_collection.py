@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.copasi.copasi import Copasi
+from sbpipe.simul.simul import Simul, read_fits
+
+# The reports read by counting_read_fits
+read_reports = []
+
+
+def counting_read_fits(filein):
+    read_reports.append(os.path.basename(filein))
+    return read_fits(filein)
+
+
+class CountingSimul(Simul):
+
+    def _get_fits_reader(self):
+        return counting_read_fits
+
+
+class TestPECollection(unittest.TestCase):
+
+    _inputdir = os.path.join(os.path.dirname(__file__), 'interrupted', 'Results',
+                             'interrupted_param_estim1__round_1', 'param_estim_data')
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def _read(self, filename):
+        with open(os.path.join(self._outputdir, filename)) as myfile:
+            return myfile.read()
+
+    def test_copasi_read_fits(self):
+        parameters, best_fit, all_fits = Copasi()._read_fits(
+            os.path.join(self._inputdir, 'interrupted_param_estim1_1.csv'))
+        self.assertEqual(parameters, ['Values[k1].InitialValue', 'Values[k2].InitialValue',
+                                      'Values[k3].InitialValue'])
+        self.assertEqual(best_fit, '172\t60.4991\t0.531562\t0.536032\t0.0706408\n')
+        self.assertEqual(len(all_fits), 11)
+        self.assertEqual(all_fits[0], '5929.31\t10\t0.0001\t10\n')
+
+    def test_copasi_get_fits(self):
+        copasi = Copasi()
+        copasi.get_best_fits(self._inputdir, self._outputdir, 'best_fits.csv')
+        copasi.get_all_fits(self._inputdir, self._outputdir, 'all_fits.csv')
+        for local_cpus in [1, 2]:
+            self.assertEqual(copasi.get_fits(self._inputdir, self._outputdir, 'final_estim_collection.csv',
+                                             'all_estim_collection.csv', local_cpus), 2)
+            self.assertEqual(self._read('final_estim_collection.csv'), self._read('best_fits.csv'))
+            self.assertEqual(self._read('all_estim_collection.csv'), self._read('all_fits.csv'))
+
+    def test_copasi_get_fits_incremental(self):
+        inputdir = os.path.join(self._outputdir, 'param_estim_data')
+        os.mkdir(inputdir)
+        shutil.copy(os.path.join(self._inputdir, 'interrupted_param_estim1_1.csv'), inputdir)
+        copasi = Copasi()
+        copasi.get_fits(inputdir, self._outputdir, 'final_estim_collection.csv', 'all_estim_collection.csv',
+                        incremental=True)
+        shutil.copy(os.path.join(self._inputdir, 'interrupted_param_estim1_2.csv'), inputdir)
+        self.assertEqual(copasi.get_fits(inputdir, self._outputdir, 'final_estim_collection.csv',
+                                         'all_estim_collection.csv', incremental=True), 2)
+        copasi.get_best_fits(self._inputdir, self._outputdir, 'best_fits.csv')
+        copasi.get_all_fits(self._inputdir, self._outputdir, 'all_fits.csv')
+        self.assertEqual(self._read('final_estim_collection.csv'), self._read('best_fits.csv'))
+        self.assertEqual(self._read('all_estim_collection.csv'), self._read('all_fits.csv'))
+        manifest = self._read('final_estim_collection_manifest.csv').splitlines()
+        self.assertEqual(len(manifest), 3)
+        self.assertTrue(manifest[2].startswith('interrupted_param_estim1_2.csv\t'))
+
+        # a rewritten report causes a complete collection
+        with open(os.path.join(inputdir, 'interrupted_param_estim1_1.csv'), 'a') as myfile:
+            myfile.write('\n')
+        copasi.get_fits(inputdir, self._outputdir, 'final_estim_collection.csv', 'all_estim_collection.csv',
+                        incremental=True)
+        self.assertEqual(self._read('final_estim_collection.csv'), self._read('best_fits.csv'))
+        self.assertEqual(self._read('all_estim_collection.csv'), self._read('all_fits.csv'))
+
+    def test_get_fits_read_once(self):
+        inputdir = os.path.join(self._outputdir, 'param_estim_data')
+        os.mkdir(inputdir)
+        for r in range(1, 4):
+            with open(os.path.join(inputdir, 'model_' + str(r) + '.csv'), 'w') as myfile:
+                myfile.write('ObjVal\tk 1\tk-2\n')
+                myfile.write(str(10 * r) + '\t1\t2\n' + str(r) + '\t3\t4\n')
+        del read_reports[:]
+        simul = CountingSimul()
+        self.assertEqual(simul.get_best_fits(inputdir, self._outputdir, 'best_fits.csv'), 3)
+        self.assertEqual(read_reports, ['model_1.csv', 'model_2.csv', 'model_3.csv'])
+        self.assertEqual(self._read('best_fits.csv').splitlines(),
+                         ['Estimation\tObjectiveValue\tk_1\tk_2', 'model_1.csv\t1\t3\t4',
+                          'model_2.csv\t2\t3\t4', 'model_3.csv\t3\t3\t4'])
+        del read_reports[:]
+        self.assertEqual(simul.get_all_fits(inputdir, self._outputdir, 'all_fits.csv'), 3)
+        self.assertEqual(len(read_reports), 3)
+        self.assertEqual(len(self._read('all_fits.csv').splitlines()), 7)
+        # a single collection has no manifest, so it is never resumed incrementally
+        self.assertFalse(os.path.exists(os.path.join(self._outputdir, 'best_fits_manifest.csv')))
+        self.assertFalse(os.path.exists(os.path.join(self._outputdir, 'all_fits_manifest.csv')))
+        # only the reading function and the report name are sent to the worker processes
+        self.assertTrue(len(pickle.dumps((Copasi()._get_fits_reader(), 'model_1.csv'))) < 200)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
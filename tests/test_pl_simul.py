@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.pl.pipeline import Pipeline
+from sbpipe.utils.job_timeout import JobTimeout
+from sbpipe.utils.parcomp import JOBS_FILE, local_pool, read_job_records
+from sbpipe.simul.java.java import Java
+from sbpipe.simul.octave.octave import Octave
+from sbpipe.simul.r.r import R
+
+
+# A fake runtime logging its arguments and writing a report to the last argument.
+FAKE_RUNTIME = """#!/bin/sh
+echo "$@" >> {log}
+for last; do true; done
+printf 'Time\\tX\\n0\\t1\\n' > "$last"
+"""
+
+# A fake runtime running the model with Python, ignoring the runtime options.
+PYTHON_RUNTIME = """#!/bin/sh
+shift
+exec {python} "$@"
+"""
+
+# A Python model implementing the resident protocol. Each start and exit of the model is logged.
+# If crash is True, the model terminates at the first request.
+RESIDENT_MODEL = """
+import json, os, sys
+crash = {crash}
+log_file = os.path.join(os.path.dirname(sys.argv[0]), 'starts.log')
+with open(log_file, 'a') as log:
+    log.write('start\\n')
+if sys.argv[-1] == '--sbpipe-serve':
+    for line in iter(sys.stdin.readline, ''):
+        if crash:
+            sys.exit('crashed')
+        request = json.loads(line)
+        print('simulating')
+        with open(request['report'], 'w') as report:
+            report.write('Time\\tX\\n0\\t' + str(request['seed']) + '\\n')
+        print(json.dumps({{'status': 0}}))
+        sys.stdout.flush()
+    with open(log_file, 'a') as log:
+        log.write('exit\\n')
+else:
+    with open(sys.argv[-1], 'w') as report:
+        report.write('Time\\tX\\n0\\t1\\n')
+"""
+
+
+class TestPLSimul(unittest.TestCase):
+
+    def setUp(self):
+        self._orig_wd = os.getcwd()
+        self._orig_path = os.environ['PATH']
+        self._tmpdir = tempfile.mkdtemp()
+        os.chdir(self._tmpdir)
+
+    def tearDown(self):
+        os.chdir(self._orig_wd)
+        os.environ['PATH'] = self._orig_path
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _write_fake_runtime(self, name, script=FAKE_RUNTIME):
+        bin_dir = os.path.join(self._tmpdir, 'bin')
+        os.makedirs(bin_dir)
+        runtime = os.path.join(bin_dir, name)
+        with open(runtime, 'w') as myfile:
+            myfile.write(script.format(log=os.path.join(self._tmpdir, 'calls.log'), python=sys.executable))
+        os.chmod(runtime, 0o755)
+        os.environ['PATH'] = bin_dir + os.pathsep + self._orig_path
+
+    def test_get_simul_obj(self):
+        for simulator, cls, options in [('R', R, '--vanilla'), ('Octave', Octave, '-q'), ('Java', Java, '-jar')]:
+            simul = Pipeline.get_simul_obj(simulator)
+            self.assertIsInstance(simul, cls)
+            self.assertEqual(simul.get_lang_options(), options)
+
+    def test_missing_runtime(self):
+        os.environ['PATH'] = self._tmpdir
+        simul = R()
+        self.assertIsNone(simul.get_lang())
+        self.assertFalse(simul.sim('model.r', self._tmpdir, self._tmpdir, 'local', 1, 1))
+
+    def test_sim_r(self):
+        self._write_fake_runtime('Rscript')
+        outputdir = os.path.join(self._tmpdir, 'sim_data')
+        os.makedirs(outputdir)
+        self.assertTrue(R().sim('model.r', self._tmpdir, outputdir, 'local', 1, 2))
+        self.assertEqual(sorted(f for f in os.listdir(outputdir) if f.endswith('.csv')),
+                         ['model_1.csv', 'model_2.csv'])
+        # the runtime is invoked once per replica, without any wrapper
+        with open(os.path.join(self._tmpdir, 'calls.log')) as myfile:
+            calls = [line.split() for line in myfile]
+        self.assertEqual(len(calls), 2)
+        for call in calls:
+            self.assertEqual(call[:2], ['--vanilla', os.path.join(self._tmpdir, 'model.r')])
+
+    def _run_resident_model(self, crash, resident_model=True):
+        self._write_fake_runtime('Rscript', PYTHON_RUNTIME)
+        with open(os.path.join(self._tmpdir, 'model.r'), 'w') as myfile:
+            myfile.write(RESIDENT_MODEL.format(crash=crash))
+        outputdir = os.path.join(self._tmpdir, 'sim_data')
+        os.makedirs(outputdir)
+        simul = R()
+        simul.set_resident_model(resident_model)
+        # the resident models are closed when the computation returns, even within a shared pool
+        with local_pool():
+            success = simul._run_par_comput('model.r', self._tmpdir, outputdir, 'local', 1, 3)
+            with open(os.path.join(self._tmpdir, 'starts.log')) as myfile:
+                starts = myfile.read().split()
+        return success, outputdir, starts, read_job_records(os.path.join(outputdir, JOBS_FILE))
+
+    def test_sim_resident_model(self):
+        success, outputdir, starts, records = self._run_resident_model(crash=False)
+        self.assertTrue(success)
+        self.assertEqual(sorted(f for f in os.listdir(outputdir) if f.endswith('.csv')),
+                         ['model_1.csv', 'model_2.csv', 'model_3.csv'])
+        # one model process served all the runs of the worker, and exited when the computation returned
+        self.assertEqual(starts, ['start', 'exit'])
+        self.assertEqual([r['ExitStatus'] for r in records], [0, 0, 0])
+
+    def test_sim_not_resident_model(self):
+        # the resident protocol must be requested explicitly
+        success, outputdir, starts, records = self._run_resident_model(crash=False, resident_model=False)
+        self.assertTrue(success)
+        self.assertEqual(starts, ['start', 'start', 'start'])
+
+    def test_sim_resident_model_crash(self):
+        success, outputdir, starts, records = self._run_resident_model(crash=True)
+        # no report was generated
+        self.assertFalse(success)
+        # the model is started again after each crash
+        self.assertEqual(starts, ['start', 'start', 'start'])
+        self.assertEqual([r['ExitStatus'] for r in records], [1, 1, 1])
+        self.assertTrue('crashed' in records[0]['Stderr'])
+
+    def test_sim_resident_model_options(self):
+        self._write_fake_runtime('Rscript', PYTHON_RUNTIME)
+        with open(os.path.join(self._tmpdir, 'model.r'), 'w') as myfile:
+            myfile.write(RESIDENT_MODEL.format(crash=False))
+        # job timeouts and spooled output cannot be applied to the runs of a resident model
+        for timeout, spool_output in [(JobTimeout(10), False), (None, True)]:
+            simul = R()
+            simul.set_resident_model(True)
+            simul.set_job_timeout(timeout)
+            simul.set_spool_output(spool_output)
+            self.assertFalse(simul._run_par_comput('model.r', self._tmpdir, self._tmpdir, 'local', 1, 3))
+        # the model was not started
+        self.assertFalse(os.path.exists(os.path.join(self._tmpdir, 'starts.log')))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
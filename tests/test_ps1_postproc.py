@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.simul import Simul
+from tests.benchmarks.reports import write_ps1_report
+
+
+class TestPS1Postproc(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def test_ps1_postproc_split(self):
+        write_ps1_report(os.path.join(self._outputdir, 'model_1.csv'), 5, 4)
+        Simul().ps1_postproc('model.cps', 'k1', 3, 4, self._outputdir)
+        for l in range(5):
+            with open(os.path.join(self._outputdir, 'model__rep_1__level_' + str(l * 10) + '.csv')) as myfile:
+                lines = myfile.readlines()
+            self.assertEqual(lines[0], 'Time\tA\tk1\n')
+            self.assertEqual(len(lines), 5)
+            self.assertTrue(all(line.split('\t')[2] == str(l * 10) for line in lines[1:]))
+        with open(os.path.join(self._outputdir, 'model_1.csv')) as myfile:
+            self.assertEqual(myfile.read(), 'Time\tA\tk1\n')
+
+    def test_ps1_postproc_no_separator(self):
+        write_ps1_report(os.path.join(self._outputdir, 'model_1.csv'), 3, 4, blank_sep=False)
+        Simul().ps1_postproc('model.cps', 'k1', 3, 2, self._outputdir)
+        with open(os.path.join(self._outputdir, 'model__rep_1__level_20.csv')) as myfile:
+            lines = myfile.readlines()
+        self.assertEqual(lines[0], 'Time\tA\tk1\n')
+        self.assertEqual(len(lines), 5)
+
+    def test_ps1_postproc_truncated(self):
+        write_ps1_report(os.path.join(self._outputdir, 'model_1.csv'), 2, 4)
+        self.assertEqual(Simul().ps1_split_report(os.path.join(self._outputdir, 'model_1.csv'),
+                                                  ['Time\t', 'A\t', 'k1'], 2, 4, 5,
+                                                  os.path.join(self._outputdir, 'model__rep_1__level_')), 2)
+        self.assertFalse(os.path.isfile(os.path.join(self._outputdir, 'model__rep_1__level_20.csv')))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.simul import Simul
+from sbpipe.pl.ps2 import parscan2 as parscan2_module
+from sbpipe.pl.ps2.parscan2 import ParScan2
+from sbpipe.utils.ps2_index import INDEXED_LAYOUT, read_ps2_index, read_ps2_timepoint, select_timepoints
+from tests.benchmarks.reports import write_ps2_report
+
+
+class TestPS2Postproc(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def test_ps2_postproc_split(self):
+        write_ps2_report(os.path.join(self._outputdir, 'model_1.csv'), 4, 5)
+        Simul().ps2_postproc('model.cps', 5, self._outputdir)
+        for t in range(6):
+            with open(os.path.join(self._outputdir, 'model__rep_1__tp_' + str(t) + '.csv')) as myfile:
+                lines = myfile.readlines()
+            self.assertEqual(lines[0], 'Time\tA\tk1\tk2\n')
+            self.assertEqual([line.split('\t')[3] for line in lines[1:]], ['0', '1', '2', '3'])
+            self.assertTrue(all(line.split('\t')[0] == str(t) for line in lines[1:]))
+        # empty lines are removed from the report
+        with open(os.path.join(self._outputdir, 'model_1.csv')) as myfile:
+            self.assertFalse(any(line.isspace() for line in myfile))
+
+    def test_ps2_split_report_buffer(self):
+        report = os.path.join(self._outputdir, 'model_1.csv')
+        write_ps2_report(report, 3, 4)
+        simul = Simul()
+        filesout = simul.ps2_split_report(report, 6, os.path.join(self._outputdir, 'small__tp_'), buffer_size=1)
+        self.assertEqual(len(filesout), 7)
+        write_ps2_report(report, 3, 4)
+        simul.ps2_split_report(report, 6, os.path.join(self._outputdir, 'large__tp_'))
+        for t in range(7):
+            with open(os.path.join(self._outputdir, 'small__tp_' + str(t) + '.csv')) as small, \
+                    open(os.path.join(self._outputdir, 'large__tp_' + str(t) + '.csv')) as large:
+                self.assertEqual(small.read(), large.read())
+        # time points exceeding the simulation length only contain the header
+        with open(os.path.join(self._outputdir, 'small__tp_6.csv')) as myfile:
+            self.assertEqual(myfile.read(), 'Time\tA\tk1\tk2\n')
+
+    def test_ps2_index_report(self):
+        report = os.path.join(self._outputdir, 'model_1.csv')
+        write_ps2_report(report, 3, 4)
+        simul = Simul()
+        simul.ps2_split_report(report, 4, os.path.join(self._outputdir, 'split__tp_'))
+        # small buffers store each time point in more than one block
+        index_file = simul.ps2_index_report(report, 4, os.path.join(self._outputdir, 'model__rep_1.csv'),
+                                            buffer_size=50)
+        self.assertEqual(index_file, os.path.join(self._outputdir, 'model__rep_1.idx'))
+        index = read_ps2_index(index_file)
+        self.assertEqual(sorted(index), [0, 1, 2, 3, 4])
+        self.assertTrue(any(len(blocks) > 1 for blocks in index.values()))
+        extracted = ParScan2.extract_timepoints('model', self._outputdir, self._outputdir, [0, 4])
+        self.assertEqual([os.path.basename(f) for f in extracted], ['model__rep_1__tp_0.csv', 'model__rep_1__tp_4.csv'])
+        for t in [0, 4]:
+            with open(os.path.join(self._outputdir, 'split__tp_' + str(t) + '.csv')) as split, \
+                    open(os.path.join(self._outputdir, 'model__rep_1__tp_' + str(t) + '.csv')) as extract:
+                self.assertEqual(split.read(), extract.read())
+        columns, rows = read_ps2_timepoint(os.path.join(self._outputdir, 'model__rep_1.csv'), 2)
+        self.assertEqual(columns, ['Time', 'A', 'k1', 'k2'])
+        self.assertEqual([row[0] for row in rows], [2.0, 2.0, 2.0])
+        self.assertEqual([row[3] for row in rows], [0.0, 1.0, 2.0])
+
+    def test_select_timepoints(self):
+        self.assertEqual(select_timepoints(range(5)), [0, 1, 2, 3, 4])
+        self.assertEqual(select_timepoints(range(1001)), [0, 111, 222, 333, 444, 555, 666, 777, 888, 1000])
+        self.assertEqual(select_timepoints(range(101), 3), [0, 50, 100])
+
+    def test_extract_timepoints_default(self):
+        # without selected time points, a bounded number of time points is extracted
+        write_ps2_report(os.path.join(self._outputdir, 'model_1.csv'), 3, 30)
+        Simul().ps2_index_report(os.path.join(self._outputdir, 'model_1.csv'), 30,
+                                 os.path.join(self._outputdir, 'model__rep_1.csv'))
+        datadir = os.path.join(self._outputdir, 'data')
+        os.mkdir(datadir)
+        extracted = ParScan2.extract_timepoints('model', self._outputdir, datadir)
+        self.assertEqual([os.path.basename(f) for f in extracted],
+                         ['model__rep_1__tp_' + str(tp) + '.csv' for tp in select_timepoints(range(31))])
+
+    def test_analyse_data_indexed_cleanup(self):
+        # the extracted time points are removed if the analysis fails
+        write_ps2_report(os.path.join(self._outputdir, 'model_1.csv'), 3, 4)
+        Simul().ps2_index_report(os.path.join(self._outputdir, 'model_1.csv'), 4,
+                                 os.path.join(self._outputdir, 'model__rep_1.csv'))
+        before = sorted(os.listdir(self._outputdir))
+
+        def failing_parcomp(*args, **kwargs):
+            raise RuntimeError('analysis failed')
+
+        is_r_package_installed = parscan2_module.is_r_package_installed
+        parcomp = parscan2_module.parcomp
+        parscan2_module.is_r_package_installed = lambda name: True
+        parscan2_module.parcomp = failing_parcomp
+        try:
+            self.assertRaises(RuntimeError, ParScan2.analyse_data, 'model', 'k1', 'k2', self._outputdir,
+                              os.path.join(self._outputdir, 'analysis'), ps2_layout=INDEXED_LAYOUT)
+        finally:
+            parscan2_module.is_r_package_installed = is_r_package_installed
+            parscan2_module.parcomp = parcomp
+        self.assertEqual(sorted(f for f in os.listdir(self._outputdir) if f != 'analysis'), before)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
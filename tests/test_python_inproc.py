@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.python.python import Python
+from sbpipe.utils.job_timeout import JobTimeout
+from sbpipe.utils.parcomp import JOBS_FILE, read_job_records
+from sbpipe.simul.python.python import has_entry_function
+
+
+# A model counting the calls of sbpipe_simulate within the same process.
+MODULE_MODEL = '''
+import os
+calls = []
+
+def sbpipe_simulate(report_filename, seed):
+    calls.append(seed)
+    with open(report_filename, 'w') as report:
+        report.write('Time\\tcalls\\tpid\\n0\\t' + str(len(calls)) + '\\t' + str(os.getpid()) + '\\n')
+'''
+
+# A model which hangs. This is also run as a script.
+SLEEPING_MODEL = '''
+import sys
+import time
+
+def sbpipe_simulate(report_filename, seed):
+    time.sleep(60)
+    def test_module_model_timeout(self):
+        simulator = Python()
+        simulator.set_job_timeout(JobTimeout(1, 0, 0))
+        start = time.time()
+        # the runs are killed instead of hanging the worker processes
+        self.assertFalse(simulator.sim('sleeping_model.py', self._inputdir, self._outputdir, 'local', 2, 2))
+        self.assertTrue(time.time() - start < 30)
+        records = read_job_records(os.path.join(self._outputdir, JOBS_FILE))
+        self.assertEqual([r['TimedOut'] for r in records], [True, True])
+
+
+if __name__ == '__main__':
+    sbpipe_simulate(sys.argv[1], None)
+'''
+
+# A model run as a script
+SCRIPT_MODEL = '''
+import sys
+with open(sys.argv[1], 'w') as report:
+    report.write('Time\\tX\\n0\\t1\\n')
+'''
+
+
+class TestPythonInProcess(unittest.TestCase):
+
+    _orig_wd = os.getcwd()
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self._inputdir = os.path.join(self._tmpdir, 'Models')
+        self._outputdir = os.path.join(self._tmpdir, 'sim_data')
+        os.makedirs(self._inputdir)
+        os.makedirs(self._outputdir)
+        for name, code in [('module_model.py', MODULE_MODEL), ('script_model.py', SCRIPT_MODEL),
+                           ('sleeping_model.py', SLEEPING_MODEL)]:
+            with open(os.path.join(self._inputdir, name), 'w') as myfile:
+                myfile.write(code)
+        os.chdir(self._tmpdir)
+
+    def tearDown(self):
+        os.chdir(self._orig_wd)
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_has_entry_function(self):
+        self.assertTrue(has_entry_function(os.path.join(self._inputdir, 'module_model.py')))
+        self.assertFalse(has_entry_function(os.path.join(self._inputdir, 'script_model.py')))
+
+    def test_module_model(self):
+        self.assertTrue(Python().sim('module_model.py', self._inputdir, self._outputdir, 'local', 1, 3))
+        calls = []
+        for i in range(1, 4):
+            with open(os.path.join(self._outputdir, 'module_model_' + str(i) + '.csv')) as report:
+                calls.append(report.readlines()[1].split('\t')[1])
+        # the model is imported once by the only worker process
+        self.assertEqual(sorted(calls), ['1', '2', '3'])
+
+    def test_script_model(self):
+        self.assertTrue(Python().sim('script_model.py', self._inputdir, self._outputdir, 'local', 2, 2))
+        self.assertEqual(sorted(os.listdir(self._outputdir)), ['jobs.tsv', 'script_model_1.csv', 'script_model_2.csv'])
+
+    def test_module_model_timeout(self):
+        simulator = Python()
+        simulator.set_job_timeout(JobTimeout(1, 0, 0))
+        start = time.time()
+        # the runs are killed instead of hanging the worker processes
+        self.assertFalse(simulator.sim('sleeping_model.py', self._inputdir, self._outputdir, 'local', 2, 2))
+        self.assertTrue(time.time() - start < 30)
+        records = read_job_records(os.path.join(self._outputdir, JOBS_FILE))
+        self.assertEqual([r['TimedOut'] for r in records], [True, True])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -62,5 +62,12 @@ class TestPythonSim(unittest.TestCase):
             sys.stdout.write(self._output)
             sys.stdout.flush()
 
+    def test_sim_python_module_ir(self):
+        if self._output == 'OK':
+            self.assertEqual(sbpipe(simulate="insulin_receptor_module.yaml", quiet=True), 0)
+        else:
+            sys.stdout.write(self._output)
+            sys.stdout.flush()
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
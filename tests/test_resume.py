@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.simul.simul import Simul
+from sbpipe.simul.copasi.copasi import Copasi
+
+
+class ReportSimul(Simul):
+    """
+    A simulator writing one report per replica, recording the simulated replicas.
+    """
+
+    def __init__(self):
+        Simul.__init__(self)
+        self.simulated = []
+
+    def _run_par_comput(self, model, inputdir, outputdir, cluster="local", local_cpus=1, runs=1, output_msg=False,
+                        iter_ids=None):
+        for iter_id in iter_ids:
+            with open(os.path.join(outputdir, 'model_' + iter_id + '.csv'), 'w') as report:
+                report.write('Time\tA\n0\t' + iter_id + '\n')
+        self.simulated.extend(iter_ids)
+        return True
+
+
+class TestResume(unittest.TestCase):
+
+    _interrupted = os.path.join(os.path.dirname(__file__), 'interrupted', 'Results')
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def test_copasi_fits_report_complete(self):
+        copasi = Copasi()
+        # interrupted while estimating
+        report = os.path.join(self._interrupted, 'interrupted_param_estim1__round_1', 'param_estim_data',
+                              'interrupted_param_estim1_1.csv')
+        self.assertFalse(copasi.is_fits_report_complete(report))
+        # interrupted before the first estimate
+        self.assertFalse(copasi.is_fits_report_complete(
+            os.path.join(self._interrupted, 'interrupted_param_estim2__round_1', 'param_estim_data',
+                         'interrupted_param_estim2_1.csv')))
+        complete = os.path.join(self._dir, 'model_1.csv')
+        shutil.copyfile(report, complete)
+        with open(complete, 'a') as myfile:
+            myfile.write('\n\n')
+        self.assertTrue(copasi.is_fits_report_complete(complete))
+        self.assertFalse(copasi.is_fits_report_complete(os.path.join(self._dir, 'model_2.csv')))
+
+    def test_report_complete(self):
+        simul = Simul()
+        report = os.path.join(self._dir, 'model_1.csv')
+        with open(report, 'w') as myfile:
+            myfile.write('Time\tA\n0\t1\n1\t2')
+        self.assertFalse(simul.is_report_complete(report))
+        with open(report, 'w') as myfile:
+            myfile.write('Time\tA\n')
+        self.assertFalse(simul.is_report_complete(report))
+        with open(report, 'w') as myfile:
+            myfile.write('Time\tA\n0\t1\n1\t2\n')
+        self.assertTrue(simul.is_report_complete(report))
+
+    def test_resume_replicas(self):
+        with open(os.path.join(self._dir, 'model_1.csv'), 'w') as report:
+            report.write('Time\tA\n0\t1\n')
+        # truncated
+        with open(os.path.join(self._dir, 'model_2.csv'), 'w') as report:
+            report.write('Time\tA\n0\t')
+        simul = ReportSimul()
+        simul.set_resume(True)
+        self.assertTrue(simul._run_replicas('model.txt', self._dir, self._dir, runs=3))
+        self.assertEqual(simul.simulated, ['2', '3'])
+        for i in range(1, 4):
+            with open(os.path.join(self._dir, 'model_' + str(i) + '.csv')) as report:
+                self.assertEqual(report.read(), 'Time\tA\n0\t' + str(i) + '\n')
+        # all the replicas are complete
+        simul = ReportSimul()
+        simul.set_resume(True)
+        self.assertTrue(simul._run_replicas('model.txt', self._dir, self._dir, runs=3))
+        self.assertEqual(simul.simulated, [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
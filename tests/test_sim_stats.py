@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.pl.sim import sim as sim_module
+from sbpipe.pl.sim.sim import Sim
+from sbpipe.simul.simul import Simul
+from sbpipe.utils.dependencies import is_r_package_installed
+
+try:
+    import numpy
+    import scipy
+    stats_libs = True
+except ImportError:
+    stats_libs = False
+
+try:
+    import pandas
+    import pyarrow
+    columnar_libs = True
+except ImportError:
+    columnar_libs = False
+
+
+@unittest.skipUnless(stats_libs, 'Python numpy or scipy not found')
+class TestSimStats(unittest.TestCase):
+
+    def setUp(self):
+        self._outputdir = tempfile.mkdtemp()
+        self._inputdir = os.path.join(self._outputdir, 'sim_data')
+        os.mkdir(self._inputdir)
+        # 3 replicas, 4 time points, 2 variables. Copasi rows end with a tab.
+        for r in range(1, 4):
+            with open(os.path.join(self._inputdir, 'model_' + str(r) + '.csv'), 'w') as myfile:
+                myfile.write('Time\tA\tB\n')
+                for t in range(4):
+                    myfile.write(str(t) + '\t' + str(t * r) + '\t' + str(10 - r) + '\t\n')
+
+    def tearDown(self):
+        shutil.rmtree(self._outputdir, ignore_errors=True)
+
+    def _read(self, filename):
+        with open(filename) as myfile:
+            return [[x.strip('"') for x in line.rstrip('\n').split('\t')] for line in myfile]
+
+    def _analyse_data_numpy(self, sbpiper=True):
+        # sbpiper is replaced by a command writing a plot
+        commands = []
+
+        def plot_parcomp(cmd, cmd_iter_substr, output_dir, cluster='local', runs=1, local_cpus=1,
+                         output_msg=False):
+            commands.append(cmd)
+            open(os.path.join(self._outputdir, 'sim_plots', 'model_A.pdf'), 'w').close()
+            return True
+
+        is_r_package_installed = sim_module.is_r_package_installed
+        parcomp = sim_module.parcomp
+        sim_module.is_r_package_installed = lambda name: sbpiper
+        sim_module.parcomp = plot_parcomp
+        try:
+            success = Sim.analyse_data('Copasi', 'model', self._inputdir, self._outputdir,
+                                       os.path.join(self._outputdir, 'sim_plots'), '', False,
+                                       stats_backend='numpy')
+        finally:
+            sim_module.is_r_package_installed = is_r_package_installed
+            sim_module.parcomp = parcomp
+        return success, commands
+
+    def test_analyse_data_numpy(self):
+        success, commands = self._analyse_data_numpy()
+        self.assertTrue(success)
+        # one R process plots all the variables from the tables by variable, without computing statistics
+        self.assertEqual(len(commands), 1)
+        self.assertIn(os.path.join(self._outputdir, 'simulate_data_by_var_numpy'), commands[0])
+        self.assertIn('for(column in c(\"A\", \"B\"))', commands[0])
+        self.assertIn('plot_sep_sims(', commands[0])
+        self.assertIn('plot_comb_sims(', commands[0])
+        self.assertNotIn('sbpiper_sim(', commands[0])
+        # sbpiper's tables are not overwritten
+        self.assertFalse(os.path.exists(os.path.join(self._outputdir, 'sim_stats_model_A.csv')))
+        self.assertEqual(os.listdir(os.path.join(self._outputdir, 'simulate_data_by_var')), [])
+        stats = self._read(os.path.join(self._outputdir, 'sim_stats_numpy_model_A.csv'))
+        self.assertEqual(stats[0][:4], ['Time', 'A_Mean', 'A_StdDev', 'A_Variance'])
+        self.assertEqual(len(stats), 5)
+        # A at time 2 is 2, 4, 6
+        self.assertEqual([float(x) for x in stats[3][:4]], [2.0, 4.0, 2.0, 4.0])
+        self.assertEqual(float(stats[3][stats[0].index('A_Median')]), 4.0)
+        stats = self._read(os.path.join(self._outputdir, 'sim_stats_numpy_model_B.csv'))
+        self.assertEqual(float(stats[1][stats[0].index('B_Minimum')]), 7.0)
+        by_var = self._read(os.path.join(self._outputdir, 'simulate_data_by_var_numpy', 'model_B.csv'))
+        self.assertEqual(by_var[0], ['Time', 'model_1', 'model_2', 'model_3'])
+        self.assertEqual([float(x) for x in by_var[4]], [3.0, 9.0, 8.0, 7.0])
+
+    @unittest.skipUnless(columnar_libs, 'Python pandas or pyarrow not found')
+    def test_analyse_data_numpy_collection(self):
+        simul = Simul()
+        simul.set_result_format('parquet')
+        simul.sim_postproc('model.cps', self._inputdir)
+        # the replicas are read from the collection, not from the reports
+        os.remove(os.path.join(self._inputdir, 'model_2.csv'))
+        self.assertTrue(self._analyse_data_numpy()[0])
+        by_var = self._read(os.path.join(self._outputdir, 'simulate_data_by_var_numpy', 'model_B.csv'))
+        self.assertEqual(by_var[0], ['Time', 'model_1', 'model_2', 'model_3'])
+        self.assertEqual([float(x) for x in by_var[4]], [3.0, 9.0, 8.0, 7.0])
+
+    def test_analyse_data_numpy_no_sbpiper(self):
+        # the plots require sbpiper
+        success, commands = self._analyse_data_numpy(sbpiper=False)
+        self.assertFalse(success)
+        self.assertEqual(commands, [])
+
+    @unittest.skipUnless(is_r_package_installed('sbpiper'), 'R package sbpiper not found')
+    def test_analyse_data_numpy_vs_r(self):
+        for backend in ['r', 'numpy']:
+            self.assertTrue(Sim.analyse_data('Copasi', 'model', self._inputdir, self._outputdir,
+                                             os.path.join(self._outputdir, 'sim_plots'), '', False,
+                                             stats_backend=backend))
+        for column in ['A', 'B']:
+            r_by_var = self._read(os.path.join(self._outputdir, 'simulate_data_by_var', 'model_' + column + '.csv'))
+            np_by_var = self._read(os.path.join(self._outputdir, 'simulate_data_by_var_numpy',
+                                                'model_' + column + '.csv'))
+            self.assertEqual(len(r_by_var[0]), len(np_by_var[0]))
+            self.assertEqual([[float(x) for x in row] for row in r_by_var[1:]],
+                             [[float(x) for x in row] for row in np_by_var[1:]])
+            r_stats = self._read(os.path.join(self._outputdir, 'sim_stats_model_' + column + '.csv'))
+            np_stats = self._read(os.path.join(self._outputdir, 'sim_stats_numpy_model_' + column + '.csv'))
+            self.assertEqual(len(r_stats), len(np_stats))
+            # the statistics named as in sbpiper have the same values
+            shared = [name for name in np_stats[0] if name in r_stats[0]]
+            self.assertIn('Time', shared)
+            for name in shared:
+                r_values = [float(row[r_stats[0].index(name)]) for row in r_stats[1:]]
+                np_values = [float(row[np_stats[0].index(name)]) for row in np_stats[1:]]
+                for r_value, np_value in zip(r_values, np_values):
+                    self.assertAlmostEqual(r_value, np_value, places=6, msg=name)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Piero Dalle Pezze
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from tests.context import sbpipe
+from sbpipe.utils import parcomp
+from sbpipe.utils.tracing import start_tracing, stop_tracing, get_tracer, span, traced, add_job_events
+
+
+@traced()
+def traced_function(x):
+    return x + 1
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        stop_tracing()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def test_tracing_disabled(self):
+        self.assertIsNone(get_tracer())
+        with span('stage'):
+            self.assertEqual(traced_function(1), 2)
+        self.assertIsNone(stop_tracing())
+
+    def test_spans(self):
+        tracer = start_tracing()
+        with span('stage', model='model.cps'):
+            traced_function(1)
+            traced_function(2)
+        self.assertIs(stop_tracing(), tracer)
+        events = tracer.get_events()
+        self.assertEqual([e['name'] for e in events if e['name'] == 'stage'], ['stage'])
+        stage = events[0]
+        self.assertEqual(stage['args'], {'model': 'model.cps'})
+        calls = [e for e in events if e['name'] == 'test_tracing.traced_function']
+        self.assertEqual(len(calls), 2)
+        # nested spans are within their parent
+        for call in calls:
+            self.assertTrue(stage['ts'] <= call['ts'] and call['ts'] + call['dur'] <= stage['ts'] + stage['dur'])
+        summary = tracer.get_summary()
+        self.assertEqual(summary[0][0:2], ('stage', 1))
+        self.assertEqual(summary[1][0:2], ('test_tracing.traced_function', 2))
+        table = tracer.format_summary().splitlines()
+        self.assertEqual(len(table), 3)
+        self.assertTrue(table[0].startswith('Span'))
+
+    def test_chrome_trace(self):
+        tracer = start_tracing()
+        add_job_events('CopasiSE', [{'Job': 1, 'Start': 10.0, 'End': 12.0, 'ExitStatus': 0, 'MaxRSS': 100},
+                                    {'Job': 2, 'Start': 11.0, 'End': 13.0, 'ExitStatus': 0, 'MaxRSS': 100},
+                                    {'Job': 3, 'Start': 12.0, 'End': 13.0, 'ExitStatus': 1, 'MaxRSS': 100},
+                                    {'Job': 4, 'Start': None, 'End': None, 'ExitStatus': None, 'MaxRSS': None}])
+        trace = os.path.join(self._dir, 'trace.json')
+        tracer.write_chrome_trace(trace)
+        with open(trace) as myfile:
+            events = json.load(myfile)['traceEvents']
+        # overlapping jobs are shown in separate lanes. Jobs which did not terminate are not shown.
+        self.assertEqual([(e['args']['job'], e['tid']) for e in events], [(1, 'job 1'), (2, 'job 2'), (3, 'job 1')])
+        self.assertEqual([(e['ph'], e['ts'], e['dur']) for e in events],
+                         [('X', 10000000, 2000000), ('X', 11000000, 2000000), ('X', 12000000, 1000000)])
+
+    def test_parcomp_trace(self):
+        tracer = start_tracing()
+        prepared = []
+        self.assertTrue(parcomp.parcomp('touch ' + os.path.join(self._dir, 'job_ITER'), 'ITER', self._dir,
+                                        runs=2, local_cpus=1, prepare_job=prepared.append))
+        names = [e['name'] for e in tracer.get_events()]
+        self.assertEqual(prepared, ['1', '2'])
+        self.assertEqual(sorted(names), ['parcomp', 'parcomp.prepare_job', 'parcomp.prepare_job', 'touch', 'touch'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)